@@ -0,0 +1,953 @@
+# -*- coding: utf-8 -*-
+# FlashGBX
+# Author: Lesserkuma (github.com/lesserkuma)
+
+import os, threading, time, struct, select, math, random, bisect, argparse
+from .hw_GBxCartRW import GbxDevice
+from .RomFileDMG import RomFileDMG
+from .RomFileAGB import RomFileAGB
+from .Util import dprint
+from . import Util
+
+# Flash chip presets: command set, flash ID words, size, erase regions [sector size, count],
+# write buffer size and typical timings [single write µs, buffer write µs, sector erase ms, chip erase ms]
+FLASH_CHIPS = {
+	"MSP55LV128M":{ "command_set":"AMD", "flash_id":[ 0x0002, 0x227D ], "size":0x1000000, "sectors":[ [0x20000, 128] ], "buffer_size":64, "timing":[ 16, 128, 512, 65536 ] },
+	"MX29LV640":{ "command_set":"AMD", "flash_id":[ 0x00C2, 0x00CB ], "size":0x800000, "sectors":[ [0x2000, 8], [0x10000, 127] ], "buffer_size":0, "timing":[ 16, 0, 512, 32768 ] },
+	"M36L0R705":{ "command_set":"INTEL", "flash_id":[ 0x0020, 0x88C4 ], "size":0x1000000, "sectors":[ [0x20000, 128] ], "buffer_size":64, "timing":[ 16, 256, 1024, 0 ] },
+	"LH28F320BJE":{ "command_set":"SHARP", "flash_id":[ 0x00B0, 0x00E2 ], "size":0x1000000, "sectors":[ [0x10000, 63], [0x2000, 8] ] * 4, "buffer_size":0, "timing":[ 16, 0, 512, 32768 ], "partition_size":0x400000 },
+}
+
+AGB_SAVE_TYPES = { "none":None, "eeprom4k":("EEPROM", 512), "eeprom64k":("EEPROM", 8192), "sram256k":("SRAM", 32768), "sram512k":("SRAM", 65536), "sram1m":("SRAM", 131072), "flash512k":("FLASH", 65536), "flash1m":("FLASH", 131072) }
+AGB_SAVE_FLASH_IDS = { 65536:0xBFD4, 131072:0xC209 }
+
+def read_wrapped(data, offset, length):
+	size = len(data)
+	offset %= size
+	if offset + length <= size:
+		return data[offset:offset+length]
+	buffer = bytearray()
+	while length > 0:
+		chunk = min(length, size - offset)
+		buffer += data[offset:offset+chunk]
+		length -= chunk
+		offset = 0
+	return buffer
+
+def make_test_rom(mode, size, mbc=0x1B, ram_size=0x8000):
+	# Random ROM contents with a consistent header; the logo area is left blank
+	rom = bytearray(random.Random(size).getrandbits(size * 8).to_bytes(size, "little"))
+	if mode == "DMG":
+		rom[0x104:0x134] = bytearray(0x30)
+		rom[0x134:0x144] = b"FLASHGBX EMU".ljust(16, b"\x00")
+		rom[0x144:0x147] = b"\x00\x00\x00"
+		rom[0x147] = mbc
+		rom[0x148] = int(math.log2(size // 0x8000))
+		rom[0x149] = Util.DMG_Header_RAM_Sizes_Map[Util.DMG_Header_RAM_Sizes_Flasher_Map.index(ram_size)]
+		rom[0x14A:0x14D] = b"\x01\x00\x00"
+		RomFileDMG(rom).CalcChecksumHeader(True)
+		rom[0x14E:0x150] = b"\x00\x00"
+		rom[0x14E:0x150] = struct.pack(">H", sum(rom) & 0xFFFF)
+	elif mode == "AGB":
+		rom[0x04:0xA0] = bytearray(0x9C)
+		rom[0xA0:0xB2] = b"FLASHGBX EMU" + b"AEMU" + b"01"
+		rom[0xB2:0xBD] = b"\x96" + bytearray(10)
+		rom[0:0x200] = RomFileAGB(rom).FixHeader()
+	return rom
+
+class MaskROM:
+	def __init__(self, data):
+		self.DATA = data
+
+	def Read(self, address, length):
+		return read_wrapped(self.DATA, address, length)
+
+	def Write(self, address, value):
+		pass
+
+	def Program(self, address, data, buffered=False):
+		return 0
+
+class FlashChip:
+	STATE_IDLE = 0
+	MODE_READ = "read"
+	MODE_ID = "id"
+	MODE_CFI = "cfi"
+	MODE_STATUS = "status"
+
+	def __init__(self, preset, data=None, byte_mode=False, we="AUDIO", time_scale=1.0):
+		self.NAME = preset
+		config = FLASH_CHIPS[preset]
+		self.COMMAND_SET = config["command_set"]
+		self.FLASH_ID = config["flash_id"]
+		self.SIZE = config["size"]
+		self.SECTORS = config["sectors"]
+		self.BUFFER_SIZE = config["buffer_size"]
+		self.TIMING = config["timing"]
+		self.PARTITION_SIZE = config.get("partition_size", self.SIZE)
+		self.BYTE_MODE = byte_mode
+		self.WE = we
+		self.TIME_SCALE = time_scale
+		self.DATA = bytearray([0xFF] * self.SIZE)
+		if data is not None:
+			self.DATA[0:min(len(data), self.SIZE)] = data[0:self.SIZE]
+		self.SECTOR_STARTS = []
+		pos = 0
+		for (sector_size, count) in self.SECTORS:
+			for _ in range(0, count):
+				self.SECTOR_STARTS.append(pos)
+				pos += sector_size
+		self.CFI = self._build_cfi()
+		self.Reset()
+
+	def _build_cfi(self):
+		cfi = [ 0 ] * 0x200
+		cfi[0x10:0x13] = [ ord("Q"), ord("R"), ord("Y") ]
+		cfi[0x13] = { "AMD":0x02, "INTEL":0x01, "SHARP":0x03 }[self.COMMAND_SET]
+		cfi[0x15] = 0x40 # primary extended table
+		cfi[0x1B] = 0x27 # 2.7 V
+		cfi[0x1C] = 0x36 # 3.6 V
+		(write_us, buffer_us, sector_ms, chip_ms) = self.TIMING
+		cfi[0x1F] = int(math.log2(write_us))
+		if self.BUFFER_SIZE > 0: cfi[0x20] = int(math.log2(buffer_us))
+		cfi[0x21] = int(math.log2(sector_ms))
+		if self.COMMAND_SET == "AMD" and chip_ms > 0: cfi[0x22] = int(math.log2(chip_ms))
+		cfi[0x23] = 4
+		if self.BUFFER_SIZE > 0: cfi[0x24] = 4
+		cfi[0x25] = 3
+		if cfi[0x22] > 0: cfi[0x26] = 3
+		# Cartridges built from several chips answer with the CFI data of one partition
+		cfi[0x27] = int(math.log2(self.PARTITION_SIZE))
+		cfi[0x28] = 0x02 # x8/x16
+		if self.BUFFER_SIZE > 0: cfi[0x2A] = int(math.log2(self.BUFFER_SIZE))
+		regions = []
+		pos = 0
+		for (sector_size, count) in self.SECTORS:
+			if pos >= self.PARTITION_SIZE: break
+			pos += sector_size * count
+			if len(regions) > 0 and regions[-1][0] == sector_size:
+				regions[-1][1] += count
+			else:
+				regions.append([sector_size, count])
+		cfi[0x2C] = len(regions)
+		for i in range(0, min(4, len(regions))):
+			(sector_size, count) = regions[i]
+			cfi[0x2D+i*4:0x31+i*4] = [ (count - 1) & 0xFF, (count - 1) >> 8, (sector_size >> 8) & 0xFF, sector_size >> 16 ]
+		cfi[0x40:0x45] = [ ord("P"), ord("R"), ord("I"), ord("1"), ord("3") ]
+		cfi[0x4F] = 0x02 if len(regions) > 1 else 0x00 # boot sector flag, regions listed in address order
+		return cfi
+
+	def Reset(self):
+		self.MODE = self.MODE_READ
+		self.STATE = self.STATE_IDLE
+		self.PENDING = None
+		self.STATUS = 0x80
+		self.BUSY_UNTIL = 0
+		self.TOGGLE = 0
+
+	def IsBusy(self):
+		return time.perf_counter() < self.BUSY_UNTIL
+
+	def _busy(self, ms):
+		now = time.perf_counter()
+		self.BUSY_UNTIL = max(now, self.BUSY_UNTIL) + ms / 1000 * self.TIME_SCALE
+
+	def _query(self, word):
+		if self.IsBusy():
+			if self.COMMAND_SET == "AMD":
+				self.TOGGLE ^= 0x40 # DQ7 low while busy, DQ6 toggles on every read
+				return self.TOGGLE | (self.TOGGLE << 8)
+			return 0x0000
+		if self.MODE == self.MODE_STATUS:
+			return self.STATUS
+		if self.MODE == self.MODE_CFI:
+			return self.CFI[word % len(self.CFI)]
+		if self.MODE == self.MODE_ID:
+			word %= 0x100
+			if word < len(self.FLASH_ID): return self.FLASH_ID[word]
+			if self.COMMAND_SET != "AMD": return self.CFI[word]
+			return 0
+		return None
+
+	def Read(self, address, length):
+		if self.MODE == self.MODE_READ and not self.IsBusy():
+			return read_wrapped(self.DATA, address, length)
+		buffer = bytearray(length)
+		for i in range(0, length):
+			pos = address + i
+			value = self._query(pos >> 1)
+			if value is None:
+				buffer[i] = self.DATA[pos % self.SIZE]
+			elif self.BYTE_MODE:
+				buffer[i] = value & 0xFF
+			else:
+				buffer[i] = (value >> ((pos & 1) * 8)) & 0xFF
+		return buffer
+
+	def _sector(self, address):
+		i = bisect.bisect_right(self.SECTOR_STARTS, address % self.SIZE) - 1
+		start = self.SECTOR_STARTS[i]
+		end = self.SECTOR_STARTS[i+1] if i + 1 < len(self.SECTOR_STARTS) else self.SIZE
+		return (start, end)
+
+	def _erase(self, start, end, ms):
+		dprint("{:s}: Erasing 0x{:X}–0x{:X}".format(self.NAME, start, end - 1))
+		self.DATA[start:end] = bytearray([0xFF] * (end - start))
+		self._busy(ms)
+
+	def _program_value(self, address, value):
+		address %= self.SIZE
+		if self.BYTE_MODE:
+			self.DATA[address] &= value & 0xFF
+		else:
+			address &= ~1
+			self.DATA[address] &= value & 0xFF
+			self.DATA[address+1] &= (value >> 8) & 0xFF
+
+	def Program(self, address, data, buffered=False):
+		# Used by the firmware's FLASH_PROGRAM command; returns the time spent in seconds
+		address %= self.SIZE
+		length = min(len(data), self.SIZE - address)
+		self.DATA[address:address+length] = bytes(a & b for (a, b) in zip(self.DATA[address:address+length], data))
+		if buffered and self.BUFFER_SIZE > 0:
+			us = math.ceil(length / self.BUFFER_SIZE) * self.TIMING[1]
+		else:
+			us = (length if self.BYTE_MODE else length // 2) * self.TIMING[0]
+		return us / 1000000 * self.TIME_SCALE
+
+	def Write(self, address, value):
+		if self.COMMAND_SET == "AMD":
+			self._write_amd(address, value)
+		else:
+			self._write_intel(address, value)
+
+	def _write_amd(self, address, value):
+		value &= 0xFF if self.BYTE_MODE else 0xFFFF
+		cmd = value & 0xFF
+		if self.PENDING == "program":
+			self.PENDING = None
+			self._program_value(address, value)
+			self._busy(self.TIMING[0] / 1000)
+			return
+		if cmd == 0xF0:
+			self.MODE = self.MODE_READ
+			self.STATE = self.STATE_IDLE
+			return
+		if cmd == 0x98 and self.STATE == self.STATE_IDLE:
+			self.MODE = self.MODE_CFI
+			return
+		if self.STATE in (0, 3) and cmd in (0xAA, 0xA9):
+			self.STATE += 1
+		elif self.STATE in (1, 4) and cmd in (0x55, 0x56):
+			self.STATE += 1
+		elif self.STATE == 2:
+			self.STATE = self.STATE_IDLE
+			if cmd == 0x90:
+				self.MODE = self.MODE_ID
+			elif cmd == 0xA0:
+				self.PENDING = "program"
+			elif cmd == 0x80:
+				self.STATE = 3
+		elif self.STATE == 5:
+			self.STATE = self.STATE_IDLE
+			if cmd == 0x10:
+				self._erase(0, self.SIZE, self.TIMING[3])
+			elif cmd == 0x30:
+				(start, end) = self._sector(address)
+				self._erase(start, end, self.TIMING[2])
+			self.MODE = self.MODE_READ
+		else:
+			self.STATE = self.STATE_IDLE
+
+	def _write_intel(self, address, value):
+		value &= 0xFF if self.BYTE_MODE else 0xFFFF
+		cmd = value & 0xFF
+		pending = self.PENDING
+		self.PENDING = None
+		if pending == "program":
+			self._program_value(address, value)
+			self._busy(self.TIMING[0] / 1000)
+			self.MODE = self.MODE_STATUS
+		elif pending == "erase":
+			self.MODE = self.MODE_STATUS
+			if cmd == 0xD0:
+				(start, end) = self._sector(address)
+				self._erase(start, end, self.TIMING[2])
+		elif pending == "partition_erase":
+			self.MODE = self.MODE_STATUS
+			if cmd == 0xD0:
+				start = (address % self.SIZE) // self.PARTITION_SIZE * self.PARTITION_SIZE
+				self._erase(start, start + self.PARTITION_SIZE, self.TIMING[3] * self.PARTITION_SIZE / self.SIZE)
+		elif pending == "lock":
+			self.MODE = self.MODE_STATUS
+		elif pending == "buffer_count":
+			self.PENDING = [ "buffer", (value & 0xFF) + 1 ]
+		elif isinstance(pending, list) and pending[1] > 0:
+			self._program_value(address, value)
+			pending[1] -= 1
+			self.PENDING = pending
+		elif isinstance(pending, list):
+			self.MODE = self.MODE_STATUS
+			if cmd == 0xD0: self._busy(self.TIMING[1] / 1000)
+		elif cmd in (0xFF, 0xF0):
+			self.MODE = self.MODE_READ
+		elif cmd == 0x90:
+			self.MODE = self.MODE_ID
+		elif cmd == 0x98:
+			self.MODE = self.MODE_CFI
+		elif cmd == 0x70:
+			self.MODE = self.MODE_STATUS
+		elif cmd == 0x50:
+			self.STATUS = 0x80
+		elif cmd in (0x40, 0x10):
+			self.PENDING = "program"
+		elif cmd == 0x20:
+			self.PENDING = "erase"
+		elif cmd == 0x30:
+			self.PENDING = "partition_erase"
+		elif cmd == 0x60:
+			self.PENDING = "lock"
+		elif cmd == 0xE8:
+			self.MODE = self.MODE_STATUS
+			self.PENDING = "buffer_count"
+
+class AGBSaveFlash:
+	def __init__(self, flash_id, data, time_scale=1.0):
+		self.FLASH_ID = flash_id
+		self.DATA = data
+		self.TIME_SCALE = time_scale
+		self.BANK = 0
+		self.STATE = 0
+		self.ID_MODE = False
+		self.PENDING = None
+		self.BUSY_UNTIL = 0
+
+	def Read(self, address, length):
+		if time.perf_counter() < self.BUSY_UNTIL:
+			return bytearray(length)
+		if self.ID_MODE:
+			return bytearray([ (self.FLASH_ID >> (8 - (address + i) % 2 * 8)) & 0xFF for i in range(0, length) ])
+		return read_wrapped(self.DATA, self.BANK * 0x10000 + (address & 0xFFFF), length)
+
+	def _erase(self, start, length, ms):
+		self.DATA[start:start+length] = bytearray([0xFF] * length)
+		self.BUSY_UNTIL = time.perf_counter() + ms / 1000 * self.TIME_SCALE
+
+	def Program(self, address, data):
+		offset = (self.BANK * 0x10000 + address) % len(self.DATA)
+		length = min(len(data), len(self.DATA) - offset)
+		self.DATA[offset:offset+length] = bytes(a & b for (a, b) in zip(self.DATA[offset:offset+length], data))
+		return length * 20 / 1000000 * self.TIME_SCALE
+
+	def Write(self, address, value):
+		address &= 0xFFFF
+		value &= 0xFF
+		if self.PENDING == "program":
+			self.PENDING = None
+			self.Program(address, bytearray([value]))
+			return
+		if self.PENDING == "bank":
+			self.PENDING = None
+			if address == 0: self.BANK = value % max(1, len(self.DATA) // 0x10000)
+			return
+		if value == 0xF0:
+			self.ID_MODE = False
+			self.STATE = 0
+		elif self.STATE in (0, 3) and address == 0x5555 and value == 0xAA:
+			self.STATE += 1
+		elif self.STATE in (1, 4) and address == 0x2AAA and value == 0x55:
+			self.STATE += 1
+		elif self.STATE == 2:
+			self.STATE = 0
+			if value == 0x90:
+				self.ID_MODE = True
+			elif value == 0x80:
+				self.STATE = 3
+			elif value == 0xA0:
+				self.PENDING = "program"
+			elif value == 0xB0:
+				self.PENDING = "bank"
+		elif self.STATE == 5:
+			self.STATE = 0
+			if value == 0x10:
+				self._erase(0, len(self.DATA), 100)
+			elif value == 0x30:
+				self._erase(self.BANK * 0x10000 + (address & 0xF000), 0x1000, 25)
+		else:
+			self.STATE = 0
+
+class DMGCartridge:
+	def __init__(self, rom, mbc=5, ram=None):
+		self.ROM = rom
+		self.MBC = mbc
+		self.RAM = ram if ram is not None else bytearray()
+		self.Reset()
+
+	def Reset(self):
+		self.RAM_ENABLED = self.MBC == 0
+		self.ROM_BANK = 1
+		self.RAM_BANK = 0
+		self.BANKING_MODE = 0
+
+	def _rom_offset(self, address):
+		if self.MBC == 1:
+			low = self.ROM_BANK & 0x1F
+			if address < 0x4000:
+				bank = (self.RAM_BANK & 0x03) << 5 if self.BANKING_MODE == 1 else 0
+			else:
+				bank = ((self.RAM_BANK & 0x03) << 5) | (low if low > 0 else 1)
+		elif address < 0x4000 or self.MBC == 0:
+			return address
+		elif self.MBC == 3:
+			bank = self.ROM_BANK & 0x7F
+			if bank == 0: bank = 1
+		else:
+			bank = self.ROM_BANK & 0x1FF
+		return bank * 0x4000 + (address & 0x3FFF)
+
+	def _ram_offset(self, address):
+		bank = self.RAM_BANK & 0x0F
+		if self.MBC == 1: bank = self.RAM_BANK & 0x03 if self.BANKING_MODE == 1 else 0
+		return bank * 0x2000 + (address - 0xA000)
+
+	def Read(self, address, length):
+		buffer = bytearray()
+		while length > 0:
+			address &= 0xFFFF
+			if address < 0x8000:
+				end = min(address + length, (address & 0xC000) + 0x4000)
+				buffer += self.ROM.Read(self._rom_offset(address), end - address)
+			elif 0xA000 <= address < 0xC000:
+				end = min(address + length, 0xC000)
+				if self.RAM_ENABLED and len(self.RAM) > 0 and self.RAM_BANK < 0x08:
+					buffer += read_wrapped(self.RAM, self._ram_offset(address), end - address)
+				else:
+					buffer += bytearray([0xFF] * (end - address))
+			else:
+				end = min(address + length, 0xA000 if address < 0xA000 else 0x10000)
+				buffer += bytearray([0xFF] * (end - address))
+			length -= end - address
+			address = end
+		return buffer
+
+	def Write(self, address, value):
+		address &= 0xFFFF
+		value &= 0xFF
+		if address < 0x2000:
+			self.RAM_ENABLED = (value & 0x0F) == 0x0A or self.MBC == 0
+		elif address < 0x4000:
+			if self.MBC == 5 and address >= 0x3000:
+				self.ROM_BANK = (self.ROM_BANK & 0xFF) | ((value & 0x01) << 8)
+			elif self.MBC == 5:
+				self.ROM_BANK = (self.ROM_BANK & 0x100) | value
+			elif self.MBC in (1, 3):
+				self.ROM_BANK = value
+		elif address < 0x6000:
+			self.RAM_BANK = value
+		elif address < 0x8000:
+			if self.MBC == 1: self.BANKING_MODE = value & 0x01
+		elif 0xA000 <= address < 0xC000:
+			if self.RAM_ENABLED and len(self.RAM) > 0 and self.RAM_BANK < 0x08:
+				self.RAM[self._ram_offset(address) % len(self.RAM)] = value
+
+	def WriteRAM(self, address, data):
+		for i in range(0, len(data)):
+			self.Write(address + i, data[i])
+
+	def FlashWrite(self, address, value):
+		address &= 0xFFFF
+		if address < 0x8000: self.ROM.Write(self._rom_offset(address), value)
+
+	def FlashProgram(self, address, data, buffered=False):
+		return self.ROM.Program(self._rom_offset(address & 0x7FFF), data, buffered)
+
+class AGBCartridge:
+	def __init__(self, rom, save_type=None, save=None, time_scale=1.0):
+		self.ROM = rom
+		self.SAVE_TYPE = save_type
+		self.SAVE = save if save is not None else bytearray()
+		self.SRAM_BANK = 0
+		self.FLASH = None
+		if save_type == "FLASH":
+			self.FLASH = AGBSaveFlash(AGB_SAVE_FLASH_IDS[len(self.SAVE)], self.SAVE, time_scale=time_scale)
+
+	def Reset(self):
+		self.SRAM_BANK = 0
+
+	def ReadROM(self, address, length):
+		return self.ROM.Read(address * 2, length)
+
+	def WriteROM(self, address, value):
+		if address == 0x800000 and self.SAVE_TYPE == "SRAM":
+			self.SRAM_BANK = value & 0x01
+		else:
+			self.ROM.Write(address * 2, value)
+
+	def ProgramROM(self, address, data, buffered=False):
+		return self.ROM.Program(address * 2, data, buffered)
+
+	def ReadSRAM(self, address, length):
+		if self.SAVE_TYPE == "FLASH":
+			return self.FLASH.Read(address, length)
+		elif self.SAVE_TYPE == "SRAM":
+			return read_wrapped(self.SAVE, self.SRAM_BANK * 0x10000 + (address & 0xFFFF), length)
+		return bytearray([0xFF] * length)
+
+	def WriteSRAM(self, address, data):
+		for i in range(0, len(data)):
+			self.SaveWrite(address + i, data[i])
+
+	def SaveWrite(self, address, value):
+		if self.SAVE_TYPE == "FLASH":
+			self.FLASH.Write(address, value)
+		elif self.SAVE_TYPE == "SRAM":
+			self.SAVE[(self.SRAM_BANK * 0x10000 + (address & 0xFFFF)) % len(self.SAVE)] = value & 0xFF
+
+	def ProgramSave(self, address, data):
+		if self.SAVE_TYPE != "FLASH": return 0
+		return self.FLASH.Program(address, data)
+
+	def _eeprom_block(self, block, width):
+		# A chip addressed with the wrong bus width sees a shifted block number
+		blocks = len(self.SAVE) // 8
+		if blocks == 64 and width == 2: block >>= 8
+		return (block % blocks) * 8
+
+	def ReadEEPROM(self, block, length, width):
+		if self.SAVE_TYPE != "EEPROM": return bytearray([0xFF] * length)
+		buffer = bytearray()
+		for i in range(0, length // 8):
+			offset = self._eeprom_block(block + i, width)
+			buffer += self.SAVE[offset:offset+8]
+		return buffer
+
+	def WriteEEPROM(self, block, data, width):
+		if self.SAVE_TYPE != "EEPROM": return 0
+		for i in range(0, len(data) // 8):
+			offset = self._eeprom_block(block + i, width)
+			self.SAVE[offset:offset+8] = data[i*8:i*8+8]
+		return len(data) // 8 * 0.0002
+
+class GbxCartEmulator:
+	FW_VER = 3
+	PCB_VER = 6
+	OFW_VER = 31
+	FW_TIMESTAMP = 1640995200
+	LATENCY = 0.001
+	THROTTLE = True
+	TIME_SCALE = 1.0
+	MASTER = None
+	SLAVE = None
+	PORT = None
+	THREAD = None
+
+	def __init__(self, dmg_cart=None, agb_cart=None, latency=None, throttle=None, time_scale=None):
+		if latency is not None: self.LATENCY = latency
+		if throttle is not None: self.THROTTLE = throttle
+		if time_scale is not None: self.TIME_SCALE = time_scale
+		self.CARTS = { "DMG":dmg_cart, "AGB":agb_cart }
+		self.MODE = "DMG" if dmg_cart is not None else "AGB"
+		self.VARS = {}
+		self.VAR_NAMES = { v:k for (k, v) in GbxDevice.DEVICE_VAR_TABLE.items() }
+		self.POWER = False
+		self.BAUDRATE = 1000000
+		self.INPUT = bytearray()
+		self.ARRIVAL = 0
+		self.RX_LINE = 0
+		self.LINE_FREE = 0
+		self.READY_AT = 0
+		self.RUNNING = False
+		self.COMMAND = None
+		self.STATS = { "commands":0, "bytes_in":0, "bytes_out":0 }
+
+		cmd = GbxDevice.DEVICE_CMD
+		self.COMMANDS = {
+			cmd["NULL"]:None,
+			0x00:None, # sent after each batch of AGB_CART_READ_3D_MEMORY
+			cmd["OFW_RESET_AVR"]:self._reset_vars,
+			cmd["OFW_CART_MODE"]:lambda: self._send(0x01),
+			cmd["OFW_FW_VER"]:lambda: self._send(self.OFW_VER),
+			cmd["OFW_PCB_VER"]:lambda: self._send(self.PCB_VER),
+			cmd["OFW_USART_1_7M_SPEED"]:self._usart_speed,
+			cmd["OFW_CART_PWR_ON"]:lambda: self._power(True),
+			cmd["OFW_CART_PWR_OFF"]:lambda: self._power(False),
+			cmd["OFW_QUERY_CART_PWR"]:lambda: self._send(1 if self.POWER else 0),
+			cmd["OFW_DONE_LED_ON"]:None,
+			cmd["OFW_ERROR_LED_ON"]:None,
+			cmd["OFW_GB_CART_MODE"]:None,
+			cmd["OFW_GB_FLASH_BANK_1_COMMAND_WRITES"]:None,
+			cmd["QUERY_FW_INFO"]:self._query_fw_info,
+			cmd["SET_MODE_AGB"]:lambda: self._set_mode("AGB"),
+			cmd["SET_MODE_DMG"]:lambda: self._set_mode("DMG"),
+			cmd["SET_VOLTAGE_3_3V"]:None,
+			cmd["SET_VOLTAGE_5V"]:None,
+			cmd["SET_VARIABLE"]:self._set_variable,
+			cmd["SET_FLASH_CMD"]:self._set_flash_cmd,
+			cmd["SET_ADDR_AS_INPUTS"]:None,
+			cmd["CLK_HIGH"]:None,
+			cmd["CLK_LOW"]:None,
+			cmd["DMG_CART_READ"]:self._dmg_cart_read,
+			cmd["DMG_CART_WRITE"]:self._dmg_cart_write,
+			cmd["DMG_CART_WRITE_SRAM"]:self._dmg_cart_write_sram,
+			cmd["DMG_MBC_RESET"]:self._dmg_mbc_reset,
+			cmd["DMG_MBC7_READ_EEPROM"]:lambda: self._send(bytearray([0xFF] * self._var("TRANSFER_SIZE"))),
+			cmd["DMG_MBC7_WRITE_EEPROM"]:self._discard_data,
+			cmd["DMG_MBC6_MMSA_WRITE_FLASH"]:self._discard_data,
+			cmd["AGB_CART_READ"]:self._agb_cart_read,
+			cmd["AGB_CART_WRITE"]:self._agb_cart_write,
+			cmd["AGB_CART_READ_SRAM"]:self._agb_cart_read_sram,
+			cmd["AGB_CART_WRITE_SRAM"]:self._agb_cart_write_sram,
+			cmd["AGB_CART_READ_EEPROM"]:self._agb_cart_read_eeprom,
+			cmd["AGB_CART_WRITE_EEPROM"]:self._agb_cart_write_eeprom,
+			cmd["AGB_CART_WRITE_FLASH_DATA"]:self._agb_cart_write_flash_data,
+			cmd["AGB_CART_READ_3D_MEMORY"]:self._agb_cart_read,
+			cmd["AGB_BOOTUP_SEQUENCE"]:lambda: self._send(0x01),
+			cmd["DMG_FLASH_WRITE_BYTE"]:self._dmg_cart_write,
+			cmd["AGB_FLASH_WRITE_BYTE"]:self._agb_cart_write,
+			cmd["FLASH_PROGRAM"]:self._flash_program,
+			cmd["CART_WRITE_FLASH_CMD"]:self._cart_write_flash_cmd,
+		}
+		self._reset_vars()
+
+	def Open(self):
+		import pty, tty
+		(self.MASTER, self.SLAVE) = pty.openpty()
+		# Keeping our own handle on the slave side stops the master from seeing EIO between host connections
+		tty.setraw(self.SLAVE)
+		os.set_blocking(self.MASTER, False)
+		self.PORT = os.ttyname(self.SLAVE)
+		self.RUNNING = True
+		self.THREAD = threading.Thread(target=self._run, name="GbxCartEmulator", daemon=True)
+		self.THREAD.start()
+		return self.PORT
+
+	def Close(self):
+		self.RUNNING = False
+		if self.THREAD is not None and self.THREAD is not threading.current_thread():
+			self.THREAD.join(1)
+		for fd in (self.MASTER, self.SLAVE):
+			if fd is None: continue
+			try:
+				os.close(fd)
+			except OSError:
+				pass
+		self.MASTER = None
+		self.SLAVE = None
+
+	def GetPort(self):
+		return self.PORT
+
+	def GetStats(self):
+		return dict(self.STATS)
+
+	def _run(self):
+		while self.RUNNING:
+			try:
+				cmd = self._recv(1)[0]
+			except EOFError:
+				break
+			self.STATS["commands"] += 1
+			self.COMMAND = cmd
+			if cmd not in self.COMMANDS:
+				dprint("Unknown command 0x{:02X}".format(cmd))
+				continue
+			handler = self.COMMANDS[cmd]
+			if handler is None: continue
+			try:
+				handler()
+			except EOFError:
+				break
+
+	def _recv(self, count):
+		while len(self.INPUT) < count:
+			if not self.RUNNING: raise EOFError()
+			(r, _, _) = select.select([ self.MASTER ], [], [], 0.1)
+			if len(r) == 0: continue
+			try:
+				data = os.read(self.MASTER, 0x10000)
+			except (BlockingIOError, InterruptedError):
+				continue
+			except OSError:
+				raise EOFError()
+			self.INPUT += data
+			self.ARRIVAL = time.perf_counter()
+			if self.THROTTLE: self.RX_LINE = max(self.RX_LINE, self.ARRIVAL) + len(data) * 10 / self.BAUDRATE
+			self.STATS["bytes_in"] += len(data)
+		data = bytes(self.INPUT[:count])
+		del self.INPUT[:count]
+		if self.THROTTLE:
+			# The host side of the wire is just as slow; the last byte consumed arrived no sooner than this
+			self.ARRIVAL = max(self.ARRIVAL, self.RX_LINE - len(self.INPUT) * 10 / self.BAUDRATE)
+		return data
+
+	def _wait_until(self, timestamp):
+		delay = timestamp - time.perf_counter()
+		if delay > 0: time.sleep(delay)
+
+	def _send(self, data):
+		if isinstance(data, int): data = bytes([data])
+		# Replies leave after the USB round trip and any pending cartridge work, then take their time on the wire
+		start = max(time.perf_counter(), self.ARRIVAL + self.LATENCY, self.LINE_FREE, self.READY_AT)
+		duration = len(data) * 10 / self.BAUDRATE if self.THROTTLE else 0
+		self.LINE_FREE = start + duration
+		self._wait_until(self.LINE_FREE)
+		view = memoryview(bytes(data))
+		stalled = None
+		while len(view) > 0 and self.RUNNING:
+			try:
+				written = os.write(self.MASTER, view)
+			except (BlockingIOError, InterruptedError):
+				written = 0
+			except OSError:
+				raise EOFError()
+			if written > 0:
+				view = view[written:]
+				stalled = None
+				continue
+			if stalled is None:
+				stalled = time.perf_counter()
+			elif time.perf_counter() - stalled > 1:
+				dprint("Nobody is reading, dropping 0x{:X} byte(s)".format(len(view)))
+				break
+			select.select([], [ self.MASTER ], [], 0.1)
+		self.STATS["bytes_out"] += len(data) - len(view)
+
+	def _delay(self, seconds):
+		# Work the firmware finishes before it accepts the next command
+		if seconds <= 0: return
+		self.READY_AT = max(time.perf_counter(), self.READY_AT) + seconds
+
+	def _var(self, key):
+		return self.VARS.get(key, 0)
+
+	def _reset_vars(self):
+		self.VARS = { k:0 for k in GbxDevice.DEVICE_VAR.keys() }
+
+	def _usart_speed(self):
+		self.BAUDRATE = 1700000
+
+	def _power(self, power):
+		self.POWER = power
+		for cart in self.CARTS.values():
+			if cart is not None: cart.Reset()
+		for cart in self.CARTS.values():
+			if cart is not None and hasattr(cart.ROM, "Reset"): cart.ROM.Reset()
+
+	def _set_mode(self, mode):
+		# The firmware keeps its variables until the microcontroller is reset
+		self.MODE = mode
+
+	def _query_fw_info(self):
+		info = struct.pack(">cHBI", b"L", self.FW_VER, self.PCB_VER, self.FW_TIMESTAMP)
+		self._send(bytearray([len(info)]) + info)
+
+	def _set_variable(self):
+		(size, index, value) = struct.unpack(">BII", self._recv(9))
+		key = self.VAR_NAMES.get((size, index))
+		if key is None:
+			dprint("Unknown variable {:d}/{:d}".format(size, index))
+			return
+		self.VARS[key] = value
+
+	def _set_flash_cmd(self):
+		(command_set, method, we) = self._recv(3)
+		self._recv(6 * 6)
+		self.VARS.update({ "FLASH_COMMAND_SET":command_set, "FLASH_METHOD":method, "FLASH_WE_PIN":we })
+
+	def _advance(self, count):
+		self.VARS["ADDRESS"] = (self._var("ADDRESS") + count) & 0xFFFFFFFF
+
+	def _discard_data(self):
+		self._recv(self._var("TRANSFER_SIZE"))
+		self._send(0x01)
+
+	def _dmg_we_ok(self):
+		we = self._var("FLASH_WE_PIN")
+		cart = self.CARTS["DMG"]
+		if we == 0 or not hasattr(cart.ROM, "WE"): return True
+		return (we in (1, 3)) == (cart.ROM.WE == "WR")
+
+	def _dmg_cart_read(self):
+		length = self._var("TRANSFER_SIZE")
+		cart = self.CARTS["DMG"]
+		if cart is None:
+			data = bytearray([0xFF] * length)
+		else:
+			data = cart.Read(self._var("ADDRESS"), length)
+		self._advance(length)
+		self._send(data)
+
+	def _dmg_cart_write(self):
+		(address, value) = struct.unpack(">IB", self._recv(5))
+		cart = self.CARTS["DMG"]
+		if cart is None: return
+		if self.COMMAND == GbxDevice.DEVICE_CMD["DMG_FLASH_WRITE_BYTE"]:
+			if self._dmg_we_ok(): cart.FlashWrite(address, value)
+		else:
+			cart.Write(address, value)
+
+	def _dmg_cart_write_sram(self):
+		length = self._var("TRANSFER_SIZE")
+		data = self._recv(length)
+		cart = self.CARTS["DMG"]
+		if cart is not None: cart.WriteRAM(self._var("ADDRESS"), data)
+		self._advance(length)
+		self._send(0x01)
+
+	def _dmg_mbc_reset(self):
+		if self.CARTS["DMG"] is not None: self.CARTS["DMG"].Reset()
+		self._send(0x01)
+
+	def _agb_cart_read(self):
+		length = self._var("TRANSFER_SIZE")
+		cart = self.CARTS["AGB"]
+		if cart is None:
+			data = bytearray([0xFF] * length)
+		else:
+			data = cart.ReadROM(self._var("ADDRESS"), length)
+		self._advance(length // 2)
+		self._send(data)
+
+	def _agb_cart_write(self):
+		(address, value) = struct.unpack(">IH", self._recv(6))
+		if self.CARTS["AGB"] is not None: self.CARTS["AGB"].WriteROM(address, value)
+
+	def _agb_cart_read_sram(self):
+		length = self._var("TRANSFER_SIZE")
+		cart = self.CARTS["AGB"]
+		if cart is None:
+			data = bytearray([0xFF] * length)
+		else:
+			data = cart.ReadSRAM(self._var("ADDRESS"), length)
+		self._advance(length)
+		self._send(data)
+
+	def _agb_cart_write_sram(self):
+		length = self._var("TRANSFER_SIZE")
+		data = self._recv(length)
+		if self.CARTS["AGB"] is not None: self.CARTS["AGB"].WriteSRAM(self._var("ADDRESS"), data)
+		self._advance(length)
+		self._send(0x01)
+
+	def _agb_cart_read_eeprom(self):
+		width = self._recv(1)[0]
+		length = self._var("TRANSFER_SIZE")
+		cart = self.CARTS["AGB"]
+		if cart is None:
+			data = bytearray([0xFF] * length)
+		else:
+			data = cart.ReadEEPROM(self._var("ADDRESS"), length, width)
+		self._advance(length // 8)
+		self._send(data)
+
+	def _agb_cart_write_eeprom(self):
+		width = self._recv(1)[0]
+		length = self._var("TRANSFER_SIZE")
+		data = self._recv(length)
+		if self.CARTS["AGB"] is not None:
+			self._delay(self.CARTS["AGB"].WriteEEPROM(self._var("ADDRESS"), data, width) * self.TIME_SCALE)
+		self._advance(length // 8)
+		self._send(0x01)
+
+	def _agb_cart_write_flash_data(self):
+		chip_type = self._recv(1)[0]
+		length = self._var("TRANSFER_SIZE")
+		data = self._recv(length)
+		address = self._var("ADDRESS")
+		if chip_type == 2: address *= 128 # Atmel chips are addressed by 128 byte page
+		if self.CARTS["AGB"] is not None: self._delay(self.CARTS["AGB"].ProgramSave(address, data))
+		self._advance(length // 128 if chip_type == 2 else length)
+		self._send(0x01)
+
+	def _flash_program(self):
+		length = self._var("TRANSFER_SIZE")
+		data = self._recv(length)
+		buffered = self._var("FLASH_METHOD") in (0x02, 0x05)
+		cart = self.CARTS[self.MODE]
+		if self.MODE == "DMG":
+			if cart is not None and self._dmg_we_ok(): self._delay(cart.FlashProgram(self._var("ADDRESS"), data, buffered))
+			self._advance(length)
+		else:
+			if cart is not None: self._delay(cart.ProgramROM(self._var("ADDRESS"), data, buffered))
+			self._advance(length // 2)
+		self._send(0x01)
+
+	def _cart_write_flash_cmd(self):
+		num = self._recv(1)[0]
+		commands = [ struct.unpack(">IB", self._recv(5)) for _ in range(0, num) ]
+		cart = self.CARTS[self.MODE]
+		if cart is not None:
+			for (address, value) in commands:
+				if self.MODE == "AGB":
+					cart.SaveWrite(address, value)
+				else:
+					cart.Write(address, value)
+		self._send(0x01)
+
+def main():
+	parser = argparse.ArgumentParser(description="Virtual GBxCart RW device on a pseudo terminal")
+	parser.add_argument("--mode", choices=["dmg", "agb"], type=str.lower, default="agb", help="cartridge slot to populate")
+	parser.add_argument("--rom", type=str, default=None, help="ROM file to load; a synthetic ROM is generated if omitted")
+	parser.add_argument("--rom-size", type=lambda x: int(x, 0), default=0x400000, help="size of the synthetic ROM in bytes")
+	parser.add_argument("--mbc", choices=["0", "1", "3", "5"], default=None, help="memory bank controller of Game Boy cartridges (default: from ROM header)")
+	parser.add_argument("--flash", choices=list(FLASH_CHIPS.keys()), default=None, help="emulate a flash cartridge with this chip instead of a mask ROM")
+	parser.add_argument("--we", choices=["WR", "AUDIO"], default="AUDIO", help="write enable pin of the Game Boy flash chip")
+	parser.add_argument("--save-type", choices=list(AGB_SAVE_TYPES.keys()), default="sram256k", help="save type of Game Boy Advance cartridges")
+	parser.add_argument("--ram-size", type=lambda x: int(x, 0), default=0x8000, help="SRAM size of Game Boy cartridges in bytes")
+	parser.add_argument("--save", type=str, default=None, help="save data file to load")
+	parser.add_argument("--write-back", action="store_true", help="write ROM and save data back to their files on exit")
+	parser.add_argument("--latency", type=float, default=1.0, help="USB round trip latency in milliseconds")
+	parser.add_argument("--no-throttle", action="store_true", help="don’t limit replies to the serial baud rate")
+	parser.add_argument("--time-scale", type=float, default=1.0, help="scale factor for flash erase and program timings")
+	parser.add_argument("--debug", action="store_true", help="print debug messages")
+	args = parser.parse_args()
+	if args.debug: Util.DEBUG = True
+
+	mode = args.mode.upper()
+	if args.rom is not None:
+		with open(args.rom, "rb") as f: rom_data = bytearray(f.read())
+	else:
+		rom_data = make_test_rom(mode, args.rom_size, ram_size=args.ram_size)
+	if args.flash is not None:
+		rom = FlashChip(args.flash, rom_data, byte_mode=(mode == "DMG"), we=args.we, time_scale=args.time_scale)
+	else:
+		rom = MaskROM(rom_data)
+
+	save_size = args.ram_size
+	save_type = None
+	if mode == "AGB" and AGB_SAVE_TYPES[args.save_type] is not None:
+		(save_type, save_size) = AGB_SAVE_TYPES[args.save_type]
+	elif mode == "AGB":
+		save_size = 0
+	save = bytearray(random.Random(save_size).getrandbits(save_size * 8).to_bytes(save_size, "little")) if save_size > 0 else bytearray()
+	if args.save is not None and os.path.exists(args.save):
+		with open(args.save, "rb") as f: data = f.read()
+		save[0:min(len(data), save_size)] = data[0:save_size]
+
+	if mode == "DMG":
+		if args.mbc is not None:
+			mbc = int(args.mbc)
+		else:
+			mbc = { 0x00:0, 0x01:1, 0x02:1, 0x03:1, 0x0F:3, 0x10:3, 0x11:3, 0x12:3, 0x13:3 }.get(rom_data[0x147], 5)
+		emu = GbxCartEmulator(dmg_cart=DMGCartridge(rom, mbc, save), latency=args.latency / 1000, throttle=not args.no_throttle, time_scale=args.time_scale)
+	else:
+		emu = GbxCartEmulator(agb_cart=AGBCartridge(rom, save_type, save, time_scale=args.time_scale), latency=args.latency / 1000, throttle=not args.no_throttle, time_scale=args.time_scale)
+
+	port = emu.Open()
+	print("Emulated GBxCart RW is listening on {:s}".format(port))
+	print("Connect with: python -m FlashGBX --cli --device-port {:s} --mode {:s} --ignore-bad-header ...".format(port, args.mode))
+	try:
+		while emu.THREAD.is_alive(): emu.THREAD.join(0.5)
+	except KeyboardInterrupt:
+		pass
+	emu.Close()
+	print("\n{:d} commands, {:d} bytes received, {:d} bytes sent".format(*emu.GetStats().values()))
+
+	if args.write_back:
+		if args.rom is not None and isinstance(rom, FlashChip):
+			with open(args.rom, "wb") as f: f.write(rom.DATA)
+		if args.save is not None and save_size > 0:
+			with open(args.save, "wb") as f: f.write(save)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+# FlashGBX
+# Author: Lesserkuma (github.com/lesserkuma)
+
+import threading, queue, time, datetime, os, re, hashlib, tempfile, concurrent.futures
+import serial.tools.list_ports
+from . import hw_GBxCartRW
+from .Util import dprint
+from . import Util
+
+class DeviceFarm:
+	ACTIONS = [ "backup-rom", "backup-save", "flash-rom", "verify" ]
+	DMG_SAVE_SIZES = [ "auto", "4k", "16k", "64k", "256k", "512k", "1m", "eeprom2k", "eeprom4k", "tama5" ]
+	AGB_SAVE_TYPES = [ "auto", "eeprom4k", "eeprom64k", "sram256k", "sram512k", "sram1m", "flash512k", "flash1m", "dacs8m" ]
+	ROM_DIGESTS = [ "md5", "sha256" ] # reported next to CRC32 and SHA-1 for matching dumps against DAT files
+	FLASHCARTS = None
+	DEVICES = None
+	RESULTS = None
+	CALLBACK = None
+	CANCEL = False
+
+	def __init__(self, flashcarts, max_baud=1700000):
+		self.FLASHCARTS = flashcarts
+		self.MAX_BAUD = max_baud
+		self.DEVICES = {}
+		self.RESULTS = []
+		self.STATUS = {}
+		self.CLAIMED = set()
+		self.LOCK = threading.Lock()
+
+	def Open(self, ports=None):
+		# Connects to every attached device at once; returns the messages of ports that failed
+		if ports is None:
+			ports = [ p.device for p in serial.tools.list_ports.comports() if p.vid == 0x1A86 and p.pid == 0x7523 ]
+
+		def connect(port):
+			dev = hw_GBxCartRW.GbxDevice()
+			ret = dev.Initialize(self.FLASHCARTS, port=port, max_baud=self.MAX_BAUD)
+			return (port, dev, ret)
+
+		errors = {}
+		if len(ports) == 0: return errors
+		with concurrent.futures.ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="FarmConnect") as executor:
+			for (port, dev, ret) in executor.map(connect, ports):
+				if dev.IsConnected():
+					self.DEVICES[port] = dev
+				else:
+					messages = [ re.sub('<[^<]+?>', '', m[1]) for m in ret if m[0] == 3 ] if isinstance(ret, list) else []
+					errors[port] = messages[0] if len(messages) > 0 else "Couldn’t connect to the device."
+		return errors
+
+	def Close(self):
+		for dev in self.DEVICES.values():
+			try:
+				dev.Close()
+			except:
+				pass
+
+	def GetDevices(self):
+		return dict(self.DEVICES)
+
+	def Cancel(self):
+		self.CANCEL = True
+		for dev in self.DEVICES.values():
+			dev.CANCEL = True
+
+	def Run(self, jobs, callback=None):
+		# One worker per device; jobs with a "port" only run on that device, all others go to whoever is free
+		self.CALLBACK = callback
+		self.RESULTS = []
+		self.CANCEL = False
+		shared = queue.Queue()
+		pinned = { port:queue.Queue() for port in self.DEVICES }
+		for i in range(0, len(jobs)):
+			job = dict(jobs[i])
+			job["index"] = i
+			if job.get("action") not in self.ACTIONS:
+				self._report(self._result(job, None, message="Unknown action"))
+			elif job.get("port") is None:
+				shared.put(job)
+			elif job["port"] in pinned:
+				pinned[job["port"]].put(job)
+			else:
+				self._report(self._result(job, None, message="No device connected on this port"))
+
+		workers = []
+		for (port, dev) in self.DEVICES.items():
+			worker = threading.Thread(target=self._worker, args=(port, dev, pinned[port], shared), name="Farm {:s}".format(port), daemon=True)
+			worker.start()
+			workers.append(worker)
+		for worker in workers:
+			worker.join()
+
+		self.RESULTS.sort(key=lambda r: r["index"])
+		return self.RESULTS
+
+	def GetReport(self):
+		devices = {}
+		for (port, dev) in self.DEVICES.items():
+			devices[port] = { "name":dev.GetFullName(), "firmware":dev.GetFirmwareVersion(), "jobs":0, "failed":0, "bytes":0, "time":0 }
+		for result in self.RESULTS:
+			if result["port"] not in devices: continue
+			device = devices[result["port"]]
+			device["jobs"] += 1
+			if not result["ok"]: device["failed"] += 1
+			device["bytes"] += result["bytes"]
+			device["time"] += result["time"]
+		for device in devices.values():
+			device["speed"] = device["bytes"] / device["time"] / 1024 if device["time"] > 0 else 0
+		return { "date":datetime.datetime.now().astimezone().replace(microsecond=0).isoformat(), "devices":devices, "jobs":list(self.RESULTS) }
+
+	def GetStatus(self):
+		with self.LOCK:
+			return dict(self.STATUS)
+
+	def _report(self, result):
+		with self.LOCK:
+			self.RESULTS.append(result)
+		if self.CALLBACK is not None: self.CALLBACK(result)
+
+	def _result(self, job, port, message=""):
+		return { "index":job["index"], "action":job.get("action"), "port":port, "ok":False, "message":message, "game_title":None, "path":job.get("path"), "bytes":0, "time":0 }
+
+	def _worker(self, port, dev, pinned, shared):
+		progress = Util.Progress(lambda args: self._progress(port, args))
+		while not self.CANCEL:
+			job = None
+			for jobs in (pinned, shared):
+				try:
+					job = jobs.get_nowait()
+					break
+				except queue.Empty:
+					pass
+			if job is None: break
+
+			with self.LOCK:
+				self.STATUS[port] = { "job":job["index"], "action":job["action"], "pos":0, "size":0, "speed":0 }
+			result = self._run_job(port, dev, job, progress)
+			with self.LOCK:
+				self.STATUS[port] = None
+			self._report(result)
+
+	def _progress(self, port, args):
+		with self.LOCK:
+			status = self.STATUS.get(port)
+			if status is None: return
+			for key in ("pos", "size", "speed"):
+				if key in args: status[key] = args[key]
+
+	def _run_job(self, port, dev, job, progress):
+		result = self._result(job, port)
+		aborted = {}
+		def signal(args):
+			if args["action"] == "ABORT": aborted.update(args)
+			progress.SetProgress(args)
+
+		time_start = time.time()
+		try:
+			dev.CANCEL = False
+			dev.SetMode(job.get("mode", "agb").upper())
+			header = dev.ReadInfo()
+			result["game_title"] = header["game_title"]
+			if job["action"] == "backup-rom":
+				self._backup_rom(dev, job, header, signal, result)
+			elif job["action"] == "verify":
+				self._verify(dev, job, header, signal, result)
+			elif job["action"] == "flash-rom":
+				self._flash_rom(dev, job, signal, result)
+			elif job["action"] == "backup-save":
+				self._backup_save(dev, job, header, signal, result)
+			if len(aborted) > 0:
+				result["ok"] = False
+				result["message"] = aborted.get("info_msg", "The operation was aborted.")
+		except Exception as e:
+			dprint("Job {:d} on {:s} failed:".format(job["index"], port), str(e))
+			result["ok"] = False
+			result["message"] = str(e)
+		result["time"] = time.time() - time_start
+		return result
+
+	def _rom_layout(self, dev, header, job):
+		mbc = 0
+		rom_banks = 1
+		rom_size = 0
+		if dev.GetMode() == "DMG":
+			mbc = header.get("features_raw", 5)
+			if mbc == 0: mbc = 5
+			try:
+				rom_banks = Util.DMG_Header_ROM_Sizes_Flasher_Map[header["rom_size_raw"]]
+			except (KeyError, IndexError, TypeError):
+				rom_banks = 512
+			if "rom_size" in job: rom_banks = int(job["rom_size"]) // 0x4000
+			rom_size = rom_banks * 0x4000
+		else:
+			rom_size = int(job.get("rom_size", header["rom_size"]))
+		return (mbc, rom_banks, rom_size)
+
+	def _target_path(self, job, header, ext):
+		name = header["game_title"].strip().encode('ascii', 'ignore').decode('ascii')
+		if name == "" and "game_code" in header: name = header["game_code"].strip().encode('ascii', 'ignore').decode('ascii')
+		if name == "": name = "ROM"
+		name = re.sub(r"[<>:\"/\\|\?\*]", "_", name)
+
+		path = job.get("path", ".")
+		if not os.path.isdir(path) and not path.endswith(("/", "\\")): return path
+		if not os.path.isdir(path): os.makedirs(path)
+
+		# Several devices may dump the same title at the same time
+		with self.LOCK:
+			target = os.path.join(path, name + ext)
+			i = 1
+			while target in self.CLAIMED or (os.path.exists(target) and not job.get("overwrite", False) and not (job.get("resume", False) and os.path.exists(target + Util.DumpJournal.SUFFIX))):
+				i += 1
+				target = os.path.join(path, "{:s}_{:d}{:s}".format(name, i, ext))
+			self.CLAIMED.add(target)
+		return target
+
+	def _backup_rom(self, dev, job, header, signal, result):
+		(mbc, rom_banks, rom_size) = self._rom_layout(dev, header, job)
+		if dev.GetMode() == "DMG":
+			ext = ".gbc" if dev.INFO["cgb"] in (0x80, 0xC0) else ".sgb" if dev.INFO["sgb"] == 0x03 else ".gb"
+		else:
+			ext = ".gba"
+		path = self._target_path(job, header, ext)
+		result["path"] = path
+		dev.TransferData(args={ 'mode':1, 'path':path, 'mbc':mbc, 'rom_banks':rom_banks, 'agb_rom_size':rom_size, 'start_addr':0, 'fast_read_mode':False, 'cart_type':0, 'digests':self.ROM_DIGESTS, 'resume':job.get("resume", False), 'fsync':job.get("fsync", "never") }, signal=signal)
+		result["bytes"] = os.path.getsize(path)
+		result["crc32"] = "{:08X}".format(dev.INFO["file_crc32"])
+		result["sha1"] = dev.INFO["file_sha1"]
+		for name in self.ROM_DIGESTS:
+			result[name] = dev.INFO["file_" + name]
+		if dev.GetMode() == "DMG":
+			result["checksum_ok"] = dev.INFO["rom_checksum"] == dev.INFO["rom_checksum_calc"]
+		result["ok"] = True
+
+	def _verify(self, dev, job, header, signal, result):
+		# Reads back as much ROM data as the reference file holds and compares both
+		with open(job["path"], "rb") as f: reference = hashlib.sha1(f.read()).hexdigest()
+		size = os.path.getsize(job["path"])
+		(mbc, _, _) = self._rom_layout(dev, header, job)
+		(fd, path) = tempfile.mkstemp(prefix="FlashGBX_verify_", suffix=".bin")
+		os.close(fd)
+		try:
+			dev.TransferData(args={ 'mode':1, 'path':path, 'mbc':mbc, 'rom_banks':max(1, size // 0x4000), 'agb_rom_size':size, 'start_addr':0, 'fast_read_mode':False, 'cart_type':0 }, signal=signal)
+			with open(path, "rb") as f: data = f.read()
+		finally:
+			os.unlink(path)
+		result["bytes"] = len(data)
+		result["sha1"] = hashlib.sha1(data[:size]).hexdigest()
+		result["ok"] = result["sha1"] == reference
+		if not result["ok"]: result["message"] = "The ROM data doesn’t match the file."
+
+	def _flash_rom(self, dev, job, signal, result):
+		mode = dev.GetMode()
+		carts = dev.GetSupportedCartridgesDMG()[1] if mode == "DMG" else dev.GetSupportedCartridgesAGB()[1]
+		cart_type = 0
+		handler = job.get("flashcart_handler", "autodetect")
+		for i in range(0, len(carts)):
+			if "names" in carts[i] and carts[i]["type"] == mode and handler in carts[i]["names"]:
+				cart_type = i
+				break
+		if cart_type == 0 and handler == "autodetect":
+			cart_type = dev.DetectCartridge(checkSaveType=False)[6]
+		if cart_type is None or cart_type <= 0:
+			raise Exception("The flash cartridge type couldn’t be determined.")
+
+		with open(job["path"], "rb") as f: buffer = bytearray(f.read())
+		progress = {}
+		def track(args):
+			if "verified" in args: progress["verified"] = args["verified"]
+			signal(args)
+		dev.TransferData(args={ 'mode':4, 'path':job["path"], 'cart_type':cart_type, 'override_voltage':False, 'start_addr':0, 'buffer':buffer, 'prefer_chip_erase':job.get("prefer_chip_erase", False), 'reverse_sectors':False, 'fast_read_mode':False, 'verify_flash':job.get("verify_flash", True), 'fix_header':False }, signal=track)
+		result["bytes"] = len(buffer)
+		result["flashcart"] = carts[cart_type]["names"][0]
+		result["verified"] = progress.get("verified", False)
+		result["ok"] = True
+
+	def _backup_save(self, dev, job, header, signal, result):
+		mbc = 0
+		if dev.GetMode() == "DMG":
+			(mbc, _, _) = self._rom_layout(dev, header, job)
+			save_size = job.get("save_type", "auto")
+			if save_size != "auto":
+				save_type = Util.DMG_Header_RAM_Sizes_Flasher_Map[self.DMG_SAVE_SIZES.index(save_size)]
+			elif header["features_raw"] == 0x06: # MBC2
+				save_type = Util.DMG_Header_RAM_Sizes_Flasher_Map[1]
+			elif header["features_raw"] == 0xFD: # TAMA5
+				save_type = Util.DMG_Header_RAM_Sizes_Flasher_Map[Util.DMG_Header_RAM_Sizes_Map.index(0x103)]
+			else:
+				try:
+					save_type = Util.DMG_Header_RAM_Sizes_Flasher_Map[Util.DMG_Header_RAM_Sizes_Map.index(header["ram_size_raw"])]
+				except ValueError:
+					save_type = 0
+		else:
+			save_type = job.get("save_type", "auto")
+			save_type = header["save_type"] if save_type == "auto" else self.AGB_SAVE_TYPES.index(save_type)
+		if save_type in (0, None):
+			raise Exception("The save type couldn’t be determined.")
+
+		path = self._target_path(job, header, ".sav")
+		result["path"] = path
+		dev.TransferData(args={ 'mode':2, 'path':path, 'mbc':mbc, 'save_type':save_type, 'rtc':job.get("rtc", False), 'fsync':job.get("fsync", "never") }, signal=signal)
+		result["bytes"] = os.path.getsize(path)
+		with open(path, "rb") as f: result["sha1"] = hashlib.sha1(f.read()).hexdigest()
+		result["ok"] = True
@@ -119,8 +119,9 @@ def main(portableMode=False):
 	
 	ap_cli1 = parser.add_argument_group('main command line interface arguments')
 	ap_cli1.add_argument("--mode", choices=["dmg", "agb"], type=str.lower, default=None, help="set cartridge mode to \"dmg\" (Game Boy) or \"agb\" (Game Boy Advance)")
-	ap_cli1.add_argument("--action", choices=["info", "backup-rom", "flash-rom", "backup-save", "restore-save", "erase-save", "gbcamera-extract", "fwupdate-gbxcartrw", "debug-test-save"], type=str.lower, default=None, help="select program action")
+	ap_cli1.add_argument("--action", choices=["info", "backup-rom", "flash-rom", "backup-save", "restore-save", "erase-save", "gbcamera-extract", "fwupdate-gbxcartrw", "debug-test-save", "bench", "farm"], type=str.lower, default=None, help="select program action")
 	ap_cli1.add_argument("--overwrite", action="store_true", help="overwrite without asking if target file already exists")
+	ap_cli1.add_argument("--resume", action="store_true", help="continue an interrupted ROM backup from the last chunk that was verified in its journal file")
 	ap_cli1.add_argument("path", nargs="?", default="auto", help="target or source file path (optional when reading, required when writing)")
 	
 	ap_cli2 = parser.add_argument_group('optional command line interface arguments')
@@ -138,9 +139,18 @@ def main(portableMode=False):
 	ap_cli2.add_argument("--force-5v", action="store_true", help="force 5V when writing Game Boy flash cartridges")
 	ap_cli2.add_argument("--no-verify-flash", action="store_true", help="do not verify written ROM data")
 	ap_cli2.add_argument("--save-filename-add-datetime", action="store_true", help="adds a timestamp to the file name of save data backups")
+	ap_cli2.add_argument("--fsync", choices=["never", "close", "chunk"], type=str.lower, default="never", help="when to flush backup files to the storage device: never, once when the file is closed, or after every chunk")
 	ap_cli2.add_argument("--gbcamera-palette", choices=["grayscale", "dmg", "sgb", "cgb1", "cgb2", "cgb3"], type=str.lower, default="grayscale", help="sets the palette of pictures extracted from Game Boy Camera saves")
 	ap_cli2.add_argument("--gbcamera-outfile-format", choices=["png", "bmp", "gif", "jpg"], type=str.lower, default="png", help="sets the file format of saved pictures extracted from Game Boy Camera saves")
 	ap_cli2.add_argument("--fwupdate-port", help="override device port for the firmware updater", default=None)
+	ap_cli2.add_argument("--device-port", help="connect to the device on this port instead of scanning for it; comma-separated list for the farm action", default=None)
+	ap_cli2.add_argument("--stats", action="store_true", help="print per-command device statistics after each operation")
+	ap_cli2.add_argument("--farm-report", type=str, default="auto", help="file path of the JSON report written by the farm action")
+	ap_cli2.add_argument("--bench-sizes", type=str, default="64,128,256,512,1024,2048,4096", help="comma-separated transfer chunk sizes to benchmark")
+	ap_cli2.add_argument("--bench-windows", type=str, default="1,2,4", help="comma-separated read window depths to benchmark")
+	ap_cli2.add_argument("--bench-bauds", type=str, default="1000000,1700000", help="comma-separated baud rates to benchmark")
+	ap_cli2.add_argument("--bench-length", type=lambda x: int(x, 0), default=0x20000, help="number of bytes to transfer per benchmark run")
+	ap_cli2.add_argument("--bench-scratch", type=lambda x: int(x, 0), default=None, help="ROM offset of a flash sector that may be erased to benchmark ROM writing")
 	args = parser.parse_args()
 	
 	if "appdata" in cp:
@@ -154,6 +164,8 @@ def main(portableMode=False):
 	if args.debug == True:
 		Util.DEBUG = True
 	
+	Util.CONFIG_PATH = config_path
+	
 	args = {"app_path":app_path, "config_path":config_path, "argparsed":args}
 	args.update(LoadConfig(args))
 	
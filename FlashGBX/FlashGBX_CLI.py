@@ -15,6 +15,7 @@ from .RomFileDMG import RomFileDMG
 from .RomFileAGB import RomFileAGB
 from .PocketCamera import PocketCamera
 from .Util import APPNAME, ANSI
+from .Farm import DeviceFarm
 from . import Util
 from . import hw_GBxCartRW, hw_GBxCartRW_ofw
 hw_devices = [hw_GBxCartRW, hw_GBxCartRW_ofw]
@@ -73,12 +74,20 @@ class FlashGBX_CLI():
 					print("Canceled.")
 					return
 		
+		if args.action == "farm":
+			self.Farm(args)
+			return
+		
 		if args.action is None or args.action not in ("gbcamera-extract", "fwupdate-gbxcartrw"):
-			if not self.FindDevices():
+			max_baud = 1700000
+			if args.action == "bench":
+				# Start at the slowest rate; the switch to 1.7M baud only lasts until the device is reconnected
+				max_baud = min([ int(x, 0) for x in args.bench_bauds.split(",") ])
+			if not self.FindDevices(max_baud=max_baud):
 				print("No devices found.")
 				return
 			else:
-				if not self.ConnectDevice():
+				if not self.ConnectDevice(max_baud=max_baud):
 					print("Couldn’t connect to the device.")
 					return
 				dev = self.DEVICE[1]
@@ -155,6 +164,10 @@ class FlashGBX_CLI():
 		
 		print("\nCartridge Information:")
 		print(s_header)
+		if args.action == "info":
+			self.PrintStats()
+		elif args.stats and hasattr(self.CONN, "ResetStats"):
+			self.CONN.ResetStats()
 
 		if args.action == "backup-rom":
 			self.BackupROM(args, header)
@@ -188,6 +201,10 @@ class FlashGBX_CLI():
 					return
 			self.FlashROM(args, header)
 		
+		elif args.action == "bench":
+			self.Benchmark(args, header)
+			self.PrintStats()
+		
 		if args.action != "info":
 			print("")
 		
@@ -227,6 +244,7 @@ class FlashGBX_CLI():
 			elif args["action"] == "FINISHED":
 				print("\n")
 				self.FinishOperation()
+				self.PrintStats()
 			elif args["action"] == "ABORT":
 				print("\nOperation stopped.\n")
 				if "info_type" in args.keys() and "info_msg" in args.keys():
@@ -236,6 +254,7 @@ class FlashGBX_CLI():
 						print(args["info_msg"])
 					elif args["info_type"] == "label":
 						print(args["info_msg"])
+				self.PrintStats()
 				return
 			elif args["action"] == "PROGRESS":
 				# pv style progress status
@@ -321,11 +340,92 @@ class FlashGBX_CLI():
 		else:
 			self.CONN.INFO["last_action"] = 0
 	
-	def FindDevices(self, connectToFirst=False):
+	def PrintStats(self):
+		if not self.ARGS["argparsed"].stats or not hasattr(self.CONN, "GetStats"): return
+		stats = self.CONN.GetStats()
+		if stats is None or len(stats["commands"]) == 0: return
+		
+		print("\nDevice statistics:")
+		line = "{:<24s} {:>8s} {:>8s} {:>10s} {:>10s} {:>10s} {:>9s} {:>9s} {:>9s} {:>9s} {:>6s}"
+		print(line.format("Command", "Count", "Replies", "Sent", "Received", "Wait ms", "Avg ms", "p50 ms", "p99 ms", "Max ms", "Errors"))
+		for (name, entry) in sorted(stats["commands"].items(), key=lambda x: x[1]["time"], reverse=True):
+			avg = entry["time"] / entry["replies"] * 1000 if entry["replies"] > 0 else 0
+			(p50, p99) = [ Util.percentile(entry["histogram"], p, limit=entry["time_max"] * 1000000) / 1000 for p in (50, 99) ] # histogram buckets are in µs
+			print(line.format(name, str(entry["count"]), str(entry["replies"]), str(entry["bytes_out"]), str(entry["bytes_in"]), "{:.1f}".format(entry["time"] * 1000), "{:.3f}".format(avg), "{:.3f}".format(p50), "{:.3f}".format(p99), "{:.3f}".format(entry["time_max"] * 1000), str(entry["errors"])))
+		if stats["elapsed"] > 0:
+			print("Waited for the device for {:.2f} of {:.2f} seconds ({:.1f}%).".format(stats["waiting"], stats["elapsed"], stats["waiting"] / stats["elapsed"] * 100))
+		self.CONN.ResetStats()
+	
+	def Farm(self, args):
+		if args.path == "auto":
+			print("{:s}Please specify the path of a job list file.{:s}".format(ANSI.RED, ANSI.RESET))
+			return
+		try:
+			with open(args.path, "r", encoding="utf-8") as f:
+				jobs = json.load(f)
+			if isinstance(jobs, dict): jobs = jobs["jobs"]
+			if not isinstance(jobs, list): raise ValueError("Expected a list of jobs")
+		except (OSError, ValueError, KeyError) as e:
+			print("{:s}Couldn’t load the job list file “{:s}”: {:s}{:s}".format(ANSI.RED, args.path, str(e), ANSI.RESET))
+			return
+		for job in jobs:
+			if "mode" not in job and args.mode is not None: job["mode"] = args.mode
+			if "overwrite" not in job: job["overwrite"] = args.overwrite
+			if "resume" not in job: job["resume"] = args.resume
+			if "fsync" not in job: job["fsync"] = args.fsync
+		
+		farm = DeviceFarm(self.FLASHCARTS)
+		ports = None
+		if args.device_port is not None: ports = [ p.strip() for p in args.device_port.split(",") if p.strip() != "" ]
+		errors = farm.Open(ports)
+		for (port, msg) in errors.items():
+			print("{:s}{:s}: {:s}{:s}".format(ANSI.RED, port, msg, ANSI.RESET))
+		devices = farm.GetDevices()
+		if len(devices) == 0:
+			print("No devices found.")
+			return
+		print("\nConnected to {:d} device(s):".format(len(devices)))
+		for (port, dev) in devices.items():
+			print("- {:s}: {:s}".format(port, dev.GetFullNameExtended()))
+		print("\nRunning {:d} job(s)...".format(len(jobs)))
+		
+		def done(result):
+			if result["ok"]:
+				msg = "{:s}OK{:s}".format(ANSI.GREEN, ANSI.RESET)
+			else:
+				msg = "{:s}{:s}{:s}".format(ANSI.RED, result["message"] if result["message"] != "" else "Failed", ANSI.RESET)
+			title = "" if result["game_title"] is None else " “{:s}”".format(result["game_title"])
+			print("\r\033[K[{:d}] {:s} on {:s}{:s}: {:s}".format(result["index"] + 1, result["action"], str(result["port"]), title, msg))
+		
+		try:
+			farm.Run(jobs, callback=done)
+		except KeyboardInterrupt:
+			print("\nCanceling...")
+			farm.Cancel()
+		finally:
+			farm.Close()
+		
+		report = farm.GetReport()
+		print("\nDevice summary:")
+		line = "{:<16s} {:>6s} {:>8s} {:>12s} {:>10s} {:>12s}"
+		print(line.format("Port", "Jobs", "Failed", "Bytes", "Seconds", "KiB/s"))
+		for (port, device) in report["devices"].items():
+			print(line.format(port, str(device["jobs"]), str(device["failed"]), str(device["bytes"]), "{:.2f}".format(device["time"]), "{:.2f}".format(device["speed"])))
+		
+		path = args.farm_report
+		if path == "auto": path = "FlashGBX_farm_{:s}.json".format(datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+		try:
+			with open(path, "w", encoding="utf-8") as f:
+				json.dump(report, f, indent=4, ensure_ascii=False)
+			print("\nThe report was written to “{:s}”.".format(os.path.abspath(path)))
+		except OSError as e:
+			print("{:s}Couldn’t write the report to “{:s}”: {:s}{:s}".format(ANSI.RED, path, str(e), ANSI.RESET))
+	
+	def FindDevices(self, connectToFirst=False, max_baud=1700000):
 		global hw_devices
 		for hw_device in hw_devices:
 			dev = hw_device.GbxDevice()
-			ret = dev.Initialize(self.FLASHCARTS, max_baud=1700000)
+			ret = dev.Initialize(self.FLASHCARTS, port=self.ARGS["argparsed"].device_port, max_baud=max_baud)
 			if ret is False:
 				self.CONN = None
 			elif isinstance(ret, list):
@@ -345,10 +445,10 @@ class FlashGBX_CLI():
 		if self.DEVICE is None: return False
 		return True
 		
-	def ConnectDevice(self):
+	def ConnectDevice(self, max_baud=1700000):
 		dev = self.DEVICE[1]
 		port = dev.GetPort()
-		ret = dev.Initialize(self.FLASHCARTS, port=port, max_baud=1700000)
+		ret = dev.Initialize(self.FLASHCARTS, port=port, max_baud=max_baud)
 
 		if ret is False:
 			print("\n{:s}An error occured while trying to connect to the device.{:s}".format(ANSI.RED, ANSI.RESET))
@@ -372,6 +472,7 @@ class FlashGBX_CLI():
 					return False
 		
 		self.CONN = dev
+		if self.ARGS["argparsed"].stats and hasattr(dev, "EnableStats"): dev.EnableStats()
 		return True
 
 	def DisconnectDevice(self):
@@ -742,7 +843,7 @@ class FlashGBX_CLI():
 				path = args.path
 		
 		if (path == ""): return
-		if not args.overwrite and os.path.exists(os.path.abspath(path)):
+		if not args.overwrite and not args.resume and os.path.exists(os.path.abspath(path)):
 			answer = input("The target file “{:s}” already exists.\nDo you want to overwrite it? [y/N]: ".format(os.path.abspath(path))).strip().lower()
 			print("")
 			if answer != "y":
@@ -784,7 +885,7 @@ class FlashGBX_CLI():
 					cart_type = i
 					break
 
-		self.CONN.TransferData(args={ 'mode':1, 'path':path, 'mbc':mbc, 'rom_banks':rom_banks, 'agb_rom_size':rom_size, 'start_addr':0, 'fast_read_mode':fast_read_mode, 'cart_type':cart_type }, signal=self.PROGRESS.SetProgress)
+		self.CONN.TransferData(args={ 'mode':1, 'path':path, 'mbc':mbc, 'rom_banks':rom_banks, 'agb_rom_size':rom_size, 'start_addr':0, 'fast_read_mode':fast_read_mode, 'cart_type':cart_type, 'resume':args.resume, 'fsync':args.fsync }, signal=self.PROGRESS.SetProgress)
 	
 	def FlashROM(self, args, header):
 		path = ""
@@ -1023,7 +1124,7 @@ class FlashGBX_CLI():
 		
 		print("")
 		if args.action == "backup-save":
-			self.CONN.TransferData(args={ 'mode':2, 'path':path, 'mbc':mbc, 'save_type':save_type, 'rtc':rtc }, signal=self.PROGRESS.SetProgress)
+			self.CONN.TransferData(args={ 'mode':2, 'path':path, 'mbc':mbc, 'save_type':save_type, 'rtc':rtc, 'fsync':args.fsync }, signal=self.PROGRESS.SetProgress)
 		elif args.action == "restore-save":
 			self.CONN.TransferData(args={ 'mode':3, 'path':path, 'mbc':mbc, 'save_type':save_type, 'erase':False, 'rtc':rtc }, signal=self.PROGRESS.SetProgress)
 		elif args.action == "erase-save":
@@ -1108,6 +1209,81 @@ class FlashGBX_CLI():
 			os.unlink(self.CONFIG_PATH + "/test3.bin")
 			os.unlink(self.CONFIG_PATH + "/test4.bin")
 
+	def Benchmark(self, args, header):
+		if not hasattr(self.CONN, "BenchmarkTransfer"):
+			print("{:s}Benchmarking is not supported with this device.{:s}".format(ANSI.RED, ANSI.RESET))
+			return
+		mode = self.CONN.GetMode()
+		try:
+			sizes = [ int(x, 0) for x in args.bench_sizes.split(",") ]
+			windows = [ int(x, 0) for x in args.bench_windows.split(",") ]
+			bauds = sorted(set([ int(x, 0) for x in args.bench_bauds.split(",") ]))
+		except ValueError:
+			print("{:s}Invalid benchmark settings.{:s}".format(ANSI.RED, ANSI.RESET))
+			return
+		
+		mbc = 0
+		if mode == "DMG":
+			mbc = header["features_raw"] if "features_raw" in header else 0x1B
+			if args.dmg_mbc != "auto": mbc = { 2:0x06, 3:0x13, 5:0x19, 6:0x20, 7:0x22 }.get(int(args.dmg_mbc), int(args.dmg_mbc))
+		
+		cart_type = 0
+		if args.bench_scratch is not None:
+			carts = self.CONN.GetSupportedCartridgesDMG()[1] if mode == "DMG" else self.CONN.GetSupportedCartridgesAGB()[1]
+			for i in range(0, len(carts)):
+				if "names" in carts[i] and args.flashcart_handler in carts[i]["names"]:
+					cart_type = i
+					break
+			if cart_type <= 0 and args.flashcart_handler == "autodetect":
+				cart_type = self.DetectCartridge()
+				if cart_type is None or cart_type < 0: cart_type = 0
+		
+		dev = self.CONN
+		report = {
+			"device":{ "name":dev.GetFullName(), "pcb_ver":dev.FW["pcb_ver"], "pcb":dev.GetPCBVersion(), "firmware":dev.GetFirmwareVersion(), "fw_ver":dev.FW["fw_ver"], "fw_dt":dev.GetFWBuildDate(), "port":dev.GetPort() },
+			"mode":mode, "game_title":header["game_title"], "date":datetime.datetime.now().astimezone().replace(microsecond=0).isoformat(),
+			"length":args.bench_length, "results":[], "skipped":[],
+		}
+		
+		print("\nBenchmarking {:s} with {:s} of data per run...".format(dev.GetFullName(), Util.formatFileSize(args.bench_length)))
+		line = "{:<17s} {:>8s} {:>6s} {:>6s} {:>10s} {:>11s} {:>11s} {:>11s} {:>6s}"
+		print(line.format("Primitive", "Baud", "Chunk", "Window", "KB/s", "p50 ms/cmd", "p90 ms/cmd", "p99 ms/cmd", "Errors"))
+		for baud in bauds:
+			if baud != dev.BAUDRATE:
+				dev.Initialize(self.FLASHCARTS, port=dev.GetPort(), max_baud=baud)
+				if not dev.IsConnected() or dev.BAUDRATE != baud:
+					report["skipped"].append({ "baud":baud, "reason":"baud rate not reachable" })
+					print("{:s}Skipping {:d} baud: the device couldn’t be switched to this rate.{:s}".format(ANSI.YELLOW, baud, ANSI.RESET))
+					if not dev.IsConnected(): break
+					continue
+				dev.SetMode(mode)
+			
+			for primitive in dev.BENCHMARK_PRIMITIVES:
+				bench = dev.BenchmarkPrepare(primitive, args.bench_length, mbc=mbc, cart_type=cart_type, scratch=args.bench_scratch)
+				if isinstance(bench, str):
+					report["skipped"].append({ "primitive":primitive, "baud":baud, "reason":bench })
+					print("{:<17s} {:>8d} {:s}".format(primitive, baud, bench))
+					continue
+				for size in sizes:
+					if size > bench["size"] or (primitive == "ReadROM_3DMemory" and 0x1000 % size != 0): continue
+					for window in (windows if primitive in ("ReadROM", "ReadROM_3DMemory", "ReadRAM") else [ 1 ]):
+						result = dev.BenchmarkTransfer(bench, size, window=window, length=args.bench_length)
+						speed = result["bytes"] / result["time"] / 1024 if result["time"] > 0 else 0
+						# Spread of the average time per command of each run; with several commands in flight this isn’t a round-trip latency
+						(p50, p90, p99) = [ Util.percentile(result["command_times"], p) * 1000 for p in (50, 90, 99) ]
+						report["results"].append({ "primitive":primitive, "baud":baud, "chunk_size":size, "window":window, "bytes":result["bytes"], "seconds":result["time"], "kb_per_s":speed, "ms_per_command":{ "p50":p50, "p90":p90, "p99":p99 }, "errors":result["errors"] })
+						print(line.format(primitive, str(baud), str(size), str(window), "{:.2f}".format(speed), "{:.3f}".format(p50), "{:.3f}".format(p90), "{:.3f}".format(p99), str(result["errors"])))
+				if dev.BenchmarkFinish(bench) is False:
+					print("{:s}The save data couldn’t be restored after benchmarking {:s}.{:s}".format(ANSI.RED, primitive, ANSI.RESET))
+		
+		path = args.path
+		if path == "auto":
+			path = "FlashGBX_bench_{:s}_{:s}_{:s}.json".format(dev.GetPCBVersion(), dev.GetFirmwareVersion(), datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+			path = re.sub(r"[<>:\"/\\|\?\* ]", "_", path)
+		with open(path, "w", encoding="UTF-8") as f:
+			json.dump(report, f, indent=4)
+		print("\nThe benchmark results were saved to “{:s}”.".format(os.path.abspath(path)))
+	
 	def UpdateFirmwareGBxCartRW_PrintText(self, text, enableUI=False, setProgress=None):
 		if setProgress is not None:
 			self.FWUPD_R = True
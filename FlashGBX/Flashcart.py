@@ -3,24 +3,28 @@
 # Author: Lesserkuma (github.com/lesserkuma)
 
 import time, copy, math, struct
-from .Util import dprint, bitswap
+from .Util import dprint, bitswap, StatusPoller
 
 class Flashcart:
 	CONFIG = {}
 	COMMAND_SET = None
 	CART_WRITE_FNCPTR = None
+	CART_WRITE_SEQUENCE_FNCPTR = None
 	CART_READ_FNCPTR = None
 	PROGRESS_FNCPTR = None
+	CANCEL_FNCPTR = None
 	SECTOR_COUNT = 0
 	SECTOR_POS = 0
 	SECTOR_MAP = None
 	CFI = None
 
-	def __init__(self, config=None, cart_write_fncptr=None, cart_read_fncptr=None, progress_fncptr=None):
+	def __init__(self, config=None, cart_write_fncptr=None, cart_read_fncptr=None, progress_fncptr=None, cart_write_sequence_fncptr=None, cancel_fncptr=None):
 		if config is None: config = {}
 		self.CART_WRITE_FNCPTR = cart_write_fncptr
+		self.CART_WRITE_SEQUENCE_FNCPTR = cart_write_sequence_fncptr
 		self.CART_READ_FNCPTR = cart_read_fncptr
 		self.PROGRESS_FNCPTR = progress_fncptr
+		self.CANCEL_FNCPTR = cancel_fncptr
 		self.CONFIG = config
 		if "command_set" in config:
 			self.CONFIG["_command_set"] = config["command_set"]
@@ -38,6 +42,10 @@ class Flashcart:
 		return self.CART_READ_FNCPTR(address, length)
 	
 	def CartWrite(self, commands, sram=False):
+		if len(commands) == 0: return
+		if self.CART_WRITE_SEQUENCE_FNCPTR is not None and not sram:
+			self.CART_WRITE_SEQUENCE_FNCPTR(commands)
+			return
 		for command in commands:
 			address = command[0]
 			value = command[1]
@@ -129,6 +137,21 @@ class Flashcart:
 		else:
 			return False
 
+	def GetPoller(self, operation, timeout=None, cancelable=False, progress_fncptr=None, max_interval=None):
+		# Completion times are learned per flash chip; CFI timings are the starting point
+		flash_ids = self.CONFIG["flash_ids"] if "flash_ids" in self.CONFIG else []
+		if len(flash_ids) > 0:
+			chip = " ".join(format(x, "02X") for x in flash_ids[0])
+		else:
+			chip = self.GetName()
+		typical = None
+		cfi = self.CONFIG["cfi"] if "cfi" in self.CONFIG else None
+		if isinstance(cfi, dict) and cfi.get(operation) is True:
+			typical = cfi[operation + "_time_avg"] / 1000
+			if timeout is not None: timeout = max(timeout, cfi[operation + "_time_max"] / 1000)
+		cancel_fncptr = self.CANCEL_FNCPTR if cancelable else None
+		return StatusPoller(key="{:s}/{:s}".format(chip, operation), typical=typical, timeout=timeout, max_interval=max_interval, cancel_fncptr=cancel_fncptr, progress_fncptr=progress_fncptr)
+
 	def GetCommands(self, key):
 		if key not in self.CONFIG["commands"]: return []
 		return self.CONFIG["commands"][key]
@@ -142,12 +165,14 @@ class Flashcart:
 	def Reset(self, full_reset=False, max_address=0x2000000):
 		#dprint(full_reset, "reset_every" in self.CONFIG)
 		if full_reset and "reset_every" in self.CONFIG:
+			cmds = []
 			for j in range(0, self.CONFIG["flash_size"], self.CONFIG["reset_every"]):
 				if j >= max_address: break
 				dprint("reset_every @ 0x{:X}".format(j))
 				for command in self.CONFIG["commands"]["reset"]:
-					self.CartWrite([[j, command[1]]])
-					time.sleep(0.01)
+					cmds.append([j, command[1]])
+			self.CartWrite(cmds)
+			time.sleep(0.01)
 		elif "reset" in self.CONFIG["commands"]:
 			self.CartWrite(self.CONFIG["commands"]["reset"])
 			time.sleep(0.001)
@@ -225,32 +250,26 @@ class Flashcart:
 		self.Reset(full_reset=True)
 		time_start = time.time()
 		if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"ERASE", "time_start":time_start, "abortable":False})
+		cmds = []
 		for i in range(0, len(self.CONFIG["commands"]["chip_erase"])):
 			addr = self.CONFIG["commands"]["chip_erase"][i][0]
 			data = self.CONFIG["commands"]["chip_erase"][i][1]
 			if not addr == None:
-				self.CartWrite([[addr, data]])
+				cmds.append([addr, data])
 			if self.CONFIG["commands"]["chip_erase_wait_for"][i][0] != None:
+				# Everything up to a status check goes out in one sequence
+				self.CartWrite(cmds)
+				cmds = []
 				addr = self.CONFIG["commands"]["chip_erase_wait_for"][i][0]
 				data = self.CONFIG["commands"]["chip_erase_wait_for"][i][1]
-				timeout = self.CONFIG["chip_erase_timeout"]
-				while True:
+				mask = self.CONFIG["commands"]["chip_erase_wait_for"][i][2]
+				def progress():
 					if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"ERASE", "time_start":time_start, "abortable":False})
-					if "wait_read_status_register" in self.CONFIG and self.CONFIG["wait_read_status_register"]:
-						for j in range(0, len(self.CONFIG["commands"]["read_status_register"])):
-							#sr_addr = self.CONFIG["commands"]["read_status_register"][j][0]
-							sr_data = self.CONFIG["commands"]["read_status_register"][j][1]
-							self.CartWrite([[addr, sr_data]])
-					self.CartRead(addr, 2) # dummy read (fixes some bootlegs)
-					wait_for = struct.unpack("<H", self.CartRead(addr, 2))[0]
-					dprint("Status Register Check: 0x{:X} & 0x{:X} == 0x{:X}? {:s}".format(wait_for, self.CONFIG["commands"]["chip_erase_wait_for"][i][2], data, str((wait_for & self.CONFIG["commands"]["chip_erase_wait_for"][i][2]) == data)))
-					wait_for = wait_for & self.CONFIG["commands"]["chip_erase_wait_for"][i][2]
-					if wait_for == data: break
-					time.sleep(0.5)
-					timeout -= 0.5
-					if timeout <= 0:
-						self.PROGRESS_FNCPTR({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"Erasing the flash chip timed out. Please make sure that the cartridge contacts are clean, and that the selected cartridge type and settings are correct.", "abortable":False})
-						return False
+				poller = self.GetPoller("chip_erase", timeout=self.CONFIG["chip_erase_timeout"], progress_fncptr=progress)
+				if not poller.Wait(lambda: self._check_status(addr, data, mask, [ [addr, sr[1]] for sr in self.CONFIG["commands"]["read_status_register"] ] if "read_status_register" in self.CONFIG["commands"] else [])):
+					self.PROGRESS_FNCPTR({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"Erasing the flash chip timed out. Please make sure that the cartridge contacts are clean, and that the selected cartridge type and settings are correct.", "abortable":False})
+					return False
+		self.CartWrite(cmds)
 		self.Reset(full_reset=True)
 		return True
 
@@ -259,6 +278,7 @@ class Flashcart:
 		#time_start = time.time()
 		#if progress_fnc is not None: progress_fnc({"action":"ERASE", "time_start":time_start, "abortable":False})
 		if "sector_erase" not in self.CONFIG["commands"]: return False
+		cmds = []
 		for i in range(0, len(self.CONFIG["commands"]["sector_erase"])):
 			addr = self.CONFIG["commands"]["sector_erase"][i][0]
 			data = self.CONFIG["commands"]["sector_erase"][i][1]
@@ -268,8 +288,10 @@ class Flashcart:
 			if addr == "SA+0x4000": addr = pos + 0x4000
 			if addr == "SA+0x7000": addr = pos + 0x7000
 			if not addr == None:
-				self.CartWrite([[addr, data]])
+				cmds.append([addr, data])
 			if self.CONFIG["commands"]["sector_erase_wait_for"][i][0] != None:
+				self.CartWrite(cmds)
+				cmds = []
 				addr = self.CONFIG["commands"]["sector_erase_wait_for"][i][0]
 				data = self.CONFIG["commands"]["sector_erase_wait_for"][i][1]
 				if addr == "SA": addr = pos
@@ -277,27 +299,19 @@ class Flashcart:
 				if addr == "SA+2": addr = pos + 2
 				if addr == "SA+0x4000": addr = pos + 0x4000
 				if addr == "SA+0x7000": addr = pos + 0x7000
-				time.sleep(0.1)
-				timeout = 100
-				while True:
-					if "wait_read_status_register" in self.CONFIG and self.CONFIG["wait_read_status_register"] == True:
-						for j in range(0, len(self.CONFIG["commands"]["read_status_register"])):
-							sr_addr = self.CONFIG["commands"]["read_status_register"][j][0]
-							sr_data = self.CONFIG["commands"]["read_status_register"][j][1]
-							self.CartWrite([[sr_addr, sr_data]])
-					self.CartRead(addr, 2) # dummy read (fixes some bootlegs)
-					wait_for = struct.unpack("<H", self.CartRead(addr, 2))[0]
-					dprint("Status Register Check: 0x{:X} & 0x{:X} == 0x{:X}? {:s}".format(wait_for, self.CONFIG["commands"]["sector_erase_wait_for"][i][2], data, str(wait_for & self.CONFIG["commands"]["sector_erase_wait_for"][i][2] == data)))
-					wait_for = wait_for & self.CONFIG["commands"]["sector_erase_wait_for"][i][2]
-					time.sleep(0.1)
-					timeout -= 1
-					if timeout < 1:
-						dprint("Timeout error!")
-						self.PROGRESS_FNCPTR({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"Erasing a flash chip sector timed out. Please make sure that the cartridge contacts are clean, and that the selected cartridge type and settings are correct.", "abortable":False})
-						return False
-					if wait_for == data: break
-					self.PROGRESS_FNCPTR({"action":"SECTOR_ERASE", "sector_pos":buffer_pos, "time_start":time.time(), "abortable":True})
+				mask = self.CONFIG["commands"]["sector_erase_wait_for"][i][2]
+				def progress():
+					if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"SECTOR_ERASE", "sector_pos":buffer_pos, "time_start":time.time(), "abortable":True})
+				poller = self.GetPoller("sector_erase", timeout=20, cancelable=True, progress_fncptr=progress)
+				ret = poller.Wait(lambda: self._check_status(addr, data, mask, self.CONFIG["commands"]["read_status_register"] if "read_status_register" in self.CONFIG["commands"] else []))
+				if ret is None:
+					return None
+				elif ret is False:
+					dprint("Timeout error!")
+					self.PROGRESS_FNCPTR({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"Erasing a flash chip sector timed out. Please make sure that the cartridge contacts are clean, and that the selected cartridge type and settings are correct.", "abortable":False})
+					return False
 				dprint("Done waiting!")
+		self.CartWrite(cmds)
 
 		self.Reset(full_reset=False)
 		if isinstance(self.CONFIG["sector_size"], list):
@@ -314,6 +328,14 @@ class Flashcart:
 		else:
 			return self.CONFIG["sector_size"]
 	
+	def _check_status(self, addr, data, mask, sr_cmds):
+		if "wait_read_status_register" in self.CONFIG and self.CONFIG["wait_read_status_register"] == True:
+			self.CartWrite(sr_cmds)
+		self.CartRead(addr, 2) # dummy read (fixes some bootlegs)
+		wait_for = struct.unpack("<H", self.CartRead(addr, 2))[0]
+		dprint("Status Register Check: 0x{:X} & 0x{:X} == 0x{:X}? {:s}".format(wait_for, mask, data, str(wait_for & mask == data)))
+		return wait_for & mask == data
+
 	def SelectBankROM(self, index):
 		if "flash_bank_select_type" not in self.CONFIG: return False
 		if self.CONFIG["flash_bank_select_type"] == 1:
@@ -472,133 +494,56 @@ class Flashcart_DMG_MMSA(Flashcart):
 	def SupportsChipErase(self):
 		return True
 	
+	def _flash_command(self, address, value):
+		# The flash chip is only reachable through the MBC's command registers
+		return [
+			[ 0x120, 0x0F ],
+			[ 0x125, address >> 8 ],
+			[ 0x126, address & 0xFF ],
+			[ 0x127, value ],
+			[ 0x13F, 0xA5 ],
+		]
+
+	def _wait_ready(self, operation, progress_fncptr=None):
+		def check():
+			sr = ord(self.CartRead(0))
+			dprint("Status Register Check: 0x{:X} & 0x{:X} == 0x{:X}? {:s}".format(sr, 0x80, 0x80, str(sr == 0x80)))
+			return sr == 0x80
+		return self.GetPoller(operation, timeout=5, progress_fncptr=progress_fncptr).Wait(check)
+
 	def EraseHiddenSector(self, buffer):
 		#time_start = time.time()
 		if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"SECTOR_ERASE", "sector_pos":0, "time_start":time.time(), "abortable":False})
 		
 		self.UnlockForWriting()
 
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0x60 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0x04 ],
-			[ 0x13F, 0xA5 ],
-		]
+		cmds = []
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x5555, 0x60)
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x5555, 0x04)
 		self.CartWrite(cmds)
-		lives = 10
-		while lives > 0:
+		def progress():
 			if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"SECTOR_ERASE", "sector_pos":0, "time_start":time.time(), "abortable":False})
-			sr = ord(self.CartRead(0))
-			dprint("Status Register Check: 0x{:X} & 0x{:X} == 0x{:X}? {:s}".format(sr, 0x80, 0x80, str(sr == 0x80)))
-			if sr == 0x80: break
-			time.sleep(0.5)
-			lives -= 1
-		if lives == 0:
-			raise("Hidden Sector Erase Timeout Error")
+		if not self._wait_ready("hidden_sector_erase", progress):
+			raise Exception("Hidden Sector Erase Timeout Error")
 		
 		# Write Hidden Sector
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0x60 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xE0 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
+		cmds = []
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x5555, 0x60)
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x5555, 0xE0)
+		cmds += [
 			[ 0x2100, 0x01 ],
-		]
-		self.CartWrite(cmds)
-		
-		# Disable writes to MBC registers
-		cmds = [
+			# Disable writes to MBC registers
 			[ 0x120, 0x10 ],
 			[ 0x13F, 0xa5 ],
-		]
-		self.CartWrite(cmds)
-		# Undo Wakeup
-		cmds = [
+			# Undo Wakeup
 			[ 0x120, 0x08 ],
 			[ 0x13F, 0xa5 ],
 		]
@@ -612,77 +557,23 @@ class Flashcart_DMG_MMSA(Flashcart):
 		self.UnlockForWriting()
 
 		# Erase Chip
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0x80 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0x10 ],
-			[ 0x13F, 0xA5 ]
-		]
-		self.CartWrite(cmds)
-		lives = 10
-		while lives > 0:
+		cmds = []
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x5555, 0x80)
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x5555, 0x10)
+		self.CartWrite(cmds)
+		def progress():
 			if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"ERASE", "time_start":time_start, "abortable":False})
-			sr = ord(self.CartRead(0))
-			dprint("Status Register Check: 0x{:X} & 0x{:X} == 0x{:X}? {:s}".format(sr, 0x80, 0x80, str(sr == 0x80)))
-			if sr == 0x80: break
-			time.sleep(0.5)
-			lives -= 1
-		if lives == 0:
+		if not self._wait_ready("chip_erase", progress):
 			raise Exception("Chip Erase Timeout Error")
 
 		# Reset flash to read mode
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x40 ],
-			[ 0x126, 0x80 ],
-			[ 0x127, 0xF0 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-
+		cmds = self._flash_command(0x4080, 0xF0)
 		# Map all the flash memory before writing
-		cmds = [
+		cmds += [
 			[ 0x120, 0x04 ],
 			[ 0x13F, 0xa5 ],
 		]
@@ -696,99 +587,36 @@ class Flashcart_DMG_MMSA(Flashcart):
 		time_start = time.time()
 		if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"UNLOCK", "time_start":time_start, "abortable":False})
 		
-		self.CartWrite([[ 0x2100, 0x01 ]])
-		# Enable Flash Chip Access
 		cmds = [
+			[ 0x2100, 0x01 ],
+			# Enable Flash Chip Access
 			[ 0x120, 0x09 ],
 			[ 0x121, 0xAA ],
 			[ 0x122, 0x55 ],
 			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		# Re-Enable writes to MBC registers
-		cmds = [
+			# Re-Enable writes to MBC registers
 			[ 0x120, 0x11 ],
 			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		# Disable flash chip protection
-		cmds = [
+			# Disable flash chip protection
 			[ 0x120, 0x0A ],
 			[ 0x125, 0x62 ],
 			[ 0x126, 0x04 ],
 			[ 0x13F, 0xA5 ],
 			[ 0x120, 0x02 ],
 			[ 0x13F, 0xA5 ],
+			[ 0x2100, 0x01 ],
 		]
-		self.CartWrite(cmds)
-		self.CartWrite([[ 0x2100, 0x01 ]])
-		
 		# Suspend potential previous erase
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x00 ],
-			[ 0x126, 0x00 ],
-			[ 0x127, 0xB0 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		
+		cmds += self._flash_command(0x0000, 0xB0)
 		# Unlock Hidden Sector
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0x60 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x55 ],
-			[ 0x126, 0x55 ],
-			[ 0x127, 0xAA ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x2A ],
-			[ 0x126, 0xAA ],
-			[ 0x127, 0x55 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		cmds = [
-			[ 0x120, 0x0F ],
-			[ 0x125, 0x00 ],
-			[ 0x126, 0x00 ],
-			[ 0x127, 0x40 ],
-			[ 0x13F, 0xA5 ],
-		]
-		self.CartWrite(cmds)
-		lives = 10
-		while lives > 0:
-			sr = ord(self.CartRead(0))
-			dprint("Status Register Check: 0x{:X} & 0x{:X} == 0x{:X}? {:s}".format(sr, 0x80, 0x80, str(sr == 0x80)))
-			if sr == 0x80: break
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x5555, 0x60)
+		cmds += self._flash_command(0x5555, 0xAA)
+		cmds += self._flash_command(0x2AAA, 0x55)
+		cmds += self._flash_command(0x0000, 0x40)
+		self.CartWrite(cmds)
+		def progress():
 			if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR({"action":"UNLOCK", "time_start":time_start, "abortable":False})
-			time.sleep(0.5)
-			lives -= 1
-		if lives == 0:
+		if not self._wait_ready("unlock", progress):
 			raise Exception("Hidden Sector Unlock Timeout Error")
@@ -17,6 +17,7 @@ class DMG_MBC:
 	RAM_BANK_SIZE = 0
 	ROM_BANK_NUM = 0
 	CURRENT_ROM_BANK = 0
+	CHECKSUM_DATA_LENGTH = 0 # bytes from the start of the ROM that CalcChecksum() needs in addition to the streaming digest
 
 	def __init__(self, args=None, cart_write_fncptr=None, cart_read_fncptr=None, clk_toggle_fncptr=None):
 		if args is None: args = {}
@@ -103,13 +104,12 @@ class DMG_MBC:
 	def GetROMSize(self):
 		return self.ROM_BANK_SIZE * self.ROM_BANK_NUM
 	
-	def CalcChecksum(self, buffer):
-		chk = 0
-		for i in range(0, len(buffer), 2):
-			if i != 0x14E:
-				chk = chk + buffer[i + 1]
-				chk = chk + buffer[i]
-		return chk & 0xFFFF
+	def GetChecksumOffsets(self, size):
+		return ( 0x14E, 0x14F )
+	
+	def CalcChecksum(self, buffer, digest=None):
+		if digest is not None: return digest.GetDMGChecksum()
+		return Util.DMGChecksum(memoryview(buffer), offsets=self.GetChecksumOffsets(len(buffer))).Get()
 
 	def EnableMapper(self):
 		return True
@@ -543,16 +543,9 @@ class DMG_MMM01(DMG_MBC):
 	def GetName(self):
 		return "MMM01"
 
-	def CalcChecksum(self, buffer):
-		chk = 0
-		temp_data = buffer[0:-0x8000]
-		temp_menu = buffer[-0x8000:]
-		temp_dump = temp_menu + temp_data
-		for i in range(0, len(temp_dump), 2):
-			if i != 0x14E:
-				chk = chk + temp_dump[i + 1]
-				chk = chk + temp_dump[i]
-		return chk & 0xFFFF
+	def GetChecksumOffsets(self, size):
+		# The menu in the last 32 KB is checksummed as if it was at the start of the ROM
+		return ( max(0, size - 0x8000) + 0x14E, max(0, size - 0x8000) + 0x14F )
 
 	def ResetBeforeBankChange(self, index):
 		return ((index % 0x20) == 0)
@@ -585,6 +578,8 @@ class DMG_GBD(DMG_MBC5):
 		return "GBD"
 
 class DMG_GMMC1(DMG_MBC5):
+	CHECKSUM_DATA_LENGTH = 0x20180
+
 	def GetName(self):
 		return "G-MMC1"
 
@@ -699,7 +694,7 @@ class DMG_GMMC1(DMG_MBC5):
 		self.CartWrite(commands)
 		return self.CartRead(0, 128)
 
-	def CalcChecksum(self, buffer):
+	def CalcChecksum(self, buffer, digest=None):
 		header = RomFileDMG(buffer[:0x180]).GetHeader()
 		if header["game_title"] == "NP M-MENU MENU":
 			target_chk_value = 0x19E8
@@ -710,7 +705,7 @@ class DMG_GMMC1(DMG_MBC5):
 			else:
 				return target_chk_value
 		else:
-			return super().CalcChecksum(buffer=buffer)
+			return super().CalcChecksum(buffer=buffer, digest=digest)
 
 class DMG_M161(DMG_MBC):
 	def GetName(self):
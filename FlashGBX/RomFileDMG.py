@@ -33,16 +33,12 @@ class RomFileDMG:
 		return checksum
 	
 	def CalcChecksumGlobal(self, fix=False):
-		checksum = 0
-		for i in range(0, len(self.ROMFILE), 2):
-			if i != 0x14E:
-				checksum = checksum + self.ROMFILE[i + 1]
-				checksum = checksum + self.ROMFILE[i]
+		checksum = Util.DMGChecksum(memoryview(self.ROMFILE)).Get()
 		
 		if fix:
 			self.ROMFILE[0x14E] = checksum >> 8
 			self.ROMFILE[0x14F] = checksum & 0xFF
-		return checksum & 0xFFFF
+		return checksum
 	
 	def FixHeader(self):
 		self.CalcChecksumHeader(True)
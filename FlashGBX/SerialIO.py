@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+# FlashGBX
+# Author: Lesserkuma (github.com/lesserkuma)
+
+import threading, time, struct, gzip, json, bisect
+import serial
+from serial import SerialException
+from .Util import dprint
+
+class SerialIO:
+	RING_SIZE = 0x100000
+	POLL_TIMEOUT = 0.05
+	DEVICE = None
+	THREAD = None
+	ERROR = None
+
+	def __init__(self, device, ring_size=None):
+		if ring_size is not None: self.RING_SIZE = ring_size
+		self.DEVICE = device
+		self.RING = bytearray(self.RING_SIZE)
+		self.HEAD = 0 # next byte to hand out
+		self.FILL = 0 # bytes waiting in the ring
+		self.GENERATION = 0
+		self.COND = threading.Condition()
+		self.RUNNING = True
+		self.RESETTING = False
+		self.IDLE = False
+		self.TIMEOUT = device.timeout
+		self.DEVICE.timeout = self.POLL_TIMEOUT
+		self.THREAD = threading.Thread(target=self._run, name="SerialIO", daemon=True)
+		self.THREAD.start()
+
+	def _run(self):
+		view = memoryview(self.RING)
+		while self.RUNNING:
+			with self.COND:
+				while self.RUNNING and (self.RESETTING or self.FILL == self.RING_SIZE):
+					self.IDLE = self.RESETTING
+					self.COND.notify_all()
+					self.COND.wait(self.POLL_TIMEOUT)
+				self.IDLE = False
+				if not self.RUNNING: break
+				tail = (self.HEAD + self.FILL) % self.RING_SIZE
+				space = min(self.RING_SIZE - self.FILL, self.RING_SIZE - tail)
+				generation = self.GENERATION
+
+			try:
+				count = max(1, min(self.DEVICE.in_waiting, space))
+				received = self.DEVICE.readinto(view[tail:tail+count])
+			except (SerialException, OSError, TypeError, AttributeError) as e:
+				with self.COND:
+					if self.RUNNING:
+						dprint("Serial I/O thread stopped:", str(e))
+						self.ERROR = e
+					self.RUNNING = False
+					self.COND.notify_all()
+				break
+
+			if received == 0: continue
+			with self.COND:
+				# Drop anything that was in flight while the input buffer was reset
+				if generation != self.GENERATION: continue
+				self.FILL += received
+				self.COND.notify_all()
+
+	def _consume(self, view):
+		# Copies up to len(view) waiting bytes; must be called with COND held
+		count = min(len(view), self.FILL)
+		first = min(count, self.RING_SIZE - self.HEAD)
+		view[:first] = self.RING[self.HEAD:self.HEAD+first]
+		if count > first:
+			view[first:count] = self.RING[0:count-first]
+		self.HEAD = (self.HEAD + count) % self.RING_SIZE
+		self.FILL -= count
+		return count
+
+	def readinto(self, view):
+		if not isinstance(view, memoryview): view = memoryview(view)
+		count = len(view)
+		received = 0
+		deadline = None if self.TIMEOUT is None else time.time() + self.TIMEOUT
+		with self.COND:
+			while True:
+				if self.FILL > 0:
+					received += self._consume(view[received:])
+					self.COND.notify_all()
+				if received == count: break
+				if not self.RUNNING:
+					if self.ERROR is not None and received == 0: raise SerialException(str(self.ERROR))
+					break
+				if deadline is None:
+					self.COND.wait()
+				else:
+					remaining = deadline - time.time()
+					if remaining <= 0: break
+					self.COND.wait(remaining)
+		return received
+
+	def read(self, count=1):
+		buffer = bytearray(count)
+		received = self.readinto(buffer)
+		return bytes(buffer[:received])
+
+	def write(self, data):
+		return self.DEVICE.write(data)
+
+	def flush(self):
+		self.DEVICE.flush()
+
+	@property
+	def in_waiting(self):
+		with self.COND:
+			fill = self.FILL
+		if not self.RUNNING: return fill
+		return fill + self.DEVICE.in_waiting
+
+	def reset_input_buffer(self):
+		# Park the reader thread first so nothing read before the flush can end up in the ring
+		with self.COND:
+			self.GENERATION += 1
+			self.RESETTING = True
+			self.IDLE = False
+			self.COND.notify_all()
+		if hasattr(self.DEVICE, "cancel_read"): self.DEVICE.cancel_read()
+		with self.COND:
+			while self.RUNNING and not self.IDLE and self.THREAD is not threading.current_thread():
+				self.COND.wait(self.POLL_TIMEOUT)
+			self.HEAD = 0
+			self.FILL = 0
+			if self.RUNNING: self.DEVICE.reset_input_buffer()
+			self.RESETTING = False
+			self.COND.notify_all()
+
+	def reset_output_buffer(self):
+		self.DEVICE.reset_output_buffer()
+
+	@property
+	def timeout(self):
+		return self.TIMEOUT
+
+	@timeout.setter
+	def timeout(self, value):
+		self.TIMEOUT = value
+
+	@property
+	def port(self):
+		return self.DEVICE.port
+
+	@property
+	def baudrate(self):
+		return self.DEVICE.baudrate
+
+	def isOpen(self):
+		return self.RUNNING and self.DEVICE.isOpen()
+
+	@property
+	def is_open(self):
+		return self.isOpen()
+
+	def close(self):
+		with self.COND:
+			self.RUNNING = False
+			self.COND.notify_all()
+		if self.THREAD is not None and self.THREAD is not threading.current_thread():
+			self.THREAD.join(1)
+		self.DEVICE.close()
+
+
+class SerialTraceRecorder:
+	# Serial factory that logs every opened port to one trace file
+	FILE = None
+	TIME_START = 0
+	MAGIC = b"FGBXTRC1"
+	RECORD = struct.Struct(">cdI")
+
+	def __init__(self, path):
+		self.FILE = gzip.open(path, "wb")
+		self.FILE.write(self.MAGIC)
+		self.LOCK = threading.Lock()
+		self.TIME_START = time.perf_counter()
+
+	def __call__(self, port, baudrate, timeout=None):
+		dev = serial.Serial(port, baudrate, timeout=timeout)
+		self.Log(b"O", json.dumps({"port":port, "baudrate":baudrate}).encode("utf-8"))
+		return SerialRecording(dev, self)
+
+	def Log(self, kind, data=b""):
+		with self.LOCK:
+			if self.FILE is None: return
+			self.FILE.write(self.RECORD.pack(kind, time.perf_counter() - self.TIME_START, len(data)))
+			self.FILE.write(data)
+
+	def Close(self):
+		with self.LOCK:
+			if self.FILE is None: return
+			self.FILE.close()
+			self.FILE = None
+
+class SerialRecording:
+	DEVICE = None
+	RECORDER = None
+
+	def __init__(self, device, recorder):
+		self.DEVICE = device
+		self.RECORDER = recorder
+
+	def write(self, data):
+		self.RECORDER.Log(b"W", bytes(data))
+		return self.DEVICE.write(data)
+
+	def read(self, count=1):
+		data = self.DEVICE.read(count)
+		if len(data) > 0: self.RECORDER.Log(b"R", data)
+		return data
+
+	def readinto(self, view):
+		received = self.DEVICE.readinto(view)
+		if received > 0: self.RECORDER.Log(b"R", bytes(view[:received]))
+		return received
+
+	def reset_input_buffer(self):
+		self.RECORDER.Log(b"I")
+		self.DEVICE.reset_input_buffer()
+
+	def close(self):
+		self.RECORDER.Log(b"C")
+		self.DEVICE.close()
+
+	def __getattr__(self, name):
+		return getattr(self.DEVICE, name)
+
+	def __setattr__(self, name, value):
+		if name in ("DEVICE", "RECORDER"):
+			object.__setattr__(self, name, value)
+		else:
+			setattr(self.DEVICE, name, value)
+
+class SerialTrace:
+	PREFIX = "replay:"
+	TRACES = {}
+
+	def __init__(self, path):
+		self.PATH = path
+		self.SESSIONS = []
+		with gzip.open(path, "rb") as f:
+			if f.read(len(SerialTraceRecorder.MAGIC)) != SerialTraceRecorder.MAGIC:
+				raise Exception("Not a serial trace file: {:s}".format(path))
+			session = None
+			while True:
+				header = f.read(SerialTraceRecorder.RECORD.size)
+				if len(header) < SerialTraceRecorder.RECORD.size: break
+				(kind, timestamp, length) = SerialTraceRecorder.RECORD.unpack(header)
+				data = f.read(length)
+				if kind == b"O":
+					session = { "info":json.loads(data.decode("utf-8")), "time":timestamp, "writes":bytearray(), "reads":bytearray(), "read_times":[], "read_offsets":[], "marks":[] }
+					self.SESSIONS.append(session)
+				elif session is None:
+					continue
+				elif kind == b"W":
+					session["writes"] += data
+				elif kind == b"R":
+					session["read_offsets"].append(len(session["reads"]))
+					session["read_times"].append(timestamp - session["time"])
+					session["reads"] += data
+				elif kind == b"I":
+					session["marks"].append(len(session["reads"]))
+		self.NEXT = 0
+
+	@classmethod
+	def Open(cls, port, baudrate=None, timeout=None, realtime=False):
+		# Ports named "replay:<trace file>" are served from a recorded session; each open consumes the next one
+		path = port[len(cls.PREFIX):]
+		if path not in cls.TRACES: cls.TRACES[path] = SerialTrace(path)
+		trace = cls.TRACES[path]
+		if trace.NEXT >= len(trace.SESSIONS): raise SerialException("No more recorded sessions in {:s}".format(path))
+		session = trace.SESSIONS[trace.NEXT]
+		trace.NEXT += 1
+		return SerialReplay(session, timeout=timeout, realtime=realtime)
+
+class SerialReplay:
+	MISMATCHES = 0
+
+	def __init__(self, session, timeout=None, realtime=False):
+		self.SESSION = session
+		self.port = SerialTrace.PREFIX + str(session["info"]["port"])
+		self.baudrate = session["info"]["baudrate"]
+		self.timeout = timeout
+		self.REALTIME = realtime
+		self.TIME_START = time.perf_counter()
+		self.READ_POS = 0
+		self.WRITE_POS = 0
+		self.MARK = 0
+		self.OPEN = True
+		self.CANCELLED = False
+		self.COND = threading.Condition()
+
+	def _limit(self):
+		marks = self.SESSION["marks"]
+		if self.MARK < len(marks): return marks[self.MARK]
+		return len(self.SESSION["reads"])
+
+	def _available(self):
+		limit = self._limit()
+		if self.REALTIME:
+			# Only hand out chunks whose recorded arrival time has passed
+			elapsed = time.perf_counter() - self.TIME_START
+			i = bisect.bisect_right(self.SESSION["read_times"], elapsed)
+			if i < len(self.SESSION["read_offsets"]): limit = min(limit, self.SESSION["read_offsets"][i])
+		return max(0, limit - self.READ_POS)
+
+	def write(self, data):
+		expected = self.SESSION["writes"][self.WRITE_POS:self.WRITE_POS+len(data)]
+		if expected != data:
+			if self.MISMATCHES == 0: dprint("Replay diverges from the recorded writes at offset 0x{:X}".format(self.WRITE_POS))
+			self.MISMATCHES += 1
+		self.WRITE_POS += len(data)
+		return len(data)
+
+	def flush(self):
+		pass
+
+	def readinto(self, view):
+		count = len(view)
+		received = 0
+		deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+		with self.COND:
+			self.CANCELLED = False
+			while self.OPEN and not self.CANCELLED:
+				available = min(self._available(), count - received)
+				if available > 0:
+					view[received:received+available] = self.SESSION["reads"][self.READ_POS:self.READ_POS+available]
+					self.READ_POS += available
+					received += available
+				if received == count: break
+				wait = 0.001 if self.REALTIME else None
+				if deadline is not None:
+					remaining = deadline - time.perf_counter()
+					if remaining <= 0: break
+					wait = remaining if wait is None else min(wait, remaining)
+				self.COND.wait(wait)
+		return received
+
+	def read(self, count=1):
+		buffer = bytearray(count)
+		received = self.readinto(buffer)
+		return bytes(buffer[:received])
+
+	@property
+	def in_waiting(self):
+		with self.COND:
+			return self._available()
+
+	def reset_input_buffer(self):
+		with self.COND:
+			# Skip whatever the recording discarded at this point
+			self.READ_POS = max(self.READ_POS, self._limit())
+			self.MARK += 1
+			self.COND.notify_all()
+
+	def reset_output_buffer(self):
+		pass
+
+	def cancel_read(self):
+		with self.COND:
+			self.CANCELLED = True
+			self.COND.notify_all()
+
+	def isOpen(self):
+		return self.OPEN
+
+	@property
+	def is_open(self):
+		return self.OPEN
+
+	def close(self):
+		with self.COND:
+			self.OPEN = False
+			self.COND.notify_all()
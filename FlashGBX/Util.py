@@ -2,7 +2,7 @@
 # FlashGBX
 # Author: Lesserkuma (github.com/lesserkuma)
 
-import math, time, datetime, copy, configparser, threading, statistics, os, platform, traceback
+import math, time, datetime, copy, configparser, threading, statistics, os, platform, traceback, json, hashlib, zlib, queue
 from enum import Enum
 
 # Common constants
@@ -10,6 +10,7 @@ APPNAME = "FlashGBX"
 VERSION_PEP440 = "3.0"
 VERSION = "v{:s}".format(VERSION_PEP440)
 DEBUG = False
+CONFIG_PATH = None
 
 AGB_Header_ROM_Sizes = [ "1 MB", "2 MB", "4 MB", "8 MB", "16 MB", "32 MB", "64 MB", "128 MB", "256 MB" ]
 AGB_Header_ROM_Sizes_Map = [ 0x100000, 0x200000, 0x400000, 0x800000, 0x1000000, 0x2000000, 0x4000000, 0x8000000, 0x10000000 ]
@@ -42,7 +43,9 @@ class IniSettings():
 	FILENAME = ""
 	SETTINGS = None
 	MAIN_SECTION = "General"
+	LOCK = threading.RLock() # every write rewrites the whole file, so all instances take turns
 	def __init__(self, path="", ini="", main_section="General"):
+		self.MAIN_SECTION = main_section
 		if path != "":
 			try:
 				if not os.path.isdir(os.path.dirname(path)):
@@ -70,15 +73,13 @@ class IniSettings():
 			self.SETTINGS = configparser.ConfigParser()
 			self.SETTINGS.read_string(ini)
 			self.SETTINGS.optionxform = str
-		
-		self.MAIN_SECTION = main_section
 	
 	def Reload(self):
 		if self.SETTINGS is None: return
 		if self.FILENAME is not False:
-			with open(self.FILENAME, "r", encoding="utf-8") as f:
+			with self.LOCK, open(self.FILENAME, "r", encoding="utf-8") as f:
 				self.SETTINGS.read_file(f)
-		if len(self.SETTINGS.sections()) == 0:
+		if not self.SETTINGS.has_section(self.MAIN_SECTION):
 			self.SETTINGS.add_section(self.MAIN_SECTION)
 	
 	def value(self, key, default=None): return self.GetValue(key, default)
@@ -93,20 +94,22 @@ class IniSettings():
 	def setValue(self, key, value): self.SetValue(key, value)
 	def SetValue(self, key, value):
 		if self.SETTINGS is None: return None
-		self.Reload()
-		self.SETTINGS[self.MAIN_SECTION][key] = value
-		dprint("Updating settings:", key, "=", value)
-		if self.FILENAME is not False:
-			with open(self.FILENAME, "w", encoding="utf-8") as f:
-				self.SETTINGS.write(f)
+		with self.LOCK:
+			self.Reload()
+			self.SETTINGS[self.MAIN_SECTION][key] = value
+			dprint("Updating settings:", key, "=", value)
+			if self.FILENAME is not False:
+				with open(self.FILENAME, "w", encoding="utf-8") as f:
+					self.SETTINGS.write(f)
 	
 	def clear(self): self.Clear()
 	def Clear(self):
 		if self.SETTINGS is None: return None
-		self.SETTINGS.clear()
-		if self.FILENAME is not False:
-			with open(self.FILENAME, "w", encoding="utf-8") as f:
-				self.SETTINGS.write(f)
+		with self.LOCK:
+			self.SETTINGS.clear()
+			if self.FILENAME is not False:
+				with open(self.FILENAME, "w", encoding="utf-8") as f:
+					self.SETTINGS.write(f)
 
 class Progress():
 	MUTEX = threading.Lock()
@@ -232,6 +235,565 @@ class Progress():
 		finally:
 			self.MUTEX.release()
 
+class TransferTuner():
+	SIZES = [ 0x40, 0x80, 0x100, 0x200, 0x400, 0x800, 0x1000, 0x2000 ]
+	PROBE_INTERVAL = 16 # successful chunks before trying a neighbouring size
+	ERROR_WEIGHT = 0.25
+	ERROR_DECAY = 0.5
+	SPEED_WEIGHT = 0.2
+	SETTINGS = None
+	KEY = ""
+	
+	def __init__(self, device_key, default=0x200, max_size=0x2000):
+		self.SIZES = [ s for s in self.SIZES if s <= max_size ]
+		self.KEY = "max_length_{:d}".format(self.SIZES[-1])
+		self.STATS = { s:{"speed":0, "errors":0} for s in self.SIZES }
+		self.STREAK = 0
+		
+		path = ""
+		if CONFIG_PATH is not None: path = CONFIG_PATH + "/transfer.ini"
+		self.SETTINGS = IniSettings(path=path, main_section=device_key)
+		try:
+			size = int(self.SETTINGS.value(self.KEY, default=default))
+		except (ValueError, TypeError):
+			size = default
+		self.INDEX = self._index(size)
+		dprint("Transfer size for “{:s}” starts at 0x{:X}".format(device_key, self.SIZES[self.INDEX]))
+	
+	def _index(self, size):
+		index = 0
+		for i in range(0, len(self.SIZES)):
+			if self.SIZES[i] <= size: index = i
+		return index
+	
+	def _score(self, index):
+		return self.STATS[self.SIZES[index]]["speed"]
+	
+	def Get(self):
+		return self.SIZES[self.INDEX]
+	
+	def Report(self, ok, length=0, elapsed=0):
+		stats = self.STATS[self.SIZES[self.INDEX]]
+		if not ok:
+			stats["errors"] += (1 - stats["errors"]) * self.ERROR_WEIGHT
+			stats["speed"] *= 1 - self.SPEED_WEIGHT
+			self.STREAK = 0
+			if self.INDEX > 0:
+				self.INDEX -= 1
+				dprint("Short read, lowering the transfer size to 0x{:X}".format(self.SIZES[self.INDEX]))
+			return self.Get()
+		
+		stats["errors"] *= 1 - self.ERROR_WEIGHT
+		if elapsed > 0:
+			speed = length / elapsed
+			if stats["speed"] == 0:
+				stats["speed"] = speed
+			else:
+				stats["speed"] += (speed - stats["speed"]) * self.SPEED_WEIGHT
+		
+		self.STREAK += 1
+		if self.STREAK < self.PROBE_INTERVAL: return self.Get()
+		self.STREAK = 0
+		
+		# Sizes that haven't been visited for a while get another chance
+		for (size, other) in self.STATS.items():
+			if size != self.SIZES[self.INDEX]: other["errors"] *= self.ERROR_DECAY
+		
+		candidates = [ i for i in (self.INDEX - 1, self.INDEX, self.INDEX + 1) if 0 <= i < len(self.SIZES) ]
+		upper = self.INDEX + 1
+		if upper < len(self.SIZES) and self.STATS[self.SIZES[upper]]["speed"] == 0 and self.STATS[self.SIZES[upper]]["errors"] < 0.5:
+			index = upper
+		else:
+			index = max(candidates, key=self._score)
+		if index != self.INDEX:
+			dprint("Changing the transfer size from 0x{:X} to 0x{:X}".format(self.SIZES[self.INDEX], self.SIZES[index]))
+			self.INDEX = index
+		return self.Get()
+	
+	def Save(self):
+		sampled = [ i for i in range(0, len(self.SIZES)) if self.STATS[self.SIZES[i]]["speed"] > 0 ]
+		if len(sampled) == 0: return
+		best = max(sampled, key=self._score)
+		self.SETTINGS.setValue(self.KEY, str(self.SIZES[best]))
+
+class StatusPoller():
+	# Waits for a flash operation with exponential backoff, starting from the typical or previously observed duration
+	LEARNED = {}
+	LOCK = threading.Lock()
+	MIN_INTERVAL = 0.001
+	MAX_INTERVAL = 0.5
+	FIRST_POLL = 0.75 # share of the expected duration to wait before the first status check
+	LEARN_WEIGHT = 0.25
+	
+	def __init__(self, key=None, typical=None, timeout=None, max_interval=None, cancel_fncptr=None, progress_fncptr=None):
+		self.KEY = key
+		self.TYPICAL = typical
+		self.TIMEOUT = timeout
+		self.CANCEL_FNCPTR = cancel_fncptr
+		self.PROGRESS_FNCPTR = progress_fncptr
+		if max_interval is not None: self.MAX_INTERVAL = max_interval
+	
+	def Expected(self):
+		with self.LOCK:
+			learned = self.LEARNED.get(self.KEY)
+		if learned is not None: return learned
+		return self.TYPICAL
+	
+	def Wait(self, check_fncptr):
+		# Returns True once the check passes, False on timeout and None if canceled
+		expected = self.Expected()
+		if expected is not None and expected > 0:
+			delay = expected * self.FIRST_POLL
+			interval = min(max(self.MIN_INTERVAL, expected / 16), self.MAX_INTERVAL)
+		else:
+			delay = 0
+			interval = self.MIN_INTERVAL
+		
+		time_start = time.time()
+		last_check = None
+		while True:
+			if delay > 0: time.sleep(delay)
+			if check_fncptr():
+				# The operation finished somewhere between the last two checks
+				elapsed = time.time() - time_start
+				if last_check is None:
+					self._learn(elapsed / 2, self.LEARN_WEIGHT * 2)
+				else:
+					self._learn((last_check + elapsed) / 2, self.LEARN_WEIGHT)
+				return True
+			elapsed = time.time() - time_start
+			last_check = elapsed
+			if self.CANCEL_FNCPTR is not None and self.CANCEL_FNCPTR():
+				dprint("Waiting for “{:s}” was canceled after {:.3f} seconds".format(str(self.KEY), elapsed))
+				return None
+			if self.TIMEOUT is not None and elapsed >= self.TIMEOUT:
+				dprint("Waiting for “{:s}” timed out after {:.3f} seconds".format(str(self.KEY), elapsed))
+				return False
+			if self.PROGRESS_FNCPTR is not None: self.PROGRESS_FNCPTR()
+			delay = interval
+			if self.TIMEOUT is not None: delay = min(delay, max(0, self.TIMEOUT - elapsed))
+			interval = min(interval * 2, self.MAX_INTERVAL)
+	
+	def _learn(self, duration, weight):
+		if self.KEY is None: return
+		with self.LOCK:
+			learned = self.LEARNED.get(self.KEY)
+			if learned is None:
+				learned = duration
+			else:
+				learned += (duration - learned) * weight
+			self.LEARNED[self.KEY] = learned
+		dprint("Completed “{:s}” after about {:.3f} seconds, now expecting {:.3f} seconds".format(str(self.KEY), duration, learned))
+
+class DetectionCache():
+	# Remembers detection results of known cartridges, keyed by the ROM header hash and the raw flash ID
+	FILENAME = "detect_cache.json"
+	MAX_ENTRIES = 256
+	ENTRIES = None
+	PATH = None
+	LOCK = threading.Lock()
+	
+	@classmethod
+	def _load(cls):
+		path = ""
+		if CONFIG_PATH is not None and CONFIG_PATH != "": path = CONFIG_PATH + "/" + cls.FILENAME
+		if cls.ENTRIES is not None and cls.PATH == path: return
+		cls.PATH = path
+		cls.ENTRIES = {}
+		if path == "" or not os.path.exists(path): return
+		try:
+			with open(path, "r", encoding="utf-8") as f:
+				entries = json.load(f, object_hook=cls._decode)
+			if isinstance(entries, dict): cls.ENTRIES = entries
+		except (OSError, ValueError) as e:
+			dprint("Ignoring the detection cache:", str(e))
+	
+	@classmethod
+	def _save(cls):
+		if cls.PATH == "": return
+		try:
+			if not os.path.isdir(os.path.dirname(cls.PATH)):
+				os.makedirs(os.path.dirname(cls.PATH))
+			with open(cls.PATH + ".tmp", "w", encoding="utf-8") as f:
+				json.dump(cls.ENTRIES, f, default=cls._encode)
+			os.replace(cls.PATH + ".tmp", cls.PATH)
+		except OSError as e:
+			dprint("Couldn’t write the detection cache:", str(e))
+	
+	@staticmethod
+	def _encode(value):
+		if isinstance(value, (bytes, bytearray)): return { "__bytes__":value.hex() }
+		raise TypeError("Can’t store {:s} in the detection cache".format(type(value).__name__))
+	
+	@staticmethod
+	def _decode(value):
+		if len(value) == 1 and "__bytes__" in value: return bytearray.fromhex(value["__bytes__"])
+		return value
+	
+	@staticmethod
+	def Key(header_hash, flash_id):
+		return "{:s}:{:s}".format(header_hash, bytes(flash_id).hex())
+	
+	@classmethod
+	def Find(cls, header_hash):
+		# Most recently used entries come first
+		with cls.LOCK:
+			cls._load()
+			keys = [ k for k in cls.ENTRIES if k.split(":")[0] == header_hash ]
+			return [ (k, copy.deepcopy(cls.ENTRIES[k])) for k in reversed(keys) ]
+	
+	@classmethod
+	def Store(cls, key, entry):
+		with cls.LOCK:
+			cls._load()
+			cls.ENTRIES.pop(key, None)
+			cls.ENTRIES[key] = copy.deepcopy(entry)
+			while len(cls.ENTRIES) > cls.MAX_ENTRIES:
+				del(cls.ENTRIES[next(iter(cls.ENTRIES))])
+			cls._save()
+	
+	@classmethod
+	def Entries(cls):
+		with cls.LOCK:
+			cls._load()
+			return [ (k, copy.deepcopy(cls.ENTRIES[k])) for k in reversed(list(cls.ENTRIES)) ]
+	
+	@classmethod
+	def Get(cls, key):
+		with cls.LOCK:
+			cls._load()
+			if key not in cls.ENTRIES: return None
+			cls.ENTRIES[key] = cls.ENTRIES.pop(key)
+			cls._save()
+			return copy.deepcopy(cls.ENTRIES[key])
+	
+	@classmethod
+	def Touch(cls, key):
+		with cls.LOCK:
+			cls._load()
+			if key not in cls.ENTRIES: return
+			cls.ENTRIES[key] = cls.ENTRIES.pop(key)
+			cls._save()
+	
+	@classmethod
+	def Remove(cls, key):
+		with cls.LOCK:
+			cls._load()
+			if cls.ENTRIES.pop(key, None) is not None: cls._save()
+
+class CFICache(DetectionCache):
+	# Parsed CFI data of known flash chips, keyed by the command set and a hash of the flash ID response
+	FILENAME = "cfi_cache.json"
+	ENTRIES = None
+	PATH = None
+	LOCK = threading.Lock()
+
+class MemoryProbe():
+	# Answers questions about save data while reading only as much of it as needed; every byte that
+	# decides an answer is compared, but reading stops at the first difference
+	LENGTH = 0x40 # bytes per read request
+	ROUND = 0x400 # bytes compared in the first round; each further round compares four times as many
+	
+	def __init__(self, read_fncptr, size):
+		self.READ_FNCPTR = read_fncptr # reads LENGTH bytes at each of a list of offsets
+		self.SIZE = size
+		self.CACHE = {}
+	
+	def _rounds(self, start, end):
+		length = self.ROUND
+		while start < end:
+			yield (start, min(end, start + length))
+			start += length
+			length *= 4
+	
+	def _fetch(self, ranges):
+		# Reads all blocks of the given ranges that aren't known yet in one go
+		missing = set()
+		for (start, end) in ranges:
+			for o in range(start - start % self.LENGTH, end, self.LENGTH):
+				if o not in self.CACHE: missing.add(o)
+		if len(missing) == 0: return True
+		missing = sorted(missing)
+		chunks = self.READ_FNCPTR(missing, self.LENGTH)
+		if chunks is False: return False
+		self.CACHE.update(zip(missing, chunks))
+		return True
+	
+	def _get(self, start, end):
+		first = start - start % self.LENGTH
+		data = b''.join(self.CACHE[o] for o in range(first, end, self.LENGTH))
+		return data[start-first:end-first]
+	
+	def IsMirrored(self, period):
+		# True if data[0:period] equals data[period:period*2]
+		if period * 2 > self.SIZE: return False
+		for (start, end) in self._rounds(0, period):
+			if not self._fetch([ (start, end), (start + period, end + period) ]): return None
+			if self._get(start, end) != self._get(start + period, end + period): return False
+		return True
+	
+	def FindSize(self, min_size=0x20):
+		# Same result as find_size() on the full data
+		offset = self.SIZE
+		while offset >= min_size:
+			offset = int(offset / 2)
+			mirrored = self.IsMirrored(offset)
+			if mirrored is None: return 0
+			if not mirrored:
+				offset = offset * 2
+				break
+		return offset
+	
+	def IsUniform(self, start, end, value=None):
+		end = min(end, self.SIZE)
+		if end <= start: return False
+		for (a, b) in self._rounds(start, end):
+			if not self._fetch([ (a, b) ]): return False
+			data = self._get(a, b)
+			if value is None: value = data[0]
+			if data.count(value) != len(data): return False
+		return True
+	
+	def Equals(self, other, start, end):
+		if end > min(self.SIZE, other.SIZE) or end <= start: return False
+		for (a, b) in self._rounds(start, end):
+			if not self._fetch([ (a, b) ]) or not other._fetch([ (a, b) ]): return False
+			if self._get(a, b) != other._get(a, b): return False
+		return True
+
+class DMGChecksum():
+	# Game Boy global checksum: 16-bit sum of all ROM bytes except the checksum itself; bytes are summed in bulk
+	OFFSETS = ( 0x14E, 0x14F )
+
+	def __init__(self, data=None, offsets=None):
+		if offsets is not None: self.OFFSETS = offsets # where the excluded checksum bytes are within the data
+		self.SIZE = 0
+		self.SUM = 0
+		if data is not None: self.Update(data)
+	
+	def Update(self, data):
+		chk = sum(data)
+		for offset in self.OFFSETS:
+			if self.SIZE <= offset < self.SIZE + len(data): chk -= data[offset - self.SIZE]
+		self.SUM += chk
+		self.SIZE += len(data)
+	
+	def Get(self):
+		return self.SUM & 0xFFFF
+
+class Digest():
+	# Hashes dump data chunk by chunk as it arrives so the finished dump doesn't need to be read again
+	def __init__(self, algorithms=None, dmg_checksum=None):
+		if algorithms is None: algorithms = []
+		self.SIZE = 0
+		self.CRC32 = 0
+		self.SHA1 = hashlib.sha1()
+		self.HASHES = { name:hashlib.new(name) for name in algorithms }
+		self.DMG_CHECKSUM = dmg_checksum # a DMGChecksum instance to feed alongside the hashes
+	
+	def Update(self, data):
+		if len(data) == 0: return
+		self.CRC32 = zlib.crc32(data, self.CRC32)
+		self.SHA1.update(data)
+		for h in self.HASHES.values(): h.update(data)
+		if self.DMG_CHECKSUM is not None: self.DMG_CHECKSUM.Update(data)
+		self.SIZE += len(data)
+	
+	def Pad(self, size, value=0):
+		# Feeds filler bytes up to the given total size
+		while self.SIZE < size:
+			self.Update(bytes([value]) * min(size - self.SIZE, 0x100000))
+	
+	def GetCRC32(self):
+		return self.CRC32 & 0xFFFFFFFF
+	
+	def GetSHA1(self):
+		return self.SHA1.hexdigest()
+	
+	def GetHash(self, name):
+		return self.HASHES[name].hexdigest()
+	
+	def GetDMGChecksum(self):
+		return self.DMG_CHECKSUM.Get()
+
+class BufferPool():
+	# A few reusable transfer buffers that dump chunks are read into, so memory use doesn't grow with the cartridge size
+	COUNT = 4
+
+	def __init__(self, count=None):
+		if count is not None: self.COUNT = count
+		self.FREE = [ bytearray() for _ in range(self.COUNT) ]
+		self.COND = threading.Condition()
+	
+	def Get(self, size):
+		with self.COND:
+			while len(self.FREE) == 0: self.COND.wait()
+			buffer = self.FREE.pop()
+		if len(buffer) < size: buffer = bytearray(size)
+		return buffer
+	
+	def Release(self, buffer):
+		with self.COND:
+			self.FREE.append(buffer)
+			self.COND.notify()
+
+class DumpJournal():
+	# Keeps track of the chunks of a ROM dump that were written to the file so an interrupted dump can be resumed
+	SUFFIX = ".journal"
+	VERSION = 1
+
+	def __init__(self, path, params):
+		self.PATH = path
+		self.JOURNAL_PATH = path + self.SUFFIX
+		self.PARAMS = dict(params, version=self.VERSION)
+		self.ENTRIES = []
+		self.FILE = None
+	
+	def _read_entries(self):
+		try:
+			with open(self.JOURNAL_PATH, "r", encoding="utf-8") as f:
+				lines = f.read().splitlines()
+			if len(lines) == 0 or json.loads(lines[0]) != self.PARAMS: return []
+			entries = []
+			for line in lines[1:]:
+				try:
+					entries.append(json.loads(line))
+				except ValueError:
+					break # last line may be cut off
+			return entries
+		except (OSError, ValueError):
+			return []
+	
+	def Resume(self, header=None, digest=None):
+		# Returns the number of bytes at the start of the file that match the journal and can be kept
+		entries = self._read_entries()
+		pos = 0
+		try:
+			with open(self.PATH, "rb") as f:
+				if header is not None and f.read(len(header)) != header:
+					dprint("The existing file belongs to a different cartridge")
+					return 0
+				f.seek(0)
+				for entry in entries:
+					if entry["offset"] != pos: break
+					data = f.read(entry["length"])
+					if len(data) != entry["length"] or (zlib.crc32(data) & 0xFFFFFFFF) != entry["crc32"]: break
+					if digest is not None: digest.Update(data)
+					self.ENTRIES.append(entry)
+					pos += len(data)
+		except OSError:
+			return 0
+		dprint("Resuming the dump at 0x{:X} after {:d} verified chunk(s)".format(pos, len(self.ENTRIES)))
+		return pos
+	
+	def Start(self):
+		self.FILE = open(self.JOURNAL_PATH, "w", encoding="utf-8", buffering=1)
+		self.FILE.write(json.dumps(self.PARAMS) + "\n")
+		for entry in self.ENTRIES:
+			self.FILE.write(json.dumps(entry) + "\n")
+	
+	def Add(self, offset, data):
+		entry = { "offset":offset, "length":len(data), "crc32":zlib.crc32(data) & 0xFFFFFFFF }
+		self.ENTRIES.append(entry)
+		if self.FILE is not None: self.FILE.write(json.dumps(entry) + "\n")
+	
+	def Close(self):
+		if self.FILE is None: return
+		self.FILE.close()
+		self.FILE = None
+	
+	def Remove(self):
+		self.Close()
+		try:
+			os.remove(self.JOURNAL_PATH)
+		except OSError:
+			pass
+
+class FileWriter():
+	# Writes chunks to a file on its own thread so that slow storage doesn't hold up device I/O
+	FSYNC_POLICIES = [ "never", "close", "chunk" ]
+	DEPTH = 4
+
+	def __init__(self, path, size=None, offset=0, fsync="never", atomic=False, depth=None):
+		if depth is not None: self.DEPTH = depth
+		if fsync not in self.FSYNC_POLICIES: raise ValueError("Unknown fsync policy: {:s}".format(str(fsync)))
+		self.PATH = path
+		self.TEMP_PATH = path + ".tmp" if atomic else None # replaces the target only once everything was written
+		self.FSYNC = fsync
+		self.POS = offset
+		self.ERROR = None
+		if offset > 0:
+			self.FILE = open(path, "r+b")
+			self.FILE.truncate(offset)
+			self.FILE.seek(offset)
+		else:
+			self.FILE = open(self.TEMP_PATH or path, "wb")
+		if size is not None and size > offset: self._preallocate(size)
+		self.QUEUE = queue.Queue(self.DEPTH)
+		self.THREAD = threading.Thread(target=self._run, name="FileWriter", daemon=True)
+		self.THREAD.start()
+	
+	def _preallocate(self, size):
+		try:
+			if hasattr(os, "posix_fallocate"):
+				os.posix_fallocate(self.FILE.fileno(), 0, size)
+			else:
+				self.FILE.truncate(size)
+		except OSError as e:
+			dprint("Couldn’t preallocate 0x{:X} bytes for {:s}: {:s}".format(size, self.FILE.name, str(e)))
+	
+	def _sync(self):
+		self.FILE.flush()
+		os.fsync(self.FILE.fileno())
+	
+	def _run(self):
+		while True:
+			item = self.QUEUE.get()
+			if item is None: break
+			(data, callback) = item
+			try:
+				if self.ERROR is None:
+					self.FILE.write(data)
+					if self.FSYNC == "chunk": self._sync()
+			except OSError as e:
+				self.ERROR = e
+			if callback is not None: callback()
+	
+	def _stop(self):
+		if self.THREAD is None: return
+		self.QUEUE.put(None)
+		self.THREAD.join()
+		self.THREAD = None
+	
+	def Write(self, data, callback=None):
+		# The data must stay untouched until callback is called from the writer thread
+		if self.ERROR is not None: raise self.ERROR
+		self.POS += len(data)
+		self.QUEUE.put((data, callback))
+	
+	def Close(self):
+		self._stop()
+		try:
+			if self.ERROR is None:
+				self.FILE.truncate(self.POS) # drops preallocated space that wasn't needed
+				if self.FSYNC != "never": self._sync()
+		except OSError as e:
+			self.ERROR = e
+		self.FILE.close()
+		if self.ERROR is not None:
+			self.Abort()
+			raise self.ERROR
+		if self.TEMP_PATH is not None: os.replace(self.TEMP_PATH, self.PATH)
+	
+	def Abort(self):
+		self._stop()
+		self.FILE.close()
+		if self.TEMP_PATH is None: return
+		try:
+			os.remove(self.TEMP_PATH)
+		except OSError:
+			pass
+
 class TAMA5_CMD(Enum):
 	RAM_WRITE = 0x0
 	RAM_READ = 0x1
@@ -452,6 +1014,23 @@ def find_size(data, max_size, min_size=0x20):
 			break
 	return offset
 
+def percentile(values, p, limit=None):
+	# Nearest-rank percentile of an unsorted list, or of a histogram that maps the upper bound of
+	# each power-of-two bucket to its count; within a bucket the value is interpolated and capped at limit
+	if len(values) == 0: return 0
+	if isinstance(values, dict):
+		rank = max(1, math.ceil(p / 100 * sum(values.values())))
+		count = 0
+		for bucket in sorted(values):
+			if count + values[bucket] >= rank:
+				lower = bucket >> 1
+				value = lower + (bucket - lower) * (rank - count) / values[bucket]
+				return value if limit is None else min(value, limit)
+			count += values[bucket]
+		return 0
+	values = sorted(values)
+	return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
 def dprint(*args, **kwargs):
 	if DEBUG:
 		stack = traceback.extract_stack()
@@ -2,13 +2,14 @@
 # FlashGBX
 # Author: Lesserkuma (github.com/lesserkuma)
 
-import time, math, struct, traceback, zlib, copy, hashlib, os, datetime, platform
+import time, math, struct, traceback, copy, hashlib, os, datetime, platform, contextlib, threading
 import serial, serial.tools.list_ports
 from serial import SerialException
 from .RomFileDMG import RomFileDMG
 from .RomFileAGB import RomFileAGB
 from .Mapper import DMG_MBC, AGB_GPIO
 from .Flashcart import Flashcart, Flashcart_DMG_MMSA
+from .SerialIO import SerialIO, SerialTrace
 from .Util import ANSI, dprint, bitswap, ParseCFI
 from . import Util
 
@@ -79,10 +80,37 @@ class GbxDevice:
 		"DMG_READ_CS_PULSE":[8, 0x08],
 		"DMG_WRITE_CS_PULSE":[8, 0x09],
 	}
+	DEVICE_VAR_TABLE = { k:(v[0] >> 3, v[1]) for (k, v) in DEVICE_VAR.items() } # name → (size in bytes, index)
+
+	# Precompiled packet layouts
+	PKT_SET_VARIABLE = struct.Struct(">BBII")
+	PKT_DMG_CART_WRITE = struct.Struct(">BIB")
+	PKT_AGB_CART_WRITE = struct.Struct(">BIH")
+	PKT_FLASH_CMD = struct.Struct(">IB")
+	PKT_FLASH_CMD_SETUP = struct.Struct(">IH")
 
 	PCB_VERSIONS = {4:'v1.3', 5:'v1.4', 6:'v1.4a'}
 	ACTIONS = {"ROM_READ":1, "SAVE_READ":2, "SAVE_WRITE":3, "ROM_WRITE":4, "ROM_WRITE_VERIFY":4}
+	BENCHMARK_PRIMITIVES = [ "ReadROM", "ReadROM_3DMemory", "ReadRAM", "WriteRAM", "WriteROM", "ReadRAM_MBC7" ]
 	SUPPORTED_CARTS = {}
+	FLASH_PROBES = {}
+	FLASH_WE_PINS = { "WR":0x01, "AUDIO":0x02, "VIN":0x02, "WR+RESET":0x03 }
+	FLASH_CFI_PROBES = [
+		{ 'read_cfi':[[0x555, 0x98]], 'read_identifier':[[ 0x555, 0xAA ], [ 0x2AA, 0x55 ], [ 0x555, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
+		{ 'read_cfi':[[0x5555, 0x98]], 'read_identifier':[[ 0x5555, 0xAA ], [ 0x2AAA, 0x55 ], [ 0x5555, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
+		{ 'read_cfi':[[0xAA, 0x98]], 'read_identifier':[[ 0xAAA, 0xAA ], [ 0x555, 0x55 ], [ 0xAAA, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
+		{ 'read_cfi':[[0xAAA, 0x98]], 'read_identifier':[[ 0xAAA, 0xAA ], [ 0x555, 0x55 ], [ 0xAAA, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
+		{ 'read_cfi':[[0xAAAA, 0x98]], 'read_identifier':[[ 0xAAAA, 0xAA ], [ 0x5555, 0x55 ], [ 0xAAAA, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
+		{ 'read_cfi':[[0x4555, 0x98]], 'read_identifier':[[ 0x4555, 0xAA ], [ 0x4AAA, 0x55 ], [ 0x4555, 0x90 ]], 'reset':[[ 0x4000, 0xF0 ]] },
+		{ 'read_cfi':[[0x7555, 0x98]], 'read_identifier':[[ 0x7555, 0xAA ], [ 0x7AAA, 0x55 ], [ 0x7555, 0x90 ]], 'reset':[[ 0x7000, 0xF0 ]] },
+		{ 'read_cfi':[[0x4AAA, 0x98]], 'read_identifier':[[ 0x4AAA, 0xAA ], [ 0x4555, 0x55 ], [ 0x4AAA, 0x90 ]], 'reset':[[ 0x4000, 0xF0 ]] },
+		{ 'read_cfi':[[0x7AAA, 0x98]], 'read_identifier':[[ 0x7AAA, 0xAA ], [ 0x7555, 0x55 ], [ 0x7AAA, 0x90 ]], 'reset':[[ 0x7000, 0xF0 ]] },
+		{ 'read_cfi':[[0, 0x98]], 'read_identifier':[[ 0, 0x90 ]], 'reset':[[ 0, 0xFF ]] },
+	]
+	FLASH_CFI_PROBE_ORDER = { # by how many flash cartridge handlers use each command set; the Intel one can't bring AMD chips back to read mode, so it goes after the common AMD ones
+		"DMG":[ 2, 0, 1, 3, 9, 7, 8, 4, 5, 6 ],
+		"AGB":[ 2, 3, 0, 1, 9, 4, 5, 6, 7, 8 ],
+	}
 	
 	FW = []
 	FW_UPDATE_REQ = False
@@ -101,9 +129,38 @@ class GbxDevice:
 	SKIPPING = False
 	BAUDRATE = 1000000
 	MAX_BUFFER_LEN = 512
+	READ_WINDOW = 1
+	READ_WINDOW_MAX = 4
+	READ_WINDOW_LIMIT = 4
+	FW_VARS = {}
+	FW_VARS_PENDING = {}
+	FW_VARS_PENDING_RESET = False
+	FW_VARS_VOLATILE = [ "ADDRESS" ]
+	FW_VARS_RESET_CMDS = []
+	WRITE_COALESCING = True
+	WRITE_COALESCE = 0
+	WRITE_BUFFER = None
+	WRITE_BUFFER_MAX = 0x1000
+	WRITE_ACKS = 0
+	SERIAL_THREAD = True
+	SERIAL_FACTORY = None
+	LOCK = None
+	STATS = None
+	STATS_COMMAND = None
+	STATS_START = 0
+	STATS_WAIT = 0
+	DEVICE_CMD_NAMES = {}
 	
 	def __init__(self):
-		pass
+		self.LOCK = threading.RLock()
+		self.INFO = { "action":None, "last_action":None }
+		self.CANCEL_ARGS = {}
+		self.DEVICE_CMD_NAMES = { v:k for (k, v) in self.DEVICE_CMD.items() }
+		self.FW_VARS = {}
+		self.FW_VARS_PENDING = {}
+		self.DEVICE_VAR_NAMES = { v:k for (k, v) in self.DEVICE_VAR_TABLE.items() }
+		self.WRITE_BUFFER = bytearray()
+		self.FW_VARS_RESET_CMDS = [ self.DEVICE_CMD[c] for c in ("OFW_RESET_AVR", "OFW_CART_MODE", "OFW_CART_PWR_ON", "OFW_CART_PWR_OFF", "OFW_GB_CART_MODE", "SET_MODE_AGB", "SET_MODE_DMG", "SET_FLASH_CMD", "DMG_MBC_RESET", "AGB_BOOTUP_SEQUENCE") ]
 	
 	def Initialize(self, flashcarts, port=None, max_baud=1700000):
 		if self.IsConnected(): self.DEVICE.close()
@@ -123,30 +180,14 @@ class GbxDevice:
 		
 		for i in range(0, len(ports)):
 			try:
-				dev = serial.Serial(ports[i], self.BAUDRATE, timeout=0.1)
-				self.DEVICE = dev
-				if not self.LoadFirmwareVersion() and max_baud >= 1700000:
-					dev.close()
-					self.BAUDRATE = 1700000
-					dev = serial.Serial(ports[i], self.BAUDRATE, timeout=0.1)
-					self.DEVICE = dev
-					if not self.LoadFirmwareVersion():
-						dev.close()
-						self.DEVICE = None
-						self.BAUDRATE = 1000000
-						return False
-				elif max_baud >= 1700000 and self.FW["pcb_ver"] in (5, 6) and self.BAUDRATE < 1700000:
-					# Switch to higher baud rate
-					self._write(self.DEVICE_CMD["OFW_USART_1_7M_SPEED"])
-					self.BAUDRATE = 1700000
-					dev.close()
-					dev = serial.Serial(ports[i], self.BAUDRATE, timeout=0.1)
-					self.DEVICE = dev
+				dev = self._probe_port(ports[i], max_baud)
+				if dev is False: return False
 				
 				dprint("Firmware information:", self.FW)
 				dprint("Baud rate:", self.BAUDRATE)
 
-				if self.DEVICE is None or not self.IsConnected():
+				# _probe_port() drops the device unless its last handshake succeeded, so there's no need for another one
+				if self.DEVICE is None:
 					dev.close()
 					self.DEVICE = None
 					if self.FW is not None:
@@ -174,14 +215,16 @@ class GbxDevice:
 				conn_msg.append([0, "For help please visit the insideGadgets Discord: https://gbxcart.com/discord"])
 
 				self.PORT = ports[i]
+				self._save_port_cache()
 				self.DEVICE.timeout = 1
+				if self.SERIAL_THREAD: self.DEVICE = SerialIO(self.DEVICE)
 				
 				# Load Flash Cartridge Handlers
 				self.UpdateFlashCarts(flashcarts)
 
 				# Stop after first found device
 				break
-			
+		
 			except SerialException as e:
 				if "Permission" in str(e):
 					conn_msg.append([3, "The GBxCart RW device on port " + ports[i] + " couldn’t be accessed. Make sure your user account has permission to use it and it’s not already in use by another application."])
@@ -193,7 +236,97 @@ class GbxDevice:
 		#conn_msg.append([0, "NOTE: This is a third party tool for GBxCart RW by insideGadgets. Visit https://www.gbxcart.com/ for more information."])
 		return conn_msg
 	
+	def _probe_port(self, port, max_baud):
+		cache = self._load_port_cache(port, max_baud)
+		if cache is not None:
+			self.BAUDRATE = cache["baud"]
+			dev = self._open_serial(port)
+			self.DEVICE = dev
+			if self._verify_firmware(cache):
+				dprint("Connected to the known device on port {:s} at {:d} baud".format(port, self.BAUDRATE))
+				return dev
+			dev.close()
+			self.DEVICE = None
+			self.BAUDRATE = 1000000
+		
+		dev = self._open_serial(port)
+		self.DEVICE = dev
+		connected = self.LoadFirmwareVersion()
+		if not connected and max_baud >= 1700000:
+			dev.close()
+			self.BAUDRATE = 1700000
+			dev = self._open_serial(port)
+			self.DEVICE = dev
+			if not self.LoadFirmwareVersion():
+				dev.close()
+				self.DEVICE = None
+				self.BAUDRATE = 1000000
+				return False
+			connected = True
+		elif connected and max_baud >= 1700000 and self.FW["pcb_ver"] in (5, 6) and self.BAUDRATE < 1700000:
+			# Switch to higher baud rate
+			self._write(self.DEVICE_CMD["OFW_USART_1_7M_SPEED"])
+			self.BAUDRATE = 1700000
+			dev.close()
+			dev = self._open_serial(port)
+			self.DEVICE = dev
+			connected = self.LoadFirmwareVersion()
+		if not connected: self.DEVICE = None
+		return dev
+	
+	def _port_cache(self, port):
+		path = ""
+		if Util.CONFIG_PATH is not None: path = Util.CONFIG_PATH + "/devices.ini"
+		return Util.IniSettings(path=path, main_section=port)
+	
+	def _load_port_cache(self, port, max_baud):
+		try:
+			settings = self._port_cache(port)
+			cache = { k:int(settings.value(k)) for k in ("pcb_ver", "fw_ver", "ofw_ver", "fw_ts", "baud") }
+			cache["cfw_id"] = settings.value("cfw_id")
+		except (ValueError, TypeError):
+			return None
+		# Only skip the negotiation if it would end up at the same baud rate anyway
+		if cache["baud"] > max_baud: return None
+		if cache["baud"] < min(max_baud, 1700000) and cache["pcb_ver"] in (5, 6): return None
+		return cache
+	
+	def _save_port_cache(self):
+		settings = self._port_cache(self.PORT)
+		values = { k:str(self.FW[k]) for k in ("cfw_id", "pcb_ver", "fw_ver", "ofw_ver", "fw_ts") }
+		values["baud"] = str(self.BAUDRATE)
+		with Util.IniSettings.LOCK:
+			for (k, v) in values.items():
+				if settings.value(k) != v: settings.setValue(k, v)
+	
+	def _verify_firmware(self, cache):
+		# One handshake that has to match what was last seen on this port
+		self._clear_fw_variables()
+		try:
+			self.DEVICE.reset_input_buffer()
+			self.DEVICE.reset_output_buffer()
+			self._write(self.DEVICE_CMD["QUERY_FW_INFO"])
+			size = self.DEVICE.read(1)
+			if len(size) != 1 or size[0] != struct.calcsize(">cHBI"): return False
+			info = self.DEVICE.read(size[0])
+			if len(info) != size[0]: return False
+			(cfw_id, fw_ver, pcb_ver, fw_ts) = struct.unpack(">cHBI", info)
+		except (SerialException, OSError, struct.error):
+			return False
+		if (cfw_id.decode("ascii", "replace"), fw_ver, pcb_ver, fw_ts) != (cache["cfw_id"], cache["fw_ver"], cache["pcb_ver"], cache["fw_ts"]): return False
+		self.FW = { "cfw_id":cache["cfw_id"], "fw_ver":fw_ver, "pcb_ver":pcb_ver, "fw_ts":fw_ts, "ofw_ver":cache["ofw_ver"] }
+		self.FW["fw_dt"] = datetime.datetime.fromtimestamp(fw_ts).astimezone().replace(microsecond=0).isoformat()
+		return True
+	
+	def _open_serial(self, port):
+		if self.SERIAL_FACTORY is not None:
+			return self.SERIAL_FACTORY(port, self.BAUDRATE, timeout=0.1)
+		elif port.startswith(SerialTrace.PREFIX):
+			return SerialTrace.Open(port, self.BAUDRATE, timeout=0.1)
+		return serial.Serial(port, self.BAUDRATE, timeout=0.1)
+	
 	def LoadFirmwareVersion(self):
+		self._clear_fw_variables()
 		try:
 			self.DEVICE.reset_input_buffer()
 			self.DEVICE.reset_output_buffer()
@@ -257,10 +390,37 @@ class GbxDevice:
 		for mode in flashcarts.keys():
 			for key in sorted(flashcarts[mode].keys(), key=str.casefold):
 				self.SUPPORTED_CARTS[mode][key] = flashcarts[mode][key]
+		self.FLASH_PROBES = { mode:self._index_flash_probes(mode) for mode in self.SUPPORTED_CARTS }
+	
+	def _index_flash_probes(self, mode):
+		# Groups the flash cartridge types by the exact probe they need, so each distinct probe only runs once during auto-detection
+		probes = {}
+		supported_carts = list(self.SUPPORTED_CARTS[mode].values())
+		for f in range(2, len(supported_carts)):
+			flashcart_meta = supported_carts[f]
+			if "flash_ids" not in flashcart_meta or len(flashcart_meta["flash_ids"]) == 0: continue
+			commands = flashcart_meta["commands"]
+			key = (
+				self.FLASH_WE_PINS.get(flashcart_meta["write_pin"]) if mode == "DMG" else None,
+				str(commands.get("reset")),
+				str(commands.get("unlock")),
+				str(commands.get("read_identifier")),
+				len(flashcart_meta["flash_ids"][0]),
+			)
+			if key not in probes:
+				probes[key] = { "we":key[0], "meta":flashcart_meta, "flash_ids":{} }
+			for flash_id in flashcart_meta["flash_ids"]:
+				types = probes[key]["flash_ids"].setdefault(tuple(flash_id), [])
+				if f not in types: types.append(f)
+		dprint("{:d} flash cartridge types of mode {:s} share {:d} distinct probes".format(len(supported_carts) - 2, mode, len(probes)))
+		return list(probes.values())
 	
 	def IsConnected(self):
 		if self.DEVICE is None: return False
 		if not self.DEVICE.isOpen(): return False
+		if not self.LOCK.acquire(blocking=False):
+			# Another thread is busy talking to the device, so it must be alive
+			return True
 		try:
 			while self.DEVICE.in_waiting > 0:
 				dprint("Clearing input buffer... ({:d})".format(self.DEVICE.in_waiting), self.DEVICE.read(self.DEVICE.in_waiting))
@@ -271,6 +431,8 @@ class GbxDevice:
 		except SerialException as e:
 			print(str(e))
 			return False
+		finally:
+			self.LOCK.release()
 	
 	def Close(self):
 		if self.IsConnected():
@@ -336,6 +498,9 @@ class GbxDevice:
 		else:
 			return False
 	
+	def _transfer_tuner_key(self):
+		return "{:s} {:s} {:s} {:d}".format(str(self.PORT), self.GetPCBVersion(), self.GetFirmwareVersion(), self.BAUDRATE)
+	
 	def GetPort(self):
 		return self.PORT
 	
@@ -346,6 +511,7 @@ class GbxDevice:
 		if values is None: values = [0x01, 0x03]
 		buffer = self._read(1)
 		if buffer not in values:
+			if self.STATS is not None: self._stats_entry(self.STATS_COMMAND)["errors"] += 1
 			tb_stack = traceback.extract_stack()
 			stack = tb_stack[len(tb_stack)-2] # caller only
 			if stack.name == "_write": stack = tb_stack[len(tb_stack)-3]
@@ -357,57 +523,202 @@ class GbxDevice:
 		
 		return buffer
 
-	def _write(self, data, wait=False):
-		if not isinstance(data, bytearray):
+	def _write(self, data, wait=False, payload=False):
+		if isinstance(data, int):
 			data = bytearray([data])
+		if not payload: self._track_fw_variables(data)
+		if self.STATS is not None: self._stats_write(data, payload)
 
 		#dstr = ' '.join(format(x, '02X') for x in data)
 		#dprint("[{:02X}] {:s}".format(int(len(dstr)/3) + 1, dstr[:96]))
 		
-		self.DEVICE.write(data)
-		self.DEVICE.flush()
-		
-		# On MacOS it’s possible not all bytes are transmitted successfully,
-		# even though we’re using flush() which is the tcdrain function.
-		# Still looking for a better solution than delaying here.
-		if platform.system() == "Darwin":
-			time.sleep(0.00125)
+		self.WRITE_BUFFER += data
+		if self.WRITE_COALESCE == 0 or wait or len(self.WRITE_BUFFER) >= self.WRITE_BUFFER_MAX:
+			self._flush_writes()
 		
 		if wait: return self.wait_for_ack()
 	
+	def _track_fw_variables(self, data):
+		# Every packet is an optional run of variable packets followed by its command byte;
+		# the mirror only takes the changes once the bytes have been written
+		pos = 0
+		while len(data) - pos >= self.PKT_SET_VARIABLE.size and data[pos] == self.DEVICE_CMD["SET_VARIABLE"]:
+			(_, size, index, value) = self.PKT_SET_VARIABLE.unpack_from(data, pos)
+			self.FW_VARS_PENDING[self.DEVICE_VAR_NAMES[(size, index)]] = value
+			pos += self.PKT_SET_VARIABLE.size
+		if pos < len(data) and data[pos] in self.FW_VARS_RESET_CMDS:
+			self.FW_VARS_PENDING = {}
+			self.FW_VARS_PENDING_RESET = True
+	
+	def _fw_variable(self, key):
+		if key in self.FW_VARS_PENDING: return self.FW_VARS_PENDING[key]
+		if self.FW_VARS_PENDING_RESET: return None
+		return self.FW_VARS.get(key)
+	
+	def _clear_fw_variables(self):
+		self.FW_VARS = {}
+		self.FW_VARS_PENDING = {}
+		self.FW_VARS_PENDING_RESET = False
+	
+	def _flush_writes(self):
+		if len(self.WRITE_BUFFER) > 0:
+			fw_vars = {} if self.FW_VARS_PENDING_RESET else dict(self.FW_VARS)
+			fw_vars.update(self.FW_VARS_PENDING)
+			self._clear_fw_variables()
+			self.DEVICE.write(self.WRITE_BUFFER)
+			self.WRITE_BUFFER = bytearray()
+			self.DEVICE.flush()
+			self.FW_VARS = fw_vars
+			
+			# On MacOS it’s possible not all bytes are transmitted successfully,
+			# even though we’re using flush() which is the tcdrain function.
+			# Still looking for a better solution than delaying here.
+			if platform.system() == "Darwin":
+				time.sleep(0.00125)
+		
+		if self.WRITE_ACKS > 0:
+			time_start = time.perf_counter()
+			acks = self.DEVICE.read(self.WRITE_ACKS)
+			if self.STATS is not None: self._stats_read("CART_WRITE_FLASH_CMD", len(acks), time_start, replies=self.WRITE_ACKS)
+			if acks != bytes([0x01] * self.WRITE_ACKS):
+				print("Error!")
+			self.WRITE_ACKS = 0
+	
+	@contextlib.contextmanager
+	def _write_coalesced(self):
+		# Collects outgoing bytes until a reply is needed or the block is left
+		if not self.WRITE_COALESCING:
+			yield
+			return
+		self.WRITE_COALESCE += 1
+		try:
+			yield
+		finally:
+			self.WRITE_COALESCE -= 1
+			if self.WRITE_COALESCE == 0: self._flush_writes()
+	
 	def _read(self, count):
+		self._flush_writes()
 		if self.DEVICE.in_waiting > 1000: dprint("in_waiting = {:d} bytes".format(self.DEVICE.in_waiting))
+		time_start = time.perf_counter()
 		buffer = self.DEVICE.read(count)
+		if self.STATS is not None: self._stats_read(self.STATS_COMMAND, len(buffer), time_start)
 		if len(buffer) != count:
-			dprint("Error: Received {:d} byte(s) instead of the expected {:d} byte(s)".format(len(buffer), count))
-			while self.DEVICE.in_waiting > 0:
-				self.DEVICE.reset_input_buffer()
-				time.sleep(0.5)
-			self.DEVICE.reset_output_buffer()
+			self._read_error(len(buffer), count)
 			return False
 		
 		if count == 1:
 			return buffer[0]
 		else:
 			return bytearray(buffer)
+	
+	def _read_into(self, view):
+		self._flush_writes()
+		count = len(view)
+		if self.DEVICE.in_waiting > 1000: dprint("in_waiting = {:d} bytes".format(self.DEVICE.in_waiting))
+		time_start = time.perf_counter()
+		if hasattr(self.DEVICE, "readinto"):
+			received = self.DEVICE.readinto(view)
+		else:
+			temp = self.DEVICE.read(count)
+			received = len(temp)
+			view[:received] = temp
+		if self.STATS is not None: self._stats_read(self.STATS_COMMAND, received, time_start)
+		if received != count:
+			self._read_error(received, count)
+			return False
+		return True
+	
+	def _read_error(self, received, count):
+		dprint("Error: Received {:d} byte(s) instead of the expected {:d} byte(s)".format(received, count))
+		if self.STATS is not None: self._stats_entry(self.STATS_COMMAND)["errors"] += 1
+		self._clear_fw_variables()
+		while self.DEVICE.in_waiting > 0:
+			self.DEVICE.reset_input_buffer()
+			time.sleep(0.5)
+		self.DEVICE.reset_output_buffer()
+
+	def EnableStats(self, enabled=True):
+		self.STATS = {} if enabled else None
+		self.STATS_COMMAND = None
+		self.STATS_START = time.perf_counter()
+		self.STATS_WAIT = 0
+	
+	def ResetStats(self):
+		if self.STATS is not None: self.EnableStats()
+	
+	def GetStats(self):
+		if self.STATS is None: return None
+		commands = {}
+		for (name, entry) in self.STATS.items():
+			commands[name] = dict(entry)
+			commands[name]["histogram"] = dict(sorted(entry["histogram"].items()))
+		return { "elapsed":time.perf_counter() - self.STATS_START, "waiting":self.STATS_WAIT, "commands":commands }
+	
+	def _stats_entry(self, name):
+		if name is None: name = "NONE"
+		if name not in self.STATS:
+			self.STATS[name] = { "count":0, "replies":0, "bytes_out":0, "bytes_in":0, "time":0, "time_max":0, "errors":0, "histogram":{} }
+		return self.STATS[name]
+	
+	def _stats_write(self, data, payload):
+		if payload:
+			self._stats_entry(self.STATS_COMMAND)["bytes_out"] += len(data)
+			return
+		
+		# Variable packets are often prepended to the actual command
+		pos = 0
+		while len(data) - pos >= self.PKT_SET_VARIABLE.size and data[pos] == self.DEVICE_CMD["SET_VARIABLE"]:
+			entry = self._stats_entry("SET_VARIABLE")
+			entry["count"] += 1
+			entry["bytes_out"] += self.PKT_SET_VARIABLE.size
+			pos += self.PKT_SET_VARIABLE.size
+		if pos == len(data): return
+		
+		name = self.DEVICE_CMD_NAMES.get(data[pos], "0x{:02X}".format(data[pos]))
+		entry = self._stats_entry(name)
+		if data.count(data[pos], pos) == len(data) - pos:
+			entry["count"] += len(data) - pos # same command queued several times
+		else:
+			entry["count"] += 1
+		entry["bytes_out"] += len(data) - pos
+		self.STATS_COMMAND = name
+	
+	def _stats_read(self, name, count, time_start, replies=1):
+		# Latency is the time spent blocking on the device; histogram buckets are upper bounds in µs
+		latency = time.perf_counter() - time_start
+		entry = self._stats_entry(name)
+		entry["replies"] += replies
+		entry["bytes_in"] += count
+		entry["time"] += latency
+		entry["time_max"] = max(entry["time_max"], latency)
+		bucket = 1 << int(latency * 1000000).bit_length()
+		entry["histogram"][bucket] = entry["histogram"].get(bucket, 0) + 1
+		self.STATS_WAIT += latency
+	
+	def _encode_fw_variable(self, key, value):
+		try:
+			(size, index) = self.DEVICE_VAR_TABLE[key]
+		except KeyError:
+			raise Exception("Unknown variable name specified.")
+		if key not in self.FW_VARS_VOLATILE and self._fw_variable(key) == value: return b''
+		dprint("Setting firmware variable {:s} to 0x{:X}".format(key, value))
+		return self.PKT_SET_VARIABLE.pack(self.DEVICE_CMD["SET_VARIABLE"], size, index, value)
+
+	def _encode_fw_variables(self, variables):
+		buffer = bytearray()
+		for (key, value) in variables:
+			buffer += self._encode_fw_variable(key, value)
+		return buffer
 
 	def _set_fw_variable(self, key, value):
-		dprint("Setting firmware variable {:s} to 0x{:X}".format(key, value))
-		size = 0
-		for (k, v) in self.DEVICE_VAR.items():
-			if key in k:
-				if v[0] == 8: size = 1
-				elif v[0] == 16: size = 2
-				elif v[0] == 32: size = 4
-				key = v[1]
-				break
-		if size == 0:
-			raise Exception("Unknown variable name specified.")
-		
-		buffer = bytearray([self.DEVICE_CMD["SET_VARIABLE"], size])
-		buffer.extend(struct.pack(">I", key))
-		buffer.extend(struct.pack(">I", value))
-		self._write(buffer)
+		buffer = self._encode_fw_variable(key, value)
+		if len(buffer) > 0: self._write(buffer)
+
+	def _set_fw_variables(self, variables, command=None):
+		buffer = self._encode_fw_variables(variables)
+		if command is not None: buffer.append(command)
+		if len(buffer) > 0: self._write(buffer)
 
 	def _cart_read(self, address, length=0, agb_save_flash=False):
 		if self.MODE == "DMG":
@@ -430,52 +741,77 @@ class GbxDevice:
 		dprint("Writing to cartridge: 0x{:X} = 0x{:X}".format(address, value & 0xFF), flashcart, sram)
 		if self.MODE == "DMG":
 			if flashcart:
-				buffer = bytearray([self.DEVICE_CMD["DMG_FLASH_WRITE_BYTE"]])
+				command = self.DEVICE_CMD["DMG_FLASH_WRITE_BYTE"]
 			else:
-				buffer = bytearray([self.DEVICE_CMD["DMG_CART_WRITE"]])
-			buffer.extend(struct.pack(">I", address))
-			buffer.extend(struct.pack("B", value & 0xFF))
+				command = self.DEVICE_CMD["DMG_CART_WRITE"]
+			buffer = self.PKT_DMG_CART_WRITE.pack(command, address, value & 0xFF)
 		elif self.MODE == "AGB":
 			if sram:
-				self._set_fw_variable("TRANSFER_SIZE", 1)
-				self._set_fw_variable("ADDRESS", 2)
-				self._write(self.DEVICE_CMD["AGB_CART_WRITE_SRAM"])
-				self._write(value)
+				self._set_fw_variables([("TRANSFER_SIZE", 1), ("ADDRESS", 2)], command=self.DEVICE_CMD["AGB_CART_WRITE_SRAM"])
+				self._write(value, payload=True)
 				self._read(1)
 				return
 			elif flashcart:
-				buffer = bytearray([self.DEVICE_CMD["AGB_FLASH_WRITE_BYTE"]])
+				command = self.DEVICE_CMD["AGB_FLASH_WRITE_BYTE"]
 			else:
-				buffer = bytearray([self.DEVICE_CMD["AGB_CART_WRITE"]])
-			
-			buffer.extend(struct.pack(">I", address >> 1))
-			buffer.extend(struct.pack(">H", value & 0xFFFF))
+				command = self.DEVICE_CMD["AGB_CART_WRITE"]
+			buffer = self.PKT_AGB_CART_WRITE.pack(command, address >> 1, value & 0xFFFF)
 		self._write(buffer)
 	
-	def _cart_write_flash(self, commands):
+	def _encode_cart_write_flash(self, commands):
 		num = len(commands)
-		buffer = bytearray([self.DEVICE_CMD["CART_WRITE_FLASH_CMD"]])
-		buffer.extend(struct.pack("B", num))
+		buffer = bytearray(2 + num * self.PKT_FLASH_CMD.size)
+		buffer[0] = self.DEVICE_CMD["CART_WRITE_FLASH_CMD"]
+		buffer[1] = num
 		for i in range(0, num):
 			#dprint("Writing to cartridge: 0x{:X} = 0x{:X}".format(commands[i][0], commands[i][1] & 0xFF))
-			buffer.extend(struct.pack(">I", commands[i][0]))
-			buffer.extend(struct.pack("B", commands[i][1]))
-		
-		self._write(buffer)
+			self.PKT_FLASH_CMD.pack_into(buffer, 2 + i * self.PKT_FLASH_CMD.size, commands[i][0], commands[i][1] & 0xFF)
+		return buffer
 
-		if self._read(1) != 0x01:
+	def _cart_write_flash(self, commands):
+		self._write(self._encode_cart_write_flash(commands))
+		if self.WRITE_COALESCE > 0:
+			self.WRITE_ACKS += 1 # collected on the next flush
+		elif self._read(1) != 0x01:
 			print("Error!")
 
+	def _cart_write_sequence(self, commands):
+		# Sends a flash command sequence in as few packets as possible
+		if Util.DEBUG: dprint("Writing {:d} command(s) to cartridge:".format(len(commands)), ", ".join("0x{:X}=0x{:X}".format(c[0], c[1]) for c in commands))
+		with self._write_coalesced():
+			for (address, value) in commands:
+				if self.MODE == "DMG":
+					self._write(self.PKT_DMG_CART_WRITE.pack(self.DEVICE_CMD["DMG_FLASH_WRITE_BYTE"], address, value & 0xFF))
+				else:
+					self._write(self.PKT_AGB_CART_WRITE.pack(self.DEVICE_CMD["AGB_FLASH_WRITE_BYTE"], address >> 1, value & 0xFFFF))
+
+	def _set_flash_cmd(self, command_set, method, we, commands, shift=0):
+		buffer = bytearray([ self.DEVICE_CMD["SET_FLASH_CMD"], command_set, method, we ])
+		for i in range(0, 6):
+			if i > len(commands) - 1: # skip
+				buffer += self.PKT_FLASH_CMD_SETUP.pack(0, 0)
+			else:
+				address = commands[i][0]
+				value = commands[i][1]
+				if not isinstance(address, int): address = 0
+				if not isinstance(value, int): value = 0
+				address >>= shift
+				dprint("Setting command #{:d} to 0x{:X}=0x{:X}".format(i, address, value))
+				buffer += self.PKT_FLASH_CMD_SETUP.pack(address, value)
+		self._write(buffer)
+
 	def _clk_toggle(self, num):
 		if self.FW["pcb_ver"] not in (5, 6): return False
-		for _ in range(0, num):
-			self._write(self.DEVICE_CMD["CLK_HIGH"])
-			self._write(self.DEVICE_CMD["CLK_LOW"])
+		with self._write_coalesced():
+			for _ in range(0, num):
+				self._write(self.DEVICE_CMD["CLK_HIGH"])
+				self._write(self.DEVICE_CMD["CLK_LOW"])
 		return True
 
 	def CartPowerOff(self, delay=0.1):
 		if self.FW["pcb_ver"] in (5, 6):
 			self._write(self.DEVICE_CMD["OFW_CART_PWR_OFF"])
+			self._flush_writes()
 			time.sleep(delay)
 	
 	def CartPowerOn(self, delay=0.1):
@@ -483,6 +819,7 @@ class GbxDevice:
 			self._write(self.DEVICE_CMD["OFW_QUERY_CART_PWR"])
 			if self._read(1) == 0:
 				self._write(self.DEVICE_CMD["OFW_CART_PWR_ON"])
+				self._flush_writes()
 				time.sleep(delay)
 				self.DEVICE.reset_input_buffer() # bug workaround
 
@@ -491,16 +828,17 @@ class GbxDevice:
 	
 	def SetMode(self, mode, delay=0.1):
 		self.CartPowerOff(delay=delay)
-		if mode == "DMG":
-			self._write(self.DEVICE_CMD["SET_MODE_DMG"])
-			self._write(self.DEVICE_CMD["SET_VOLTAGE_5V"])
-			self.MODE = "DMG"
-		elif mode == "AGB":
-			self._write(self.DEVICE_CMD["SET_MODE_AGB"])
-			self._write(self.DEVICE_CMD["SET_VOLTAGE_3_3V"])
-			self.MODE = "AGB"
-		self._set_fw_variable(key="ADDRESS", value=0)
-		self.CartPowerOn()
+		with self._write_coalesced():
+			if mode == "DMG":
+				self._write(self.DEVICE_CMD["SET_MODE_DMG"])
+				self._write(self.DEVICE_CMD["SET_VOLTAGE_5V"])
+				self.MODE = "DMG"
+			elif mode == "AGB":
+				self._write(self.DEVICE_CMD["SET_MODE_AGB"])
+				self._write(self.DEVICE_CMD["SET_VOLTAGE_3_3V"])
+				self.MODE = "AGB"
+			self._set_fw_variable(key="ADDRESS", value=0)
+			self.CartPowerOn()
 	
 	def GetSupportedCartridgesDMG(self):
 		return (list(self.SUPPORTED_CARTS['DMG'].keys()), list(self.SUPPORTED_CARTS['DMG'].values()))
@@ -616,11 +954,6 @@ class GbxDevice:
 	
 	def DetectCartridge(self, mbc=None, limitVoltage=False, checkSaveType=True):
 		self.SIGNAL = None
-		cart_type_id = 0
-		save_type = None
-		save_chip = None
-		sram_unstable = None
-		save_size = None
 
 		# Header
 		has_rtc = self.INFO["has_rtc"]
@@ -629,7 +962,92 @@ class GbxDevice:
 
 		if self.MODE == "DMG" and mbc is None:
 			mbc = info["features_raw"]
-		
+
+		header_hash = hashlib.sha1(info["raw"]).hexdigest()
+		ret = self._detect_cartridge_cached(info, header_hash, mbc, limitVoltage, checkSaveType)
+		if ret is None:
+			ret = self._detect_cartridge(info, mbc, limitVoltage, checkSaveType)
+			self._store_detected_cartridge(header_hash, ret, mbc, limitVoltage, checkSaveType)
+		return ret
+
+	def _read_flash_id(self, flashcart_meta):
+		if self.MODE == "DMG":
+			self._set_fw_variable("FLASH_WE_PIN", self.FLASH_WE_PINS.get(flashcart_meta["write_pin"]))
+		flashcart = Flashcart(config=flashcart_meta, cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM)
+		flashcart.Reset(full_reset=False)
+		flashcart.Unlock()
+		vfid = flashcart.VerifyFlashID()
+		if vfid is not False: vfid = flashcart.VerifyFlashID() # same warm-up read as in AutoDetectFlash()
+		flashcart.Reset(full_reset=False)
+		if vfid is False or vfid[0] is False: return None
+		return vfid[1]
+
+	def _detect_cartridge_cached(self, info, header_hash, mbc, limitVoltage, checkSaveType):
+		entries = Util.DetectionCache.Find(header_hash)
+		if len(entries) == 0: return None
+
+		supported_carts = list(self.SUPPORTED_CARTS[self.MODE].keys())
+		self._write(self.DEVICE_CMD["DMG_MBC_RESET"], wait=True)
+		if self.MODE == "DMG" and limitVoltage:
+			self._write(self.DEVICE_CMD["SET_VOLTAGE_3_3V"])
+			time.sleep(0.25)
+
+		for (key, entry) in entries:
+			if entry["mode"] != self.MODE or entry["mbc"] != mbc or entry["limit_voltage"] != limitVoltage: continue
+			if checkSaveType and entry["save"] is None: continue
+			if entry["cart_type"] not in supported_carts or False in [ n in supported_carts for n in entry["cart_types"] ]: continue
+
+			# Reading the flash ID of the stored cartridge type is enough to tell whether it's the same cartridge
+			flash_id = self._read_flash_id(self.SUPPORTED_CARTS[self.MODE][entry["cart_type"]])
+			if flash_id is None or Util.DetectionCache.Key(header_hash, flash_id) != key:
+				dprint("Cached detection result “{:s}” doesn’t match the inserted cartridge".format(key))
+				continue
+
+			dprint("Using cached detection result “{:s}”".format(key))
+			Util.DetectionCache.Touch(key)
+			self.INFO["last_action"] = 0
+			self.INFO["action"] = None
+			cart_types = [ supported_carts.index(n) for n in entry["cart_types"] ]
+			cart_type_id = supported_carts.index(entry["cart_type"])
+			(save_size, save_type, save_chip, sram_unstable) = (None, None, None, None)
+			if checkSaveType:
+				(save_size, save_type, save_chip, sram_unstable) = (entry["save"]["size"], entry["save"]["type"], entry["save"]["chip"], entry["save"]["sram_unstable"])
+			return (info, save_size, save_type, save_chip, sram_unstable, cart_types, cart_type_id, entry["cfi_s"], entry["cfi"], entry["flash_id"])
+
+		if self.MODE == "DMG" and limitVoltage:
+			self._write(self.DEVICE_CMD["SET_VOLTAGE_5V"])
+			time.sleep(0.25)
+		return None
+
+	def _store_detected_cartridge(self, header_hash, ret, mbc, limitVoltage, checkSaveType):
+		(_, save_size, save_type, save_chip, sram_unstable, cart_types, cart_type_id, cfi_s, cfi, flash_id_lines) = ret
+		if len(cart_types) == 0 or cart_type_id == 0: return
+
+		supported_carts = list(self.SUPPORTED_CARTS[self.MODE].keys())
+		flash_id = self._read_flash_id(self.SUPPORTED_CARTS[self.MODE][supported_carts[cart_type_id]])
+		if flash_id is None: return
+
+		key = Util.DetectionCache.Key(header_hash, flash_id)
+		save = None
+		if checkSaveType:
+			save = { "size":save_size, "type":save_type, "chip":save_chip, "sram_unstable":sram_unstable }
+		else:
+			for (k, entry) in Util.DetectionCache.Find(header_hash):
+				if k == key: save = entry["save"]
+		entry = {
+			"mode":self.MODE, "mbc":mbc, "limit_voltage":limitVoltage,
+			"cart_types":[ supported_carts[i] for i in cart_types ], "cart_type":supported_carts[cart_type_id],
+			"save":save, "cfi_s":cfi_s, "cfi":cfi, "flash_id":flash_id_lines,
+		}
+		Util.DetectionCache.Store(key, entry)
+
+	def _detect_cartridge(self, info, mbc, limitVoltage, checkSaveType):
+		cart_type_id = 0
+		save_type = None
+		save_chip = None
+		sram_unstable = None
+		save_size = None
+
 		# Save Type and Size
 		if checkSaveType:
 			max_size = 0x20000
@@ -650,12 +1068,16 @@ class GbxDevice:
 			elif self.MODE == "AGB":
 				args = { 'mode':2, 'path':None, 'mbc':mbc, 'save_type':5, 'rtc':False }
 			
-			ret = self._BackupRestoreRAM(args=args)
-			if ret is not False:
-				save_size = Util.find_size(self.INFO["data"], len(self.INFO["data"]))
+			probe = self._save_probe(args)
+			if probe is not None:
+				save_size = probe.FindSize()
 			else:
-				save_size = 0
-			#with open("debug1.bin", "wb") as f: f.write(self.INFO["data"])
+				ret = self._BackupRestoreRAM(args=args)
+				if ret is not False:
+					save_size = Util.find_size(self.INFO["data"], len(self.INFO["data"]))
+				else:
+					save_size = 0
+				#with open("debug1.bin", "wb") as f: f.write(self.INFO["data"])
 			
 			if self.MODE == "DMG":
 				if save_size > 0x20:
@@ -665,8 +1087,8 @@ class GbxDevice:
 							save_type = 8
 						elif save_size == 512:
 							save_type = 9
-					elif len(self.INFO["data"]) >= 0x12000 and self.INFO["data"][0x10000:0x12000] == bytearray([self.INFO["data"][0x10000]] * 0x2000):
-						if self.INFO["data"][0x8000:0x10000] == bytearray([self.INFO["data"][0x8000]] * 0x8000):
+					elif probe is not None and probe.SIZE >= 0x12000 and probe.IsUniform(0x10000, 0x12000):
+						if probe.IsUniform(0x8000, 0x10000):
 							save_size = 32768
 							save_type = 4
 						else:
@@ -697,22 +1119,12 @@ class GbxDevice:
 						save_type = Util.AGB_Header_Save_Sizes.index(save_size)
 					else:
 						dprint("Testing EEPROM")
-						# Check for 4K EEPROM
-						self._BackupRestoreRAM(args={ 'mode':2, 'path':None, 'mbc':mbc, 'save_type':1, 'rtc':False })
-						save_size = Util.find_size(self.INFO["data"], len(self.INFO["data"]))
-						#print("EEPROM 4K:", save_size)
-						#with open("debug1.bin", "wb") as f: f.write(self.INFO["data"])
-						eeprom_4k = self.INFO["data"]
-						# Check for 64K EEPROM
-						self._BackupRestoreRAM(args={ 'mode':2, 'path':None, 'mbc':mbc, 'save_type':2, 'rtc':False })
-						save_size = Util.find_size(self.INFO["data"], len(self.INFO["data"]))
-						#print("EEPROM 64K:", save_size)
-						#with open("debug2.bin", "wb") as f: f.write(self.INFO["data"])
-						eeprom_64k = self.INFO["data"]
-						if eeprom_64k in (bytearray([0xFF] * len(eeprom_64k)), bytearray([0] * len(eeprom_64k))):
+						eeprom_4k = self._save_probe({ 'mode':2, 'path':None, 'mbc':mbc, 'save_type':1, 'rtc':False })
+						eeprom_64k = self._save_probe({ 'mode':2, 'path':None, 'mbc':mbc, 'save_type':2, 'rtc':False })
+						if eeprom_64k.IsUniform(0, eeprom_64k.SIZE, 0xFF) or eeprom_64k.IsUniform(0, eeprom_64k.SIZE, 0x00):
 							save_type = None
 							save_size = 0
-						elif (eeprom_4k == eeprom_64k[:len(eeprom_4k)]):
+						elif eeprom_4k.Equals(eeprom_64k, 0, eeprom_4k.SIZE):
 							save_type = 2
 							save_size = 8192
 						else:
@@ -727,8 +1139,10 @@ class GbxDevice:
 		return (info, save_size, save_type, save_chip, sram_unstable, cart_types, cart_type_id, cfi_s, cfi, flash_id)
 	
 	def ReadFlashSaveID(self):
-		# Check if actually SRAM
-		test1 = self._cart_read(0x0004, agb_save_flash=True) >> 8
+		# Check if actually SRAM; the bytes touched by the ID sequence are read in the same go so they can be restored
+		values = self._read_scattered(self.DEVICE_CMD["AGB_CART_READ_SRAM"], [ 0x0004, 0x5555, 0x2AAA, 0x0000 ], 2)
+		if values is False: return False
+		(test1, temp5555, temp2AAA, temp0000) = [ v[0] for v in values ]
 		self._cart_write_flash([[ 0x0004, test1 ^ 0xFF ]])
 		test2 = self._cart_read(0x0004, agb_save_flash=True) >> 8
 		if test1 != test2:
@@ -736,10 +1150,6 @@ class GbxDevice:
 			return False
 		
 		# Read Chip ID
-		temp5555 = self._cart_read(0x5555, agb_save_flash=True) >> 8
-		temp2AAA = self._cart_read(0x2AAA, agb_save_flash=True) >> 8
-		temp0000 = self._cart_read(0x0000, agb_save_flash=True) >> 8
-
 		cmds = [
 			[ 0x5555, 0xAA ],
 			[ 0x2AAA, 0x55 ],
@@ -751,12 +1161,11 @@ class GbxDevice:
 		cmds = [
 			[ 0x5555, 0xAA ],
 			[ 0x2AAA, 0x55 ],
-			[ 0x5555, 0xF0 ]
+			[ 0x5555, 0xF0 ],
+			[ 0, 0xF0 ]
 		]
 		self._cart_write_flash(cmds)
 		time.sleep(0.01)
-		self._cart_write_flash([ [ 0, 0xF0 ] ])
-		time.sleep(0.01)
 		if agb_flash_chip == 0x1F3D:
 			buffer_len = 128
 		else:
@@ -778,90 +1187,124 @@ class GbxDevice:
 		dprint(agb_flash_chip_name)
 		return (buffer_len, agb_flash_chip, agb_flash_chip_name)
 	
-	def ReadROM(self, address, length, skip_init=False, max_length=64):
+	def _read_pipelined(self, command, length, num, progress=False, setup=b'', buffer=None, offset=0):
+		if isinstance(command, int): command = bytearray([command])
+		data = None
+		if buffer is None:
+			data = bytearray(length * num)
+			buffer = memoryview(data)
+			offset = 0
+		
+		depth = max(1, min(self.READ_WINDOW, num))
+		self._write(setup + command * depth)
+		sent = depth
+		
+		for i in range(0, num):
+			if not self._read_into(buffer[offset+i*length:offset+(i+1)*length]):
+				if depth > 1:
+					dprint("Short read with {:d} command(s) in flight, falling back to a window depth of 1".format(depth))
+					self.READ_WINDOW_LIMIT = depth - 1
+				self.READ_WINDOW = 1
+				return False
+			if sent < num:
+				self._write(command)
+				sent += 1
+			if progress:
+				self.SetProgress({"action":"READ", "bytes_added":length})
+		
+		if self.READ_WINDOW < min(self.READ_WINDOW_MAX, self.READ_WINDOW_LIMIT):
+			self.READ_WINDOW += 1
+		if data is not None:
+			buffer.release()
+			return data
+		return buffer[offset:offset+length*num]
+
+	def ReadROM(self, address, length, skip_init=False, max_length=64, buffer=None, offset=0):
 		num = math.ceil(length / max_length)
 		dprint("Reading 0x{:X} bytes from ROM at 0x{:X} in {:d} iteration(s)".format(length, address, num))
 		if length > max_length: length = max_length
 
-		buffer = bytearray()
+		setup = b''
 		if not skip_init:
-			self._set_fw_variable("TRANSFER_SIZE", length)
 			if self.MODE == "DMG":
-				self._set_fw_variable("ADDRESS", address)
-				self._set_fw_variable("DMG_ACCESS_MODE", 1) # MODE_ROM_READ
+				setup = self._encode_fw_variables([("TRANSFER_SIZE", length), ("ADDRESS", address), ("DMG_ACCESS_MODE", 1)]) # MODE_ROM_READ
 			elif self.MODE == "AGB":
-				self._set_fw_variable("ADDRESS", address >> 1)
+				setup = self._encode_fw_variables([("TRANSFER_SIZE", length), ("ADDRESS", address >> 1)])
 		
 		if self.MODE == "DMG":
 			command = "DMG_CART_READ"
 		elif self.MODE == "AGB":
 			command = "AGB_CART_READ"
 		
-		for _ in range(0, num):
-			self._write(self.DEVICE_CMD[command])
-			temp = self._read(length)
-			if isinstance(temp, int): temp = bytearray([temp])
-			if temp is False or len(temp) != length: return bytearray()
-			buffer += temp
-			if self.INFO["action"] in (self.ACTIONS["ROM_READ"], self.ACTIONS["SAVE_READ"], self.ACTIONS["ROM_WRITE_VERIFY"]) and not self.NO_PROG_UPDATE:
-				self.SetProgress({"action":"READ", "bytes_added":len(temp)})
-		
+		progress = self.INFO["action"] in (self.ACTIONS["ROM_READ"], self.ACTIONS["SAVE_READ"], self.ACTIONS["ROM_WRITE_VERIFY"]) and not self.NO_PROG_UPDATE
+		buffer = self._read_pipelined(self.DEVICE_CMD[command], length, num, progress=progress, setup=setup, buffer=buffer, offset=offset)
+		if buffer is False: return bytearray()
 		return buffer
 
-	def ReadROM_3DMemory(self, address, length, max_length=512):
+	def ReadROM_3DMemory(self, address, length, max_length=512, buffer=None, offset=0):
 		buffer_size = 0x1000
 		num = math.ceil(length / max_length)
 		dprint("Reading 0x{:X} bytes from cartridge ROM in {:d} iteration(s)".format(length, num))
 		if length > max_length: length = max_length
 
-		self._set_fw_variable("TRANSFER_SIZE", length)
-		self._set_fw_variable("BUFFER_SIZE", buffer_size)
-		self._set_fw_variable("ADDRESS", address >> 1)
+		setup = self._encode_fw_variables([("TRANSFER_SIZE", length), ("BUFFER_SIZE", buffer_size), ("ADDRESS", address >> 1)])
 
-		buffer = bytearray()
-		for _ in range(0, int(num / (buffer_size / length))): #32
-			for _ in range(0, int(buffer_size / length)): # 0x1000/0x200=8
-				self._write(self.DEVICE_CMD["AGB_CART_READ_3D_MEMORY"])
-				temp = self._read(length)
-				if isinstance(temp, int): temp = bytearray([temp])
-				if temp is False or len(temp) != length: return bytearray()
-				buffer += temp
+		num = int(num / (buffer_size / length)) #32
+		data = None
+		if buffer is None:
+			data = bytearray(num * buffer_size)
+			buffer = memoryview(data)
+			offset = 0
+		for i in range(0, num):
+			temp = self._read_pipelined(self.DEVICE_CMD["AGB_CART_READ_3D_MEMORY"], length, int(buffer_size / length), setup=setup, buffer=buffer, offset=offset+i*buffer_size) # 0x1000/0x200=8
+			setup = b''
+			if temp is False: return bytearray()
 			
 			if self.INFO["action"] == self.ACTIONS["ROM_READ"] and not self.NO_PROG_UPDATE:
 				self.SetProgress({"action":"READ", "bytes_added":buffer_size})
-			self._write(0)
+			self._write(0, payload=True)
 
-		return buffer
+		if data is not None:
+			buffer.release()
+			return data
+		return buffer[offset:offset+num*buffer_size]
 
-	def ReadRAM(self, address, length, command=None, max_length=512):
+	def ReadRAM(self, address, length, command=None, max_length=512, buffer=None, offset=0):
 		num = math.ceil(length / max_length)
 		dprint("Reading 0x{:X} bytes from cartridge RAM in {:d} iteration(s)".format(length, num))
 		if length > max_length: length = max_length
-		buffer = bytearray()
-		self._set_fw_variable("TRANSFER_SIZE", length)
 		
 		if self.MODE == "DMG":
-			self._set_fw_variable("ADDRESS", 0xA000 + address)
-			self._set_fw_variable("DMG_ACCESS_MODE", 3) # MODE_RAM_READ
-			self._set_fw_variable("DMG_READ_CS_PULSE", 1)
+			setup = self._encode_fw_variables([("TRANSFER_SIZE", length), ("ADDRESS", 0xA000 + address), ("DMG_ACCESS_MODE", 3), ("DMG_READ_CS_PULSE", 1)]) # MODE_RAM_READ
 			if command is None: command = self.DEVICE_CMD["DMG_CART_READ"]
 		elif self.MODE == "AGB":
-			self._set_fw_variable("ADDRESS", address)
+			setup = self._encode_fw_variables([("TRANSFER_SIZE", length), ("ADDRESS", address)])
 			if command is None: command = self.DEVICE_CMD["AGB_CART_READ_SRAM"]
 		
-		for _ in range(0, num):
-			self._write(command)
-			temp = self._read(length)
-			if isinstance(temp, int): temp = bytearray([temp])
-			if temp is False or len(temp) != length: return bytearray()
-			buffer += temp
-			if self.INFO["action"] == self.ACTIONS["SAVE_READ"] and not self.NO_PROG_UPDATE:
-				self.SetProgress({"action":"READ", "bytes_added":len(temp)})
-		
+		progress = self.INFO["action"] == self.ACTIONS["SAVE_READ"] and not self.NO_PROG_UPDATE
+		buffer = self._read_pipelined(command, length, num, progress=progress, setup=setup, buffer=buffer, offset=offset)
+		if buffer is False: return bytearray()
 		return buffer
 
-	def ReadRAM_MBC7(self, address, length):
-		max_length = 32
+	def _read_scattered(self, command, addresses, length, variables=[]):
+		# Reads length bytes from each address, sending several requests before collecting the replies
+		if isinstance(command, int): command = bytearray([command])
+		buffer = bytearray(len(addresses) * length)
+		view = memoryview(buffer)
+		depth = max(1, min(self.READ_WINDOW_MAX, self.READ_WINDOW_LIMIT))
+		for i in range(0, len(addresses), depth):
+			group = addresses[i:i+depth]
+			with self._write_coalesced():
+				for address in group:
+					self._write(self._encode_fw_variables([("TRANSFER_SIZE", length)] + variables + [("ADDRESS", address)]) + command)
+			for j in range(i, i + len(group)):
+				if not self._read_into(view[j*length:(j+1)*length]):
+					view.release()
+					return False
+		view.release()
+		return [ buffer[i*length:(i+1)*length] for i in range(0, len(addresses)) ]
+
+	def ReadRAM_MBC7(self, address, length, max_length=32):
 		num = math.ceil(length / max_length)
 		dprint("Reading 0x{:X} bytes from cartridge EEPROM in {:d} iteration(s)".format(length, num))
 		if length > max_length: length = max_length
@@ -887,11 +1330,12 @@ class GbxDevice:
 
 		# Read save state
 		for i in range(0, 0x20):
-			self._cart_write(0xA001, Util.TAMA5_REG.ADDR_H_SET_MODE.value) # register select and address (high)
-			self._cart_write(0xA000, i >> 4 | Util.TAMA5_CMD.RAM_READ.value << 1) # bit 0 = higher ram address, rest = command
-			self._cart_write(0xA001, Util.TAMA5_REG.ADDR_L.value) # address (low)
-			self._cart_write(0xA000, i & 0x0F) # bits 0-3 = lower ram address
-			self._cart_write(0xA001, Util.TAMA5_REG.MEM_READ_H.value) # data out (high)
+			with self._write_coalesced():
+				self._cart_write(0xA001, Util.TAMA5_REG.ADDR_H_SET_MODE.value) # register select and address (high)
+				self._cart_write(0xA000, i >> 4 | Util.TAMA5_CMD.RAM_READ.value << 1) # bit 0 = higher ram address, rest = command
+				self._cart_write(0xA001, Util.TAMA5_REG.ADDR_L.value) # address (low)
+				self._cart_write(0xA000, i & 0x0F) # bits 0-3 = lower ram address
+				self._cart_write(0xA001, Util.TAMA5_REG.MEM_READ_H.value) # data out (high)
 			time.sleep(0.03)
 			data_h = self._cart_read(0xA000)
 			self._cart_write(0xA001, Util.TAMA5_REG.MEM_READ_L.value) # data out (low)
@@ -904,9 +1348,8 @@ class GbxDevice:
 		self.NO_PROG_UPDATE = False
 		return buffer
 	
-	def WriteRAM(self, address, buffer, command=None):
+	def WriteRAM(self, address, buffer, command=None, max_length=256):
 		length = len(buffer)
-		max_length = 256
 		num = math.ceil(length / max_length)
 		dprint("Write 0x{:X} bytes to cartridge RAM in {:d} iteration(s)".format(length, num))
 		if length > max_length: length = max_length
@@ -922,9 +1365,10 @@ class GbxDevice:
 			if command is None: command = self.DEVICE_CMD["AGB_CART_WRITE_SRAM"]
 
 		for i in range(0, num):
-			self._write(command)
-			self._write(buffer[i*length:i*length+length])
-			self._read(1)
+			with self._write_coalesced():
+				self._write(command)
+				self._write(buffer[i*length:i*length+length], payload=True)
+				self._read(1)
 			if self.INFO["action"] == self.ACTIONS["SAVE_WRITE"] and not self.NO_PROG_UPDATE:
 				self.SetProgress({"action":"WRITE", "bytes_added":length})
 		
@@ -940,6 +1384,7 @@ class GbxDevice:
 		num = math.ceil(length / max_length)
 		if length > max_length: length = max_length
 		dprint("Write 0x{:X} bytes to cartridge FLASH in {:d} iteration(s)".format(length, num))
+		poller = Util.StatusPoller(key="MBC6/program", timeout=1)
 		
 		skip_write = False
 		for i in range(0, num):
@@ -959,11 +1404,12 @@ class GbxDevice:
 				[ 0x4AAA, 0x55 ],
 				[ 0x7555, 0xA0 ],
 			]
-			self._cart_write_flash(cmds)
-			mapper.SelectBankFlash(mapper.GetROMBank())
-			self._write(self.DEVICE_CMD["DMG_MBC6_MMSA_WRITE_FLASH"])
-			self._write(buffer[i*length:i*length+length])
-			ret = self._read(1)
+			with self._write_coalesced():
+				self._cart_write_flash(cmds)
+				mapper.SelectBankFlash(mapper.GetROMBank())
+				self._write(self.DEVICE_CMD["DMG_MBC6_MMSA_WRITE_FLASH"])
+				self._write(buffer[i*length:i*length+length], payload=True)
+				ret = self._read(1)
 			if ret not in (0x01, 0x03):
 				dprint("Save write error (response = {:s}) in iteration {:d} while trying to write 0x{:X} bytes".format(str(ret), i, length))
 				self.CANCEL_ARGS = {"info_type":"msgbox_critical", "info_msg":"Save write error (response = {:s}) in iteration {:d} while trying to write 0x{:X} bytes".format(str(ret), i, length)}
@@ -971,11 +1417,11 @@ class GbxDevice:
 				self.ERROR = True
 				return False
 			self._cart_write(address + length - 1, 0x00)
-			while True: # TODO: error handling
-				sr = self._cart_read(address + length - 1)
-				#print("sr=0x{:X}".format(sr))
-				if sr == 0x80: break
-				time.sleep(0.001)
+			if not poller.Wait(lambda: self._cart_read(address + length - 1) == 0x80):
+				self.CANCEL_ARGS = {"info_type":"msgbox_critical", "info_msg":"Timed out while waiting for the flash chip to finish writing 0x{:X} bytes in iteration {:d}.".format(length, i)}
+				self.CANCEL = True
+				self.ERROR = True
+				return False
 			
 			address += length
 			if self.INFO["action"] == self.ACTIONS["SAVE_WRITE"] and not self.NO_PROG_UPDATE:
@@ -992,9 +1438,10 @@ class GbxDevice:
 		self._set_fw_variable("TRANSFER_SIZE", length)
 		self._set_fw_variable("ADDRESS", address)
 		for i in range(0, num):
-			self._write(self.DEVICE_CMD["DMG_MBC7_WRITE_EEPROM"])
-			self._write(buffer[i*length:i*length+length])
-			response = self._read(1)
+			with self._write_coalesced():
+				self._write(self.DEVICE_CMD["DMG_MBC7_WRITE_EEPROM"])
+				self._write(buffer[i*length:i*length+length], payload=True)
+				response = self._read(1)
 			dprint("Response:", response) # TODO: error handling
 			if self.INFO["action"] == self.ACTIONS["SAVE_WRITE"] and not self.NO_PROG_UPDATE:
 				self.SetProgress({"action":"WRITE", "bytes_added":length})
@@ -1003,25 +1450,24 @@ class GbxDevice:
 		self.NO_PROG_UPDATE = True
 
 		for i in range(0, 0x20):
-			self._cart_write(0xA001, Util.TAMA5_REG.MEM_WRITE_H.value) # data in (high)
-			self._cart_write(0xA000, buffer[i] >> 4)
-			self._cart_write(0xA001, Util.TAMA5_REG.MEM_WRITE_L.value) # data in (low)
-			self._cart_write(0xA000, buffer[i] & 0xF)
-			self._cart_write(0xA001, Util.TAMA5_REG.ADDR_H_SET_MODE.value) # register select and address (high)
-			self._cart_write(0xA000, i >> 4 | Util.TAMA5_CMD.RAM_WRITE.value << 1) # bit 0 = higher ram address, rest = command
-			self._cart_write(0xA001, Util.TAMA5_REG.ADDR_L.value) # address (low)
-			self._cart_write(0xA000, i & 0x0F) # bits 0-3 = lower ram address
+			with self._write_coalesced():
+				self._cart_write(0xA001, Util.TAMA5_REG.MEM_WRITE_H.value) # data in (high)
+				self._cart_write(0xA000, buffer[i] >> 4)
+				self._cart_write(0xA001, Util.TAMA5_REG.MEM_WRITE_L.value) # data in (low)
+				self._cart_write(0xA000, buffer[i] & 0xF)
+				self._cart_write(0xA001, Util.TAMA5_REG.ADDR_H_SET_MODE.value) # register select and address (high)
+				self._cart_write(0xA000, i >> 4 | Util.TAMA5_CMD.RAM_WRITE.value << 1) # bit 0 = higher ram address, rest = command
+				self._cart_write(0xA001, Util.TAMA5_REG.ADDR_L.value) # address (low)
+				self._cart_write(0xA000, i & 0x0F) # bits 0-3 = lower ram address
 			time.sleep(0.03)
 			self.SetProgress({"action":"UPDATE_POS", "abortable":False, "pos":i+1})
 		
 		self.NO_PROG_UPDATE = False
 
-	def WriteROM(self, address, buffer, flash_buffer_size=False, skip_init=False, rumble_stop=False):
+	def WriteROM(self, address, buffer, flash_buffer_size=False, skip_init=False, rumble_stop=False, max_length=None):
 		length = len(buffer)
-		if self.FW["pcb_ver"] not in (5, 6):
-			max_length = 256
-		else:
-			max_length = 1024
+		if max_length is None:
+			max_length = 256 if self.FW["pcb_ver"] not in (5, 6) else 1024
 		num = math.ceil(length / max_length)
 		dprint("Writing 0x{:X} bytes to Flash ROM in {:d} iteration(s)".format(length, num))
 		if length == 0:
@@ -1055,16 +1501,17 @@ class GbxDevice:
 					skip_write = False
 			
 			if not skip_write:
-				if not skip_init:
-					if self.MODE == "DMG":
-						self._set_fw_variable("ADDRESS", address)
-					elif self.MODE == "AGB":
-						self._set_fw_variable("ADDRESS", address >> 1)
-					skip_init = True
-				
-				if ret != 0x03:
-					self._write(self.DEVICE_CMD["FLASH_PROGRAM"])
-				ret = self._write(data, wait=True)
+				with self._write_coalesced():
+					if not skip_init:
+						if self.MODE == "DMG":
+							self._set_fw_variable("ADDRESS", address)
+						elif self.MODE == "AGB":
+							self._set_fw_variable("ADDRESS", address >> 1)
+						skip_init = True
+					
+					if ret != 0x03:
+						self._write(self.DEVICE_CMD["FLASH_PROGRAM"])
+					ret = self._write(data, wait=True, payload=True)
 				
 				if ret not in (0x01, 0x03):
 					print("{:s}Flash error at 0x{:X} in iteration {:d} of {:d} while trying to write a total of 0x{:X} bytes (response = {:s}){:s}".format(ANSI.RED, address, i, num, len(buffer), str(ret), ANSI.RESET))
@@ -1084,6 +1531,7 @@ class GbxDevice:
 		num = math.ceil(length / max_length)
 		if length > max_length: length = max_length
 		dprint("Writing 0x{:X} bytes to Flash ROM in {:d} iteration(s)".format(length, num))
+		poller = Util.StatusPoller(key="GBMEMORY/program", timeout=1)
 		
 		skip_write = False
 		for i in range(0, num):
@@ -1096,66 +1544,47 @@ class GbxDevice:
 				address += length
 				continue
 			
-			# Enable flash chip access
-			self._cart_write_flash([
-				[ 0x120, 0x09 ],
-				[ 0x121, 0xAA ],
-				[ 0x122, 0x55 ],
-				[ 0x13F, 0xA5 ],
-			])
-			# Re-Enable writes to MBC registers
-			self._cart_write_flash([
-				[ 0x120, 0x11 ],
-				[ 0x13F, 0xA5 ],
-			])
-			# Bank 1 for commands
-			self._cart_write_flash([
-				[ 0x2100, 0x01 ],
-			])
-			
-			# Write setup
-			self._cart_write_flash([
-				[ 0x120, 0x0F ],
-				[ 0x125, 0x55 ],
-				[ 0x126, 0x55 ],
-				[ 0x127, 0xAA ],
-				[ 0x13F, 0xA5 ],
-			])
-			self._cart_write_flash([
-				[ 0x120, 0x0F ],
-				[ 0x125, 0x2A ],
-				[ 0x126, 0xAA ],
-				[ 0x127, 0x55 ],
-				[ 0x13F, 0xA5 ],
-			])
-			self._cart_write_flash([
-				[ 0x120, 0x0F ],
-				[ 0x125, 0x55 ],
-				[ 0x126, 0x55 ],
-				[ 0x127, 0xA0 ],
-				[ 0x13F, 0xA5 ],
-			])
-
-			# Set bank back
-			self._cart_write_flash([
-				[ 0x2100, bank ],
-			])
-						
-			# Disable writes to MBC registers
-			self._cart_write_flash([
-				[ 0x120, 0x10 ],
-				[ 0x13F, 0xA5 ],
-			])
-						
-			# Undo Wakeup
-			self._cart_write_flash([
-				[ 0x120, 0x08 ],
-				[ 0x13F, 0xA5 ],
-			])
-
-			self._write(self.DEVICE_CMD["DMG_MBC6_MMSA_WRITE_FLASH"])
-			self._write(buffer[i*length:i*length+length])
-			ret = self._read(1)
+			with self._write_coalesced():
+				self._cart_write_flash([
+					# Enable flash chip access
+					[ 0x120, 0x09 ],
+					[ 0x121, 0xAA ],
+					[ 0x122, 0x55 ],
+					[ 0x13F, 0xA5 ],
+					# Re-Enable writes to MBC registers
+					[ 0x120, 0x11 ],
+					[ 0x13F, 0xA5 ],
+					# Bank 1 for commands
+					[ 0x2100, 0x01 ],
+					# Write setup
+					[ 0x120, 0x0F ],
+					[ 0x125, 0x55 ],
+					[ 0x126, 0x55 ],
+					[ 0x127, 0xAA ],
+					[ 0x13F, 0xA5 ],
+					[ 0x120, 0x0F ],
+					[ 0x125, 0x2A ],
+					[ 0x126, 0xAA ],
+					[ 0x127, 0x55 ],
+					[ 0x13F, 0xA5 ],
+					[ 0x120, 0x0F ],
+					[ 0x125, 0x55 ],
+					[ 0x126, 0x55 ],
+					[ 0x127, 0xA0 ],
+					[ 0x13F, 0xA5 ],
+					# Set bank back
+					[ 0x2100, bank ],
+					# Disable writes to MBC registers
+					[ 0x120, 0x10 ],
+					[ 0x13F, 0xA5 ],
+					# Undo Wakeup
+					[ 0x120, 0x08 ],
+					[ 0x13F, 0xA5 ],
+				])
+
+				self._write(self.DEVICE_CMD["DMG_MBC6_MMSA_WRITE_FLASH"])
+				self._write(buffer[i*length:i*length+length], payload=True)
+				ret = self._read(1)
 			if ret not in (0x01, 0x03):
 				self.CANCEL_ARGS = {"info_type":"msgbox_critical", "info_msg":"Save write error (response = {:s}) in iteration {:d} while trying to write 0x{:X} bytes".format(str(ret), i, length)}
 				self.CANCEL = True
@@ -1163,11 +1592,11 @@ class GbxDevice:
 				return False
 			
 			self._cart_write(address + length - 1, 0xFF)
-			while True: # TODO: error handling
-				sr = self._cart_read(address + length - 1)
-				#print("sr=0x{:X}".format(sr))
-				if sr == 0x80: break
-				time.sleep(0.001)
+			if not poller.Wait(lambda: self._cart_read(address + length - 1) == 0x80):
+				self.CANCEL_ARGS = {"info_type":"msgbox_critical", "info_msg":"Timed out while waiting for the flash chip to finish writing 0x{:X} bytes in iteration {:d}.".format(length, i)}
+				self.CANCEL = True
+				self.ERROR = True
+				return False
 
 			address += length
 			if self.INFO["action"] == self.ACTIONS["ROM_WRITE"] and not self.NO_PROG_UPDATE:
@@ -1176,6 +1605,142 @@ class GbxDevice:
 		self._cart_write(address - 1, 0xF0)
 		self.SKIPPING = skip_write
 	
+	def BenchmarkPrepare(self, primitive, length, mbc=0, cart_type=0, scratch=None):
+		# Returns the region a benchmark run cycles through, or a string explaining why the primitive can’t be measured here
+		bench = { "primitive":primitive, "address":0, "size":0, "reference":None, "mbc":None, "flashcart":None, "buffer_size":False }
+		if primitive in ("ReadRAM", "WriteRAM", "ReadRAM_MBC7") and self.MODE == "DMG":
+			_mbc = DMG_MBC().GetInstance(args={"mbc":mbc}, cart_write_fncptr=self._cart_write, cart_read_fncptr=self._cart_read, clk_toggle_fncptr=self._clk_toggle)
+			if _mbc.GetName() in ("MBC6", "TAMA5"): return "not supported with {:s}".format(_mbc.GetName())
+			if (_mbc.GetName() == "MBC7") != (primitive == "ReadRAM_MBC7"):
+				return "MBC7 cartridges only" if primitive == "ReadRAM_MBC7" else "not supported with MBC7"
+			self._set_fw_variable("DMG_WRITE_CS_PULSE", 0)
+			self._set_fw_variable("DMG_READ_CS_PULSE", 0)
+			if _mbc.GetName() != "MBC7": _mbc.EnableMapper()
+			_mbc.EnableRAM(enable=True)
+			_mbc.SelectBankRAM(0)
+			bench.update({ "mbc":_mbc, "size":0x100 if _mbc.GetName() == "MBC7" else _mbc.GetRAMBankSize() })
+		
+		if primitive == "ReadROM":
+			bench["size"] = min(length, 0x8000 if self.MODE == "DMG" else 0x400000)
+			bench["reference"] = self.ReadROM(0, bench["size"], max_length=self.MAX_BUFFER_LEN)
+		elif primitive == "ReadROM_3DMemory":
+			if self.MODE != "AGB": return "Game Boy Advance cartridges only"
+			bench["size"] = max(0x1000, min(length, 0x400000) & ~0xFFF)
+			bench["reference"] = self.ReadROM(0, bench["size"], max_length=self.MAX_BUFFER_LEN)
+		elif primitive in ("ReadRAM", "WriteRAM"):
+			if self.MODE == "AGB": bench["size"] = 0x8000
+			bench["reference"] = self.ReadRAM(0, bench["size"])
+		elif primitive == "ReadRAM_MBC7":
+			if self.MODE != "DMG": return "MBC7 cartridges only"
+			bench["reference"] = self.ReadRAM_MBC7(0, bench["size"])
+		elif primitive == "WriteROM":
+			if scratch is None: return "requires a scratch flash sector"
+			if cart_type <= 0: return "requires a flash cartridge"
+			cart_type = copy.deepcopy(list(self.SUPPORTED_CARTS[self.MODE].values())[cart_type])
+			flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM, progress_fncptr=self.SetProgress)
+			if not flashcart.SupportsSectorErase(): return "requires a flash cartridge with sector erase"
+			if flashcart.GetVoltage() == 5:
+				self._write(self.DEVICE_CMD["SET_VOLTAGE_5V"])
+			else:
+				self._write(self.DEVICE_CMD["SET_VOLTAGE_3_3V"])
+			address = scratch
+			if self.MODE == "DMG":
+				_mbc = DMG_MBC().GetInstance(args={"mbc":flashcart.GetMBC() or 0x1B}, cart_write_fncptr=self._cart_write, cart_read_fncptr=self._cart_read, clk_toggle_fncptr=self._clk_toggle)
+				self._set_fw_variable("FLASH_PULSE_RESET", 1 if flashcart.PulseResetAfterWrite() else 0)
+				_mbc.EnableMapper()
+				bank = scratch // _mbc.GetROMBankSize()
+				(start_address, bank_size) = _mbc.SelectBankROM(bank)
+				self._set_fw_variable("DMG_ROM_BANK", bank)
+				address = start_address + scratch % bank_size
+				bench["mbc"] = _mbc
+			command_set_type = self._load_flash_commands(flashcart)
+			if command_set_type is False: return "unsupported flash cartridge"
+			if command_set_type == "GBMEMORY": return "not supported with GB Memory cartridges"
+			flashcart.Unlock()
+			sector_size = flashcart.GetSmallestSectorSize()
+			bench.update({ "address":address, "size":sector_size if sector_size else 0x2000, "flashcart":flashcart, "buffer_size":flashcart.GetBufferSize() })
+			bench["reference"] = bytearray(os.urandom(bench["size"]))
+		else:
+			return "unknown primitive"
+		
+		if bench["reference"] is not None and len(bench["reference"]) != bench["size"]:
+			return "couldn’t read reference data"
+		return bench
+	
+	def BenchmarkTransfer(self, bench, chunk_size, window=1, length=0x10000):
+		# Moves at least length bytes with one primitive; each sample is one call of that primitive
+		primitive = bench["primitive"]
+		reads = primitive in ("ReadROM", "ReadROM_3DMemory", "ReadRAM")
+		if primitive == "ReadROM_3DMemory":
+			step = 0x1000
+		elif primitive == "WriteROM" and bench["buffer_size"]:
+			step = max(chunk_size, bench["buffer_size"])
+		elif reads:
+			step = chunk_size * window
+		else:
+			step = chunk_size
+		step = min(step, bench["size"])
+		commands = max(1, step // chunk_size)
+		(window_max, window_limit) = (self.READ_WINDOW_MAX, self.READ_WINDOW_LIMIT)
+		result = { "bytes":0, "time":0, "command_times":[], "errors":0 } # average time per command of each run
+		
+		offset = 0
+		while result["bytes"] < length and not self.CANCEL:
+			if offset + step > bench["size"]: offset = 0
+			address = bench["address"] + offset
+			if primitive == "WriteROM" and offset == 0:
+				if bench["flashcart"].SectorErase(pos=address) is False:
+					result["errors"] += 1
+					break
+			self.READ_WINDOW = self.READ_WINDOW_MAX = self.READ_WINDOW_LIMIT = window
+			
+			time_start = time.perf_counter()
+			if primitive == "ReadROM":
+				data = self.ReadROM(address, step, max_length=chunk_size)
+			elif primitive == "ReadROM_3DMemory":
+				data = self.ReadROM_3DMemory(address, step, max_length=chunk_size)
+			elif primitive == "ReadRAM":
+				data = self.ReadRAM(address, step, max_length=chunk_size)
+			elif primitive == "ReadRAM_MBC7":
+				data = self.ReadRAM_MBC7(address, step, max_length=chunk_size)
+			elif primitive == "WriteRAM":
+				data = self.WriteRAM(address, bench["reference"][offset:offset+step], max_length=chunk_size)
+			elif primitive == "WriteROM":
+				data = self.WriteROM(address, bench["reference"][offset:offset+step], flash_buffer_size=bench["buffer_size"], max_length=chunk_size)
+			elapsed = time.perf_counter() - time_start
+			
+			if primitive in ("WriteRAM", "WriteROM"):
+				ok = data is not False
+			else:
+				ok = data == bench["reference"][offset:offset+step]
+			if not ok:
+				result["errors"] += 1
+				if reads or primitive == "ReadRAM_MBC7":
+					self.DEVICE.reset_input_buffer()
+					self.DEVICE.reset_output_buffer()
+			result["time"] += elapsed
+			result["bytes"] += step
+			result["command_times"].append(elapsed / commands)
+			offset += step
+		
+		self.READ_WINDOW = 1
+		(self.READ_WINDOW_MAX, self.READ_WINDOW_LIMIT) = (window_max, window_limit)
+		return result
+	
+	def BenchmarkFinish(self, bench):
+		# Puts back whatever the benchmark changed; returns False if save data couldn’t be restored
+		ok = True
+		if bench["primitive"] == "WriteRAM":
+			self.WriteRAM(0, bench["reference"])
+			ok = self.ReadRAM(0, bench["size"]) == bench["reference"]
+		elif bench["primitive"] == "WriteROM":
+			bench["flashcart"].Reset(full_reset=True)
+		if bench["mbc"] is not None:
+			if self.MODE == "DMG" and bench["primitive"] != "WriteROM": bench["mbc"].EnableRAM(enable=False)
+			self._set_fw_variable("DMG_ROM_BANK", 0)
+		if bench["primitive"] == "WriteROM": self.SetMode(self.MODE)
+		return ok
+	
 	def CheckROMStable(self):
 		if not self.IsConnected(): raise Exception("Couldn’t access the the device.")
 		buffer1 = self.ReadROM(0, 0xC0)
@@ -1185,11 +1750,9 @@ class GbxDevice:
 	
 	def AutoDetectFlash(self, limitVoltage=False):
 		flash_types = []
-		flash_type = 0
 		flash_id = None
 		flash_id_found = False
 		
-		supported_carts = list(self.SUPPORTED_CARTS[self.MODE].values())
 		if self.MODE == "DMG":
 			if limitVoltage:
 				self._write(self.DEVICE_CMD["SET_VOLTAGE_3_3V"])
@@ -1200,37 +1763,30 @@ class GbxDevice:
 		elif self.MODE == "DMG":
 			self._write(self.DEVICE_CMD["SET_MODE_AGB"])
 		
-		for f in range(2, len(supported_carts)):
-			flashcart_meta = supported_carts[f]
-			if flash_id is not None:
-				if ("flash_ids" not in flashcart_meta) or (flash_id not in flashcart_meta["flash_ids"]):
-					continue
-			dprint("*** Now checking: {:s}\n".format(flashcart_meta["names"][0]))
+		if self.MODE not in self.FLASH_PROBES: self.FLASH_PROBES[self.MODE] = self._index_flash_probes(self.MODE)
+		for probe in self.FLASH_PROBES[self.MODE]:
+			if flash_id is not None and tuple(flash_id) not in probe["flash_ids"]: continue
+			dprint("*** Now checking: {:s}\n".format(probe["meta"]["names"][0]))
 			
 			if self.MODE == "DMG":
-				#self._set_fw_variable("FLASH_COMMANDS_BANK_1", "flash_commands_on_bank_1" in flashcart_meta)
-				if flashcart_meta["write_pin"] == "WR":
-					we = 0x01 # FLASH_WE_PIN_WR
-				elif flashcart_meta["write_pin"] in ("AUDIO", "VIN"):
-					we = 0x02 # FLASH_WE_PIN_AUDIO
-				elif flashcart_meta["write_pin"] == "WR+RESET":
-					we = 0x03 # FLASH_WE_PIN_WR_RESET
-				self._set_fw_variable("FLASH_WE_PIN", we)
-
-			flashcart = Flashcart(config=flashcart_meta, cart_write_fncptr=self._cart_write, cart_read_fncptr=self.ReadROM)
+				self._set_fw_variable("FLASH_WE_PIN", probe["we"])
+			
+			flashcart = Flashcart(config=probe["meta"], cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM)
 			flashcart.Reset(full_reset=False)
 			flashcart.Unlock()
-			if "flash_ids" in flashcart_meta and len(flashcart_meta["flash_ids"]) > 0:
-				vfid = flashcart.VerifyFlashID()
-				if vfid is not False:
-					(verified, cart_flash_id) = flashcart.VerifyFlashID()
-					if verified and cart_flash_id in flashcart_meta["flash_ids"]:
-						flash_id = cart_flash_id
-						flash_id_found = True
-						flash_type = f
-						flash_types.append(flash_type)
-						flashcart.Reset(full_reset=False)
-						dprint("Found the correct cartridge type!")
+			vfid = flashcart.VerifyFlashID()
+			if vfid is False: continue
+			# Like before, only the second ID read counts; the first one may catch some bootleg chips before they settle
+			vfid = flashcart.VerifyFlashID()
+			cart_flash_id = vfid[1]
+			if tuple(cart_flash_id) in probe["flash_ids"]:
+				flash_id = cart_flash_id
+				flash_id_found = True
+				for f in probe["flash_ids"][tuple(cart_flash_id)]:
+					if f not in flash_types: flash_types.append(f)
+				flashcart.Reset(full_reset=False)
+				dprint("Found the correct cartridge type!")
+		flash_types.sort()
 		
 		# Check flash size
 		flash_type_id = 0
@@ -1267,7 +1823,47 @@ class GbxDevice:
 
 		return (flash_types, flash_type_id, flash_id, cfi_s, cfi)
 
-	def CheckFlashChip(self, limitVoltage=False, cart_type=None): # aka. the most horribly written function
+	def _flash_cfi_method(self, index, d_swap=None):
+		method = copy.deepcopy(self.FLASH_CFI_PROBES[index])
+		if d_swap is not None and d_swap != ( 0, 0 ):
+			for k in method.keys():
+				for c in range(0, len(method[k])):
+					if isinstance(method[k][c][1], int):
+						method[k][c][1] = bitswap(method[k][c][1], d_swap)
+		return method
+
+	def _flash_cfi_probe_order(self, we_pins):
+		# Command sets that matched known chips come first, the rest by how many flash cartridge handlers use them
+		hits = {}
+		for (_, entry) in Util.CFICache.Entries():
+			probe = entry["probe"]
+			if probe["mode"] != self.MODE: continue
+			hits[(probe["we"], probe["method_id"])] = hits.get((probe["we"], probe["method_id"]), 0) + 1
+		probes = [ (we, index) for we in we_pins for index in self.FLASH_CFI_PROBE_ORDER[self.MODE] ]
+		return sorted(probes, key=lambda p: -hits.get(p, 0))
+
+	def _set_flash_we_pin(self, we):
+		if self.MODE == "DMG" and we in self.FLASH_WE_PINS:
+			self._set_fw_variable("FLASH_WE_PIN", self.FLASH_WE_PINS[we])
+
+	def _read_cfi_flash_id(self, method):
+		self._cart_write_sequence(method['reset'] + method['read_identifier'])
+		flash_id = self.ReadROM(0, 64)
+		self._cart_write_sequence(method['reset'])
+		return flash_id
+
+	def _flash_id_line(self, we, method, flash_id):
+		if self.MODE == "DMG":
+			method_string = "[" + we.ljust(5) + "/{:4X}/{:2X}]".format(method['read_identifier'][0][0], method['read_identifier'][0][1])
+		else:
+			method_string = "[{:6X}/{:2X}]".format(method['read_identifier'][0][0], method['read_identifier'][0][1])
+		return [method_string, flash_id[0:8]]
+
+	def _cfi_cache_key(self, we, index, d_swap, flash_id):
+		# The whole identifier response is hashed, so extended device codes tell apart chips of the same family
+		return "{:s}/{:s}/{:d}/{:s}:{:s}".format(self.MODE, str(we), index, str(list(d_swap)), hashlib.sha1(flash_id).hexdigest())
+
+	def CheckFlashChip(self, limitVoltage=False, cart_type=None):
 		if self.FW["pcb_ver"] in (5, 6):
 			self._write(self.DEVICE_CMD["OFW_CART_MODE"])
 			self._read(1)
@@ -1275,19 +1871,6 @@ class GbxDevice:
 		
 		flashcart = None
 		flash_id_lines = []
-		flash_commands = [
-			{ 'read_cfi':[[0x555, 0x98]], 'read_identifier':[[ 0x555, 0xAA ], [ 0x2AA, 0x55 ], [ 0x555, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
-			{ 'read_cfi':[[0x5555, 0x98]], 'read_identifier':[[ 0x5555, 0xAA ], [ 0x2AAA, 0x55 ], [ 0x5555, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
-			{ 'read_cfi':[[0xAA, 0x98]], 'read_identifier':[[ 0xAAA, 0xAA ], [ 0x555, 0x55 ], [ 0xAAA, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
-			{ 'read_cfi':[[0xAAA, 0x98]], 'read_identifier':[[ 0xAAA, 0xAA ], [ 0x555, 0x55 ], [ 0xAAA, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
-			{ 'read_cfi':[[0xAAAA, 0x98]], 'read_identifier':[[ 0xAAAA, 0xAA ], [ 0x5555, 0x55 ], [ 0xAAAA, 0x90 ]], 'reset':[[ 0x0, 0xF0 ]] },
-			{ 'read_cfi':[[0x4555, 0x98]], 'read_identifier':[[ 0x4555, 0xAA ], [ 0x4AAA, 0x55 ], [ 0x4555, 0x90 ]], 'reset':[[ 0x4000, 0xF0 ]] },
-			{ 'read_cfi':[[0x7555, 0x98]], 'read_identifier':[[ 0x7555, 0xAA ], [ 0x7AAA, 0x55 ], [ 0x7555, 0x90 ]], 'reset':[[ 0x7000, 0xF0 ]] },
-			{ 'read_cfi':[[0x4AAA, 0x98]], 'read_identifier':[[ 0x4AAA, 0xAA ], [ 0x4555, 0x55 ], [ 0x4AAA, 0x90 ]], 'reset':[[ 0x4000, 0xF0 ]] },
-			{ 'read_cfi':[[0x7AAA, 0x98]], 'read_identifier':[[ 0x7AAA, 0xAA ], [ 0x7555, 0x55 ], [ 0x7AAA, 0x90 ]], 'reset':[[ 0x7000, 0xF0 ]] },
-			{ 'read_cfi':[[0, 0x98]], 'read_identifier':[[ 0, 0x90 ]], 'reset':[[ 0, 0xFF ]] },
-		]
-		
 		check_buffer = self.ReadROM(0, 0x400)
 		d_swap = None
 		cfi_info = ""
@@ -1309,27 +1892,35 @@ class GbxDevice:
 			rom_string = "[   ROM   ] " + rom_string
 			we_pins = [ None ]
 		
-		for we in we_pins:
-			if "method" in cfi: break
-			for method in flash_commands:
-				if self.MODE == "DMG":
-					#self._set_fw_variable("FLASH_COMMANDS_BANK_1", "flash_commands_on_bank_1" in flashcart_meta)
-					if we == "WR":
-						self._set_fw_variable("FLASH_WE_PIN", 0x01) # FLASH_WE_PIN_WR
-					elif we in ("AUDIO", "VIN"):
-						self._set_fw_variable("FLASH_WE_PIN", 0x02) # FLASH_WE_PIN_AUDIO
-					elif we == "WR+RESET":
-						self._set_fw_variable("FLASH_WE_PIN", 0x03) # FLASH_WE_PIN_WR_RESET
-				
-				for i in range(0, len(method['reset'])):
-					self._cart_write(method['reset'][i][0], method['reset'][i][1], flashcart=True)
-				for i in range(0, len(method['read_cfi'])):
-					self._cart_write(method['read_cfi'][i][0], method["read_cfi"][i][1], flashcart=True)
+		# Known chips only need one flash ID read with the command set they were detected with
+		tried = []
+		for (_, entry) in Util.CFICache.Entries():
+			probe = entry["probe"]
+			probe_id = (probe["mode"], probe["we"], probe["method_id"], tuple(probe["d_swap"]))
+			if probe["mode"] != self.MODE or probe["we"] not in we_pins or probe_id in tried: continue
+			tried.append(probe_id)
+			method = self._flash_cfi_method(probe["method_id"], tuple(probe["d_swap"]))
+			self._set_flash_we_pin(probe["we"])
+			flash_id = self._read_cfi_flash_id(method)
+			if flash_id == check_buffer[0:64]: continue
+			cached = Util.CFICache.Get(self._cfi_cache_key(probe["we"], probe["method_id"], tuple(probe["d_swap"]), flash_id))
+			if cached is None: continue
+			dprint("Using cached CFI data of flash ID {:s}".format(' '.join(format(x, '02X') for x in flash_id[0:8])))
+			cfi = cached["cfi"]
+			d_swap = tuple(probe["d_swap"])
+			flash_id_lines.append(self._flash_id_line(probe["we"], method, flash_id))
+			break
+		
+		if "method" not in cfi:
+			for (we, index) in self._flash_cfi_probe_order(we_pins):
+				method = self._flash_cfi_method(index)
+				self._set_flash_we_pin(we)
+				self._cart_write_sequence(method['reset'] + method['read_cfi'])
 				buffer = self.ReadROM(0, 0x400)
-				for i in range(0, len(method['reset'])):
-					self._cart_write(method['reset'][i][0], method['reset'][i][1], flashcart=True)
+				self._cart_write_sequence(method['reset'])
 				if buffer == check_buffer: continue
 				
+				d_swap = None
 				magic = "{:s}{:s}{:s}".format(chr(buffer[0x20]), chr(buffer[0x22]), chr(buffer[0x24]))
 				if magic == "QRY": # nothing swapped
 					d_swap = ( 0, 0 )
@@ -1338,7 +1929,7 @@ class GbxDevice:
 				if d_swap is not None:
 					for i in range(0, len(buffer)):
 						buffer[i] = bitswap(buffer[i], d_swap)
-
+				
 				cfi_parsed = ParseCFI(buffer)
 				try:
 					if d_swap is not None:
@@ -1350,6 +1941,7 @@ class GbxDevice:
 					pass
 				
 				if cfi_parsed != False:
+					if d_swap is None: d_swap = ( 0, 0 )
 					cfi = cfi_parsed
 					cfi["raw"] = buffer
 					if Util.DEBUG:
@@ -1360,57 +1952,30 @@ class GbxDevice:
 					for i in range(0, 0x400):
 						cfi["bytes"] += "{:02X}".format(buffer[i])
 					if self.MODE == "DMG": cfi["we"] = we
-					cfi["method_id"] = flash_commands.index(method)
-					
-					if d_swap is not None:
-						for k in method.keys():
-							for c in range(0, len(method[k])):
-								if isinstance(method[k][c][1], int):
-									method[k][c][1] = bitswap(method[k][c][1], d_swap)
+					cfi["method_id"] = index
+					method = self._flash_cfi_method(index, d_swap)
+					cfi["method"] = method
 					
 					# Flash ID
-					for i in range(0, len(method['read_identifier'])):
-						self._cart_write(method['read_identifier'][i][0], method["read_identifier"][i][1], flashcart=True)
-					flash_id = self.ReadROM(0, 64)[0:8]
-
-					if self.MODE == "DMG":
-						method_string = "[" + we.ljust(5) + "/{:4X}/{:2X}]".format(method['read_identifier'][0][0], method['read_identifier'][0][1])
-					else:
-						method_string = "[{:6X}/{:2X}]".format(method['read_identifier'][0][0], method['read_identifier'][0][1])
-					line_exists = False
-					for i in range(0, len(flash_id_lines)):
-						if method_string == flash_id_lines[i][0]: line_exists = True
-					if not line_exists: flash_id_lines.append([method_string, flash_id])
-					for i in range(0, len(method['reset'])):
-						self._cart_write(method['reset'][i][0], method['reset'][i][1], flashcart=True)
-					
-					cfi["method"] = method
-				else:
-					for j in range(0, 2):
-						if j == 1:
-							d_swap = ( 0, 1 )
-							for k in method.keys():
-								for c in range(0, len(method[k])):
-									if isinstance(method[k][c][1], int):
-										method[k][c][1] = bitswap(method[k][c][1], d_swap)
-						for i in range(0, len(method['read_identifier'])):
-							self._cart_write(method['read_identifier'][i][0], method["read_identifier"][i][1], flashcart=True)
-						flash_id = self.ReadROM(0, 64)[0:8]
-						if flash_id == check_buffer[:len(flash_id)]: continue
-
-						if self.MODE == "DMG":
-							method_string = "[" + we.ljust(5) + "/{:4X}/{:2X}]".format(method['read_identifier'][0][0], method['read_identifier'][0][1])
-						else:
-							method_string = "[{:6X}/{:2X}]".format(method['read_identifier'][0][0], method['read_identifier'][0][1])
-						line_exists = False
-						for i in range(0, len(flash_id_lines)):
-							if method_string == flash_id_lines[i][0]: line_exists = True
-						if not line_exists: flash_id_lines.append([method_string, flash_id])
-						for i in range(0, len(method['reset'])):
-							self._cart_write(method['reset'][i][0], method['reset'][i][1], flashcart=True)
-
+					flash_id = self._read_cfi_flash_id(method)
+					line = self._flash_id_line(we, method, flash_id)
+					if line[0] not in [ l[0] for l in flash_id_lines ]: flash_id_lines.append(line)
+					if flash_id != check_buffer[0:64]:
+						entry = { "probe":{ "mode":self.MODE, "we":we, "method_id":index, "d_swap":d_swap }, "cfi":cfi }
+						Util.CFICache.Store(self._cfi_cache_key(we, index, d_swap, flash_id), entry)
+					# Intel chips also answer the AMD style CFI query, but need their own reset command
+					self._cart_write_sequence(self._flash_cfi_method(9, d_swap)['reset'])
+					break
+				
+				for d in ( None, ( 0, 1 ) ):
+					method = self._flash_cfi_method(index, d)
+					flash_id = self._read_cfi_flash_id(method)
+					if flash_id[0:8] == check_buffer[0:8]: continue
+					line = self._flash_id_line(we, method, flash_id)
+					if line[0] not in [ l[0] for l in flash_id_lines ]: flash_id_lines.append(line)
+				
 				if cart_type is not None: # reset cartridge if method is known
-					flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_read_fncptr=self.ReadROM, progress_fncptr=None)
+					flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM, progress_fncptr=None)
 					flashcart.Reset(full_reset=False)
 		
 		if "method" in cfi:
@@ -1449,7 +2014,7 @@ class GbxDevice:
 				elif we == "WR+RESET":
 					self._set_fw_variable("FLASH_WE_PIN", 0x03) # FLASH_WE_PIN_WR_RESET
 				
-				for method in flash_commands:
+				for method in self.FLASH_CFI_PROBES:
 					for i in range(0, len(method['reset'])):
 						self._cart_write(method['reset'][i][0], method["reset"][i][1], flashcart=True)
 					for i in range(0, len(method['read_identifier'])):
@@ -1475,7 +2040,7 @@ class GbxDevice:
 			time.sleep(0.25)
 
 		if cart_type is not None: # reset cartridge if method is known
-			flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_read_fncptr=self.ReadROM, progress_fncptr=None)
+			flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM, progress_fncptr=None)
 			flashcart.Reset(full_reset=True)
 
 		flash_id = ""
@@ -1515,10 +2080,15 @@ class GbxDevice:
 	
 	#################################################################
 
+	def _set_file_digests(self, digest):
+		self.INFO["file_crc32"] = digest.GetCRC32()
+		self.INFO["file_sha1"] = digest.GetSHA1()
+		for name in digest.HASHES:
+			self.INFO["file_" + name] = digest.GetHash(name)
+	
 	def _BackupROM(self, args):
 		file = None
-		if len(args["path"]) > 0:
-			file = open(args["path"], "wb")
+		journal = None
 		
 		self.FAST_READ = args["fast_read_mode"]
 
@@ -1531,7 +2101,7 @@ class GbxDevice:
 				if i == args["cart_type"]:
 					try:
 						cart_type["_index"] = cart_type["names"].index(list(self.SUPPORTED_CARTS[self.MODE].keys())[i])
-						flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_read_fncptr=self.ReadROM, progress_fncptr=self.SetProgress)
+						flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM, progress_fncptr=self.SetProgress)
 					except:
 						pass
 
@@ -1573,9 +2143,29 @@ class GbxDevice:
 			self.SetProgress({"action":"INITIALIZE", "method":method, "size":size})
 			self.INFO["action"] = self.ACTIONS[method]
 		
-		buffer = bytearray(size)
+		pool = Util.BufferPool()
+		digest = None
+		if "verify_flash" not in args:
+			dmg_checksum = None
+			if self.MODE == "DMG": dmg_checksum = Util.DMGChecksum(offsets=_mbc.GetChecksumOffsets(size))
+			digest = Util.Digest(algorithms=args["digests"] if "digests" in args else None, dmg_checksum=dmg_checksum)
+		
+		# Chunks that made it to the file are journaled so that an interrupted dump can be resumed
+		resume_pos = 0
+		if len(args["path"]) > 0:
+			journal = Util.DumpJournal(args["path"], { "mode":self.MODE, "size":size, "rom_banks":rom_banks, "mbc":args["mbc"], "cart_type":args["cart_type"] })
+			if "resume" in args and args["resume"] is True:
+				self.NO_PROG_UPDATE = True
+				header = self.ReadROM(0, 0x180)
+				self.NO_PROG_UPDATE = False
+				resume_pos = journal.Resume(header=header, digest=digest)
+			file = Util.FileWriter(args["path"], size=size, offset=resume_pos, fsync=args["fsync"] if "fsync" in args else "never")
+			if resume_pos > 0: self.SetProgress({"action":"UPDATE_POS", "pos":resume_pos})
+			journal.Start()
 		max_length = self.MAX_BUFFER_LEN
 		if self.FAST_READ is True: max_length = 0x2000
+		tuner = Util.TransferTuner(self._transfer_tuner_key(), default=max_length, max_size=max_length)
+		max_length = tuner.Get()
 		pos_total = 0
 		start_address = 0
 		end_address = size
@@ -1605,58 +2195,87 @@ class GbxDevice:
 					self.CANCEL_ARGS = {}
 					self.SetProgress(cancel_args)
 					try:
-						if file is not None: file.close()
+						if file is not None: file.Close()
+						if journal is not None: journal.Close()
 					except:
 						pass
 					return
 				
+				if pos_total + buffer_len <= resume_pos:
+					pos_total += buffer_len
+					pos += buffer_len
+					continue
+				
+				# Chunks are read into reusable pool buffers which may be rounded up to a multiple of the transfer length
+				chunk = pool.Get(buffer_len + max_length)
+				view = memoryview(chunk)
+				time_start = time.time()
 				if (self.MODE == "AGB" and self.INFO["3d_memory"]):
-					temp = self.ReadROM_3DMemory(address=pos, length=buffer_len, max_length=max_length)
+					temp = self.ReadROM_3DMemory(address=pos, length=buffer_len, max_length=max_length, buffer=view, offset=0)
 				else:
-					temp = self.ReadROM(address=pos, length=buffer_len, skip_init=skip_init, max_length=max_length)
+					temp = self.ReadROM(address=pos, length=buffer_len, skip_init=skip_init, max_length=max_length, buffer=view, offset=0)
 					skip_init = True
 				
 				if len(temp) != buffer_len:
-					if (max_length >> 1) < 64:
-						dprint("Received 0x{:X} bytes instead of 0x{:X} bytes from the device at position 0x{:X}!".format(len(temp), buffer_len, pos_total))
-						max_length = 64
-					else:
-						dprint("Received 0x{:X} bytes instead of 0x{:X} bytes from the device at position 0x{:X}! Decreasing maximum transfer buffer length to 0x{:X}.".format(len(temp), buffer_len, pos_total, max_length >> 1))
-						max_length >>= 1
-						self.MAX_BUFFER_LEN = max_length
+					max_length = tuner.Report(False)
+					dprint("Received 0x{:X} bytes instead of 0x{:X} bytes from the device at position 0x{:X}! Continuing with a transfer buffer length of 0x{:X}.".format(len(temp), buffer_len, pos_total, max_length))
+					temp = None
+					view.release()
+					pool.Release(chunk)
 					skip_init = False
 					self.DEVICE.reset_input_buffer()
 					self.DEVICE.reset_output_buffer()
 					lives -= 1
 					if lives == 0:
+						if file is not None: file.Close()
+						if journal is not None: journal.Close()
 						self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"An error occured while reading from the cartridge. Please make sure that the cartridge contacts are clean, re-connect the device and try again from the beginning.", "abortable":False})
 						return False
 					continue
 				elif lives < 20:
 					lives = 20
+				length = tuner.Report(True, buffer_len, time.time() - time_start)
+				if length != max_length:
+					# The new transfer size has to be sent along with the next read
+					max_length = length
+					skip_init = False
 				
-				if file is not None: file.write(temp)
-				buffer[pos_total:pos_total+len(temp)] = temp
+				# The writer thread hands the chunk back to the pool once it's on disk
+				if file is not None: file.Write(temp, callback=lambda chunk=chunk: pool.Release(chunk))
+				if journal is not None: journal.Add(pos_total, temp)
+				if digest is not None: digest.Update(temp)
 				pos_total += len(temp)
 				
 				if "verify_flash" in args:
-					if pos_total >= len(args["verify_flash"]): break
-					check = args["verify_flash"][pos_total-len(temp):pos_total]
+					if pos_total >= len(args["verify_flash"]):
+						temp = None
+						view.release()
+						pool.Release(chunk)
+						break
+					chunk_start = pos_total - len(temp)
+					check = args["verify_flash"][chunk_start:pos_total]
 					if temp[:len(check)] != check:
-						for i in range(0, pos_total):
-							if (i < len(args["verify_flash"]) - 1) and (i < pos_total - 1) and args["verify_flash"][i] != buffer[i]:
+						# Earlier chunks already matched apart from the RTC area, so only this one needs to be searched
+						for i in range(chunk_start, pos_total):
+							if (i < len(args["verify_flash"]) - 1) and (i < pos_total - 1) and args["verify_flash"][i] != temp[i - chunk_start]:
 								if args["rtc_area"] is True and i in (0xC4, 0xC5, 0xC6, 0xC7, 0xC8, 0xC9):
 									dprint("Skipping RTC area at 0x{:X}".format(i))
 								else:
 									dprint("Mismatch during verification at 0x{:X}".format(i))
 									return i
 					else:
-						dprint("Verification successful between 0x{:X} and 0x{:X}".format(pos_total-len(temp), pos_total-1))
+						dprint("Verification successful between 0x{:X} and 0x{:X}".format(chunk_start, pos_total-1))
+				
+				temp = None
+				view.release()
+				if file is None: pool.Release(chunk)
 
 				self.SetProgress({"action":"UPDATE_POS", "pos":pos_total})
 				pos += buffer_len
 		
-		if file is not None: file.close()
+		if file is not None: file.Close()
+		if journal is not None: journal.Remove()
+		tuner.Save()
 		
 		if "verify_flash" in args:
 			return min(pos_total, len(args["verify_flash"]))
@@ -1671,14 +2290,17 @@ class GbxDevice:
 				file.close()
 		
 		# Calculate Global Checksum
+		digest.Pad(max(size, pos_total))
 		if self.MODE == "DMG":
-			chk = _mbc.CalcChecksum(buffer)
+			buffer = None
+			if _mbc.CHECKSUM_DATA_LENGTH > 0 and len(args["path"]) > 0:
+				with open(args["path"], "rb") as f: buffer = bytearray(f.read(_mbc.CHECKSUM_DATA_LENGTH))
+			chk = _mbc.CalcChecksum(buffer, digest=digest)
 		elif self.MODE == "AGB":
-			chk = zlib.crc32(buffer) & 0xFFFFFFFF
+			chk = digest.GetCRC32()
 		
 		self.INFO["rom_checksum_calc"] = chk
-		self.INFO["file_crc32"] = zlib.crc32(buffer) & 0xFFFFFFFF
-		self.INFO["file_sha1"] = hashlib.sha1(buffer).hexdigest()
+		self._set_file_digests(digest)
 		
 		# ↓↓↓ Switch to first ROM bank
 		if self.MODE == "DMG":
@@ -1697,6 +2319,67 @@ class GbxDevice:
 		self.SetProgress({"action":"FINISHED"})
 		return True
 
+	def _save_probe(self, args):
+		# Sets up save data access like _BackupRestoreRAM() does, but for sampled reads at arbitrary offsets
+		variables = []
+		select_bank = None
+		if self.MODE == "DMG":
+			_mbc = DMG_MBC().GetInstance(args=args, cart_write_fncptr=self._cart_write, cart_read_fncptr=self._cart_read, clk_toggle_fncptr=self._clk_toggle)
+			if _mbc.GetName() in ("MBC6", "MBC7", "TAMA5"): return None
+			self._write(self.DEVICE_CMD["SET_MODE_DMG"])
+			self._set_fw_variable("DMG_WRITE_CS_PULSE", 0)
+			self._set_fw_variable("DMG_READ_CS_PULSE", 0)
+			_mbc.EnableMapper()
+			_mbc.EnableRAM(enable=True)
+			save_size = args["save_type"]
+			bank_size = min(save_size, _mbc.GetRAMBankSize())
+			ram_banks = _mbc.GetRAMBanks(save_size)
+			command = self.DEVICE_CMD["DMG_CART_READ"]
+			variables = [("DMG_ACCESS_MODE", 3), ("DMG_READ_CS_PULSE", 1)] # MODE_RAM_READ
+			def select_bank(bank):
+				self._set_fw_variable("DMG_WRITE_CS_PULSE", 1 if _mbc.WriteWithCSPulse() else 0)
+				(start_address, _) = _mbc.SelectBankRAM(bank)
+				return 0xA000 + start_address
+
+		elif self.MODE == "AGB":
+			if args["save_type"] not in (1, 2, 3, 4, 5): return None
+			self._write(self.DEVICE_CMD["SET_MODE_AGB"])
+			self._write(self.DEVICE_CMD["SET_VOLTAGE_3_3V"])
+			save_size = Util.AGB_Header_Save_Sizes[args["save_type"]]
+			bank_size = min(save_size, 0x10000)
+			ram_banks = math.ceil(save_size / 0x10000)
+			if args["save_type"] in (1, 2): # EEPROM
+				command = bytearray([ self.DEVICE_CMD["AGB_CART_READ_EEPROM"], args["save_type"] ])
+			else:
+				command = self.DEVICE_CMD["AGB_CART_READ_SRAM"]
+				if ram_banks > 1:
+					def select_bank(bank):
+						dprint("Switching to SRAM bank {:d}".format(bank))
+						self._cart_write(0x1000000, bank)
+						time.sleep(0.1)
+						return 0
+
+		current = { "bank":None, "base":0 }
+		def read(offsets, length):
+			# Keeps reading from the currently selected bank before switching to the others
+			chunks = {}
+			banks = sorted({ o // bank_size for o in offsets }, key=lambda b: (b != current["bank"], b))
+			for bank in banks:
+				if bank != current["bank"]:
+					current["base"] = 0 if select_bank is None else select_bank(bank)
+					current["bank"] = bank
+				group = [ o for o in offsets if o // bank_size == bank ]
+				if self.MODE == "AGB" and args["save_type"] in (1, 2): # EEPROM is addressed in blocks of 8 bytes
+					addresses = [ (o % bank_size) // 8 for o in group ]
+				else:
+					addresses = [ current["base"] + o % bank_size for o in group ]
+				data = self._read_scattered(command, addresses, length, variables)
+				if data is False: return False
+				chunks.update(zip(group, data))
+			return [ chunks[o] for o in offsets ]
+
+		return Util.MemoryProbe(read, ram_banks * bank_size)
+
 	def _BackupRestoreRAM(self, args):
 		_mbc = DMG_MBC().GetInstance(args=args, cart_write_fncptr=self._cart_write, cart_read_fncptr=self._cart_read, clk_toggle_fncptr=self._clk_toggle)
 		self.FAST_READ = False
@@ -1704,6 +2387,7 @@ class GbxDevice:
 		
 		# Prepare some stuff
 		command = None
+		file = None
 		empty_data_byte = 0xFF
 		extra_size = 0
 		if self.MODE == "DMG":
@@ -1771,21 +2455,7 @@ class GbxDevice:
 					[ "PA", "PD" ]
 				]
 				self._set_fw_variable("FLASH_SHARP_VERIFY_SR", 1)
-				self._write(self.DEVICE_CMD["SET_FLASH_CMD"])
-				self._write(0x02) # FLASH_COMMAND_SET_INTEL
-				self._write(0x01) # FLASH_METHOD_UNBUFFERED
-				self._write(0x00) # unset
-				for i in range(0, 6):
-					if i > len(flash_cmds) - 1: # skip
-						self._write(bytearray(struct.pack(">I", 0)) + bytearray(struct.pack(">H", 0)))
-					else:
-						address = flash_cmds[i][0]
-						value = flash_cmds[i][1]
-						if not isinstance(address, int): address = 0
-						if not isinstance(value, int): value = 0
-						address >>= 1
-						dprint("Setting command #{:d} to 0x{:X}=0x{:X}".format(i, address, value))
-						self._write(bytearray(struct.pack(">I", address)) + bytearray(struct.pack(">H", value)))
+				self._set_flash_cmd(0x02, 0x01, 0x00, flash_cmds, shift=1) # FLASH_COMMAND_SET_INTEL, FLASH_METHOD_UNBUFFERED, unset
 				# ↑↑↑ Load commands into firmware
 			
 			commands = [ # save type commands
@@ -1806,6 +2476,9 @@ class GbxDevice:
 		if args["mode"] == 2: # Backup
 			action = "SAVE_READ"
 			buffer = bytearray()
+			digest = Util.Digest(algorithms=args["digests"] if "digests" in args else None)
+			if args["path"] is not None:
+				file = Util.FileWriter(args["path"], size=save_size+extra_size, fsync=args["fsync"] if "fsync" in args else "never", atomic=True)
 		elif args["mode"] == 3: # Restore
 			action = "SAVE_WRITE"
 			self.INFO["save_erase"] = args["erase"]
@@ -1882,6 +2555,7 @@ class GbxDevice:
 					cancel_args.update(self.CANCEL_ARGS)
 					self.CANCEL_ARGS = {}
 					self.SetProgress(cancel_args)
+					if file is not None: file.Abort()
 					return
 				
 				if args["mode"] == 2: # Backup
@@ -1910,6 +2584,8 @@ class GbxDevice:
 						continue
 					
 					buffer += temp
+					digest.Update(temp)
+					if file is not None: file.Write(temp)
 					self.SetProgress({"action":"UPDATE_POS", "pos":len(buffer)})
 				
 				elif args["mode"] == 3: # Restore
@@ -1940,17 +2616,14 @@ class GbxDevice:
 								[ sector_address << 12, 0x30 ]
 							]
 							self._cart_write_flash(cmds)
-							sr = 0
-							lives = 50
-							while True:
-								time.sleep(0.01)
+							def check():
 								sr = self._cart_read(sector_address << 12, agb_save_flash=True)
 								dprint("Data Check: 0x{:X} == 0xFFFF? {:s}".format(sr, str(sr == 0xFFFF)))
-								if sr == 0xFFFF: break
-								lives -= 1
-								if lives == 0:
-									self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"Accessing the save data flash chip failed. Please make sure you selected the correct save type. If you are using a reproduction cartridge, check if it really is equipped with a flash chip for save data, or if it uses SRAM for save data instead.", "abortable":False})
-									return False
+								return sr == 0xFFFF
+							poller = Util.StatusPoller(key="{:04X}/sector_erase".format(agb_flash_chip), timeout=1, max_interval=0.05)
+							if not poller.Wait(check):
+								self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"Accessing the save data flash chip failed. Please make sure you selected the correct save type. If you are using a reproduction cartridge, check if it really is equipped with a flash chip for save data, or if it uses SRAM for save data instead.", "abortable":False})
+								return False
 							self.WriteRAM(address=pos, buffer=buffer[buffer_offset:buffer_offset+buffer_len], command=command)
 					elif self.MODE == "AGB" and args["save_type"] == 8: # DACS
 						if (pos+0x1F00000) in (0x1F00000, 0x1F10000, 0x1F20000, 0x1F30000, 0x1F40000, 0x1F50000, 0x1F60000, 0x1F70000, 0x1F80000, 0x1F90000, 0x1FA0000, 0x1FB0000, 0x1FC0000, 0x1FD0000, 0x1FE0000, 0x1FF0000, 0x1FF2000, 0x1FF4000, 0x1FF6000, 0x1FF8000, 0x1FFA000):
@@ -1965,17 +2638,14 @@ class GbxDevice:
 							]
 							for c in cmds:
 								self._cart_write(c[0], c[1])
-							sr = 0
-							lives = 20
-							while True:
-								time.sleep(0.1)
+							def check():
 								sr = struct.unpack("<H", self._cart_read(sector_address, 2))[0]
 								dprint("Status Register Check: 0x{:X} == 0x80? {:s}".format(sr, str(sr & 0xE0 == 0x80)))
-								if sr & 0xE0 == 0x80: break
-								lives -= 1
-								if lives == 0:
-									self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"An error occured while writing to the cartridge. Please make sure that the cartridge contacts are clean, re-connect the device and try again from the beginning.", "abortable":False})
-									return False
+								return sr & 0xE0 == 0x80
+							poller = Util.StatusPoller(key="DACS/sector_erase", timeout=2, max_interval=0.1)
+							if not poller.Wait(check):
+								self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"An error occured while writing to the cartridge. Please make sure that the cartridge contacts are clean, re-connect the device and try again from the beginning.", "abortable":False})
+								return False
 						self.WriteROM(address=0x1F00000+pos, buffer=buffer[buffer_offset:buffer_offset+buffer_len])
 					else:
 						self.WriteRAM(address=pos, buffer=buffer[buffer_offset:buffer_offset+buffer_len], command=command)
@@ -1998,15 +2668,12 @@ class GbxDevice:
 				self.SetProgress({"action":"UPDATE_POS", "pos":len(buffer)+len(rtc_buffer)})
 			
 			if args["path"] is not None:
-				file = open(args["path"], "wb")
-				file.write(buffer)
 				if rtc_buffer is not None:
-					file.write(rtc_buffer)
-				file.close()
+					file.Write(rtc_buffer)
+				file.Close()
 			else:
 				self.INFO["data"] = buffer
-			self.INFO["file_crc32"] = zlib.crc32(buffer) & 0xFFFFFFFF
-			self.INFO["file_sha1"] = hashlib.sha1(buffer).hexdigest()
+			self._set_file_digests(digest)
 
 		elif args["mode"] == 3: # Restore
 			self.INFO["transferred"] = len(buffer)
@@ -2030,6 +2697,77 @@ class GbxDevice:
 		self.SetProgress({"action":"FINISHED"})
 		return True
 
+	def _load_flash_commands(self, flashcart):
+		flash_cmds = []
+		flash_buffer_size = flashcart.GetBufferSize()
+		command_set_type = flashcart.GetCommandSetType()
+		temp = 0
+		if command_set_type == "AMD":
+			temp = 0x01
+			#self._write(0x01) # FLASH_COMMAND_SET_AMD
+			#self._set_fw_variable("FLASH_SHARP_VERIFY_SR", 0)
+			dprint("Using AMD command set")
+		elif command_set_type == "INTEL":
+			temp = 0x02
+			#self._write(0x02) # FLASH_COMMAND_SET_INTEL
+			self._set_fw_variable("FLASH_SHARP_VERIFY_SR", 0)
+			dprint("Using Intel command set")
+		elif command_set_type == "SHARP":
+			temp = 0x02
+			#self._write(0x02) # FLASH_COMMAND_SET_INTEL
+			self._set_fw_variable("FLASH_SHARP_VERIFY_SR", 1)
+			dprint("Using Sharp/Intel command set")
+		elif command_set_type == "GBMEMORY":
+			temp = 0x00
+			dprint("Using GB Memory command set")
+		else:
+			self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"This cartridge type is currently not supported for ROM flashing.", "abortable":False})
+			return False
+		
+		if command_set_type == "GBMEMORY" and self.FW["pcb_ver"] not in (5, 6):
+			self._set_fw_variable("FLASH_WE_PIN", 0x01)
+			dprint("Using GB Memory mode on GBxCart RW v1.3")
+		else:
+			if flashcart.IsF2A():
+				method = 0x05 # FLASH_METHOD_AGB_FLASH2ADVANCE
+				flash_cmds = [
+					[ "SA", 0xE8 ],
+					[ "SA", "BS" ],
+					[ "PA", "PD" ],
+					[ "SA", 0xD0 ],
+					[ "SA", 0xFF ]
+				]
+				dprint("Using Flash2Advance mode with a buffer of {:d} bytes".format(flash_buffer_size))
+			elif command_set_type == "GBMEMORY" and self.FW["pcb_ver"] in (5, 6):
+				method = 0x03 # FLASH_METHOD_DMG_MMSA
+				dprint("Using GB Memory mode on GBxCart RW v1.4")
+			elif flashcart.SupportsBufferWrite() and flash_buffer_size > 0:
+				method = 0x02 # FLASH_METHOD_BUFFERED
+				flash_cmds = flashcart.GetCommands("buffer_write")
+				dprint("Using buffered writing with a buffer of {:d} bytes".format(flash_buffer_size))
+			elif flashcart.SupportsSingleWrite():
+				method = 0x01 # FLASH_METHOD_UNBUFFERED
+				flash_cmds = flashcart.GetCommands("single_write")
+				dprint("Using single writing")
+			else:
+				self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"This cartridge type is currently not supported for ROM flashing.", "abortable":False})
+				return False
+			
+			if flashcart.WEisWR():
+				we = 0x01 # FLASH_WE_PIN_WR
+				dprint("Using WR as WE")
+			elif flashcart.WEisAUDIO():
+				we = 0x02 # FLASH_WE_PIN_AUDIO
+				dprint("Using AUDIO as WE")
+			elif flashcart.WEisWR_RESET():
+				we = 0x03 # FLASH_WE_PIN_WR_RESET
+				dprint("Using WR+RESET as WE")
+			else:
+				we = 0x00 # unset
+			
+			self._set_flash_cmd(temp, method, we, flash_cmds, shift=1 if self.MODE == "AGB" else 0)
+		return command_set_type
+	
 	def _FlashROM(self, args):
 		self.FAST_READ = args["fast_read_mode"]
 		
@@ -2094,7 +2832,7 @@ class GbxDevice:
 					pass
 		
 		if cart_type["command_set"] == "GBMEMORY":
-			flashcart = Flashcart_DMG_MMSA(config=cart_type, cart_write_fncptr=self._cart_write, cart_read_fncptr=self.ReadROM, progress_fncptr=self.SetProgress)
+			flashcart = Flashcart_DMG_MMSA(config=cart_type, cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM, progress_fncptr=self.SetProgress, cancel_fncptr=lambda: self.CANCEL)
 			if "buffer_map" not in args:
 				try:
 					with open(os.path.splitext(args["path"])[0] + ".map", "rb") as file: args["buffer_map"] = file.read()
@@ -2108,7 +2846,7 @@ class GbxDevice:
 			data_map_import = bytearray(data_map_import)
 			dprint("Hidden sector data loaded")
 		else:
-			flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_read_fncptr=self.ReadROM, progress_fncptr=self.SetProgress)
+			flashcart = Flashcart(config=cart_type, cart_write_fncptr=self._cart_write, cart_write_sequence_fncptr=self._cart_write_sequence, cart_read_fncptr=self.ReadROM, progress_fncptr=self.SetProgress, cancel_fncptr=lambda: self.CANCEL)
 		
 		rumble = "rumble" in flashcart.CONFIG and flashcart.CONFIG["rumble"] is True
 
@@ -2153,86 +2891,8 @@ class GbxDevice:
 		# ↑↑↑ Flashcart configuration
 		
 		# ↓↓↓ Load commands into firmware
-		flash_cmds = []
-		command_set_type = flashcart.GetCommandSetType()
-		temp = 0
-		if command_set_type == "AMD":
-			temp = 0x01
-			#self._write(0x01) # FLASH_COMMAND_SET_AMD
-			#self._set_fw_variable("FLASH_SHARP_VERIFY_SR", 0)
-			dprint("Using AMD command set")
-		elif command_set_type == "INTEL":
-			temp = 0x02
-			#self._write(0x02) # FLASH_COMMAND_SET_INTEL
-			self._set_fw_variable("FLASH_SHARP_VERIFY_SR", 0)
-			dprint("Using Intel command set")
-		elif command_set_type == "SHARP":
-			temp = 0x02
-			#self._write(0x02) # FLASH_COMMAND_SET_INTEL
-			self._set_fw_variable("FLASH_SHARP_VERIFY_SR", 1)
-			dprint("Using Sharp/Intel command set")
-		elif command_set_type == "GBMEMORY":
-			temp = 0x00
-			dprint("Using GB Memory command set")
-		else:
-			self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"This cartridge type is currently not supported for ROM flashing.", "abortable":False})
-			return False
-		
-		if command_set_type == "GBMEMORY" and self.FW["pcb_ver"] not in (5, 6):
-			self._set_fw_variable("FLASH_WE_PIN", 0x01)
-			dprint("Using GB Memory mode on GBxCart RW v1.3")
-		else:
-			self._write(self.DEVICE_CMD["SET_FLASH_CMD"])
-			self._write(temp)
-
-			if flashcart.IsF2A():
-				self._write(0x05) # FLASH_METHOD_AGB_FLASH2ADVANCE
-				flash_cmds = [
-					[ "SA", 0xE8 ],
-					[ "SA", "BS" ],
-					[ "PA", "PD" ],
-					[ "SA", 0xD0 ],
-					[ "SA", 0xFF ]
-				]
-				dprint("Using Flash2Advance mode with a buffer of {:d} bytes".format(flash_buffer_size))
-			elif command_set_type == "GBMEMORY" and self.FW["pcb_ver"] in (5, 6):
-				self._write(0x03) # FLASH_METHOD_DMG_MMSA
-				dprint("Using GB Memory mode on GBxCart RW v1.4")
-			elif flashcart.SupportsBufferWrite() and flash_buffer_size > 0:
-				self._write(0x02) # FLASH_METHOD_BUFFERED
-				flash_cmds = flashcart.GetCommands("buffer_write")
-				dprint("Using buffered writing with a buffer of {:d} bytes".format(flash_buffer_size))
-			elif flashcart.SupportsSingleWrite():
-				self._write(0x01) # FLASH_METHOD_UNBUFFERED
-				flash_cmds = flashcart.GetCommands("single_write")
-				dprint("Using single writing")
-			else:
-				self.SetProgress({"action":"ABORT", "info_type":"msgbox_critical", "info_msg":"This cartridge type is currently not supported for ROM flashing.", "abortable":False})
-				return False
-			
-			if flashcart.WEisWR():
-				self._write(0x01) # FLASH_WE_PIN_WR
-				dprint("Using WR as WE")
-			elif flashcart.WEisAUDIO():
-				self._write(0x02) # FLASH_WE_PIN_AUDIO
-				dprint("Using AUDIO as WE")
-			elif flashcart.WEisWR_RESET():
-				self._write(0x03) # FLASH_WE_PIN_WR_RESET
-				dprint("Using WR+RESET as WE")
-			else:
-				self._write(0x00) # unset
-			
-			for i in range(0, 6):
-				if i > len(flash_cmds) - 1: # skip
-					self._write(bytearray(struct.pack(">I", 0)) + bytearray(struct.pack(">H", 0)))
-				else:
-					address = flash_cmds[i][0]
-					value = flash_cmds[i][1]
-					if not isinstance(address, int): address = 0
-					if not isinstance(value, int): value = 0
-					if self.MODE == "AGB": address >>= 1
-					dprint("Setting command #{:d} to 0x{:X}=0x{:X}".format(i, address, value))
-					self._write(bytearray(struct.pack(">I", address)) + bytearray(struct.pack(">H", value)))
+		command_set_type = self._load_flash_commands(flashcart)
+		if command_set_type is False: return False
 		# ↑↑↑ Load commands into firmware
 
 		# ↓↓↓ Unlock cartridge
@@ -2347,6 +3007,8 @@ class GbxDevice:
 						ret = flashcart.SectorErase(pos=pos, buffer_pos=buffer_pos)
 						if ret is False:
 							return False
+						elif ret is None:
+							continue # canceled while erasing
 						else:
 							sector_size = ret
 							dprint("Next sector size: 0x{:X}".format(sector_size))
@@ -2439,22 +3101,23 @@ class GbxDevice:
 
 	def TransferData(self, args, signal):
 		self.ERROR = False
-		if self.IsConnected():
-			if self.FW["pcb_ver"] in (5, 6):
-				self._write(self.DEVICE_CMD["OFW_CART_MODE"])
-				self._read(1)
-				self.CartPowerOn()
-			
-			ret = False
-			self.SIGNAL = signal
-			if args['mode'] == 1: ret = self._BackupROM(args)
-			elif args['mode'] == 2: ret = self._BackupRestoreRAM(args)
-			elif args['mode'] == 3: ret = self._BackupRestoreRAM(args)
-			elif args['mode'] == 4: ret = self._FlashROM(args)
-			
-			if self.FW["pcb_ver"] in (5, 6):
-				if ret is True:
-					self._write(self.DEVICE_CMD["OFW_DONE_LED_ON"])
-				elif self.ERROR is True:
-					self._write(self.DEVICE_CMD["OFW_ERROR_LED_ON"])
-			return True
+		with self.LOCK:
+			if self.IsConnected():
+				if self.FW["pcb_ver"] in (5, 6):
+					self._write(self.DEVICE_CMD["OFW_CART_MODE"])
+					self._read(1)
+					self.CartPowerOn()
+				
+				ret = False
+				self.SIGNAL = signal
+				if args['mode'] == 1: ret = self._BackupROM(args)
+				elif args['mode'] == 2: ret = self._BackupRestoreRAM(args)
+				elif args['mode'] == 3: ret = self._BackupRestoreRAM(args)
+				elif args['mode'] == 4: ret = self._FlashROM(args)
+				
+				if self.FW["pcb_ver"] in (5, 6):
+					if ret is True:
+						self._write(self.DEVICE_CMD["OFW_DONE_LED_ON"])
+					elif self.ERROR is True:
+						self._write(self.DEVICE_CMD["OFW_ERROR_LED_ON"])
+				return True